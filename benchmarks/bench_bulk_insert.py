@@ -0,0 +1,36 @@
+"""Compare BaseCrud.add_all (ORM unit of work) with BaseCrud.add_bulk (Core executemany)."""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.utils import create_database, timer
+from fastapi_template.app import crud
+from fastapi_template.app.schema.user_schema import UserCreateRequest
+
+
+async def main(count: int):
+    schemas = [UserCreateRequest(user_name=f"user_{i}", password="password") for i in range(count)]
+    folder = Path(tempfile.mkdtemp())
+
+    engine, session_factory = await create_database(folder / "add_all.db")
+    async with session_factory() as session:
+        with timer("add_all", count):
+            await crud.user.add_all(create_schemas=schemas, created_by=1, db_session=session)
+    await engine.dispose()
+
+    engine, session_factory = await create_database(folder / "add_bulk.db")
+    async with session_factory() as session:
+        with timer("add_bulk", count):
+            await crud.user.add_bulk(create_schemas=schemas, created_by=1, db_session=session)
+    await engine.dispose()
+
+    engine, session_factory = await create_database(folder / "add_bulk_ids.db")
+    async with session_factory() as session:
+        with timer("add_bulk(return_ids=True)", count):
+            await crud.user.add_bulk(create_schemas=schemas, created_by=1, return_ids=True, db_session=session)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
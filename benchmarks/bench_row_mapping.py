@@ -0,0 +1,39 @@
+"""Compare the row formats of BaseCrud.execute, per row mapping cost and the whole `/user/list` query."""
+import asyncio
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.utils import create_database, timer
+from fastapi_template.app import crud
+from fastapi_template.app.schema.base_schema import RowFormatEnum
+from fastapi_template.app.schema.user_schema import UserDetailResponse
+from fastapi_template.app.util.row_mapper import row_mapper
+
+COLUMNS = ("id", "user_name", "password", "nick_name", "avatar", "email", "last_login_time", "is_active")
+
+
+async def main(count: int):
+    now = datetime.now().isoformat()
+    rows = [(i, f"user_{i}", "password", f"nick_{i}", None, f"user_{i}@example.com", now, 1) for i in range(count)]
+    for row_format in RowFormatEnum:
+        mapper = row_mapper(COLUMNS, UserDetailResponse, row_format)
+        with timer(f"map {row_format.value}", count):
+            for row in rows:
+                mapper(row)
+
+    engine, session_factory = await create_database(Path(tempfile.mkdtemp()) / "row_mapping.db")
+    async with session_factory() as session:
+        await crud.user.add_bulk(create_schemas=[{"user_name": f"user_{i}", "password": "password"}
+                                                 for i in range(count)], db_session=session)
+        sql = "SELECT * FROM User WHERE (user_name like :name or nick_name like :name) and is_active=1"
+        for row_format in RowFormatEnum:
+            with timer(f"execute {row_format.value}", count):
+                await crud.user.execute(sql=sql, params={"name": "%user%", "page": 1, "size": count},
+                                        schema=UserDetailResponse, row_format=row_format, db_session=session)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
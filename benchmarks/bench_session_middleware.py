@@ -0,0 +1,70 @@
+"""Compare the per request cost of the pure ASGI SQLAlchemyMiddleware with the previous BaseHTTPMiddleware one."""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import text
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from benchmarks.utils import create_database, timer
+from fastapi_template.app.core.db import db
+from fastapi_template.app.core.db.session import SQLAlchemyMiddleware
+
+
+class BaseHTTPSessionMiddleware(BaseHTTPMiddleware):
+    """The previous middleware, a session opened for every request in a BaseHTTPMiddleware."""
+
+    async def dispatch(self, request, call_next):
+        async with db():
+            return await call_next(request)
+
+
+async def ping(request):
+    return PlainTextResponse("pong")
+
+
+async def query(request):
+    await db.session.execute(text("SELECT 1"))
+    return PlainTextResponse("pong")
+
+
+def create_app(middleware_class, engine) -> Starlette:
+    app = Starlette(routes=[Route("/ping", ping), Route("/query", query)])
+    # the session factory is installed by the ASGI middleware in both cases
+    app = SQLAlchemyMiddleware(app, custom_engine=engine)
+    return middleware_class(app.app) if middleware_class is BaseHTTPSessionMiddleware else app
+
+
+async def call(app, path: str):
+    scope = {"type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "headers": [], "http_version": "1.1", "scheme": "http", "server": ("test", 80), "root_path": ""}
+
+    messages = iter([{"type": "http.request", "body": b"", "more_body": False}])
+
+    async def receive():
+        return next(messages, {"type": "http.disconnect"})
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def main(count: int, concurrency: int = 100):
+    engine, _ = await create_database(Path(tempfile.mkdtemp()) / "middleware.db")
+    for name, middleware_class in (("BaseHTTPMiddleware", BaseHTTPSessionMiddleware),
+                                   ("pure ASGI, lazy session", SQLAlchemyMiddleware)):
+        app = create_app(middleware_class, engine)
+        for path in ("/ping", "/query"):
+            with timer(f"{name} {path}", count):
+                for _ in range(count // concurrency):
+                    await asyncio.gather(*(call(app, path) for _ in range(concurrency)))
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
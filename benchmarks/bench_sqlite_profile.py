@@ -0,0 +1,88 @@
+"""Mixed read/write throughput of several workers on one sqlite file, default engine against the sqlite profile."""
+import asyncio
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.utils import create_database
+from fastapi_template.app import crud
+from fastapi_template.app.core.db.session import create_session_factory
+from fastapi_template.app.core.db.sqlite import create_sqlite_engines
+
+ROWS = 1000
+# one write every WRITE_EVERY operations
+WRITE_EVERY = 5
+PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -20000, "mmap_size": 128 * 1024 * 1024,
+           "busy_timeout": 5000}
+
+
+async def run_worker(profile: bool, path: Path, ids: List[int], count: int, concurrency: int) -> Tuple[int, int]:
+    url = f"sqlite+aiosqlite:///{path}"
+    if profile:
+        engines = create_sqlite_engines(url, pragmas=PRAGMAS)
+        session_factory = create_session_factory(engines[0], [engines[1]], replica_lag=False)
+    else:
+        engines = (create_async_engine(url),)
+        session_factory = create_session_factory(engines[0])
+
+    async def operation(i: int):
+        async with session_factory() as session:
+            item_id = ids[i % len(ids)]
+            if i % WRITE_EVERY == 0:
+                await crud.role.update_by_id(item_id=item_id, update_schema={"description": str(i)}, direct=True,
+                                             db_session=session)
+            else:
+                await crud.role.get_by_id(item_id=item_id, db_session=session)
+
+    done, errors = 0, 0
+    for start in range(0, count, concurrency):
+        results = await asyncio.gather(*(operation(i) for i in range(start, min(start + concurrency, count))),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, OperationalError):
+                errors += 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                done += 1
+    for engine in engines:
+        await engine.dispose()
+    return done, errors
+
+
+def worker(profile: bool, path: Path, ids: List[int], count: int, concurrency: int) -> Tuple[int, int]:
+    return asyncio.run(run_worker(profile, path, ids, count, concurrency))
+
+
+async def prepare(path: Path) -> List[int]:
+    engine, session_factory = await create_database(path)
+    async with session_factory() as session:
+        ids = await crud.role.add_bulk(create_schemas=[{"name": f"role_{i}"} for i in range(ROWS)], return_ids=True,
+                                       db_session=session)
+    await engine.dispose()
+    return ids
+
+
+def main(count: int, workers: int = 4, concurrency: int = 20):
+    folder = Path(tempfile.mkdtemp())
+    for profile in (False, True):
+        path = folder / f"profile_{profile}.db"
+        ids = asyncio.run(prepare(path))
+        start = time.perf_counter()
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(worker, [profile] * workers, [path] * workers, [ids] * workers,
+                                        [count] * workers, [concurrency] * workers))
+        elapsed = time.perf_counter() - start
+        done, errors = sum(r[0] for r in results), sum(r[1] for r in results)
+        label = "sqlite profile" if profile else "default engine"
+        print(f"{label:<20} {workers} workers {done / elapsed:10.1f} ops/s, {errors} 'database is locked' errors")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,33 @@
+"""Shared helpers of the benchmark scripts, run them as modules e.g. `python -m benchmarks.bench_bulk_insert`."""
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Tuple
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from fastapi_template.app.model import (  # noqa: F401
+    file_model, menu_model, project_member_model, project_model, role_model, setting_model, user_model,
+    user_role_model,
+)
+from fastapi_template.app.model.base_model import Base
+
+
+async def create_database(path: Path, **engine_args) -> Tuple[AsyncEngine, sessionmaker]:
+    """Create a fresh sqlite database with all the tables, return its engine and session factory."""
+    path.unlink(missing_ok=True)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", **engine_args)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@contextmanager
+def timer(label: str, count: int = 0):
+    """Print the elapsed wall time of the block, and the per item cost when `count` is given."""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    per_item = f", {elapsed / count * 1e6:.2f} us/item" if count else ""
+    print(f"{label:<40} {elapsed * 1000:10.1f} ms{per_item}")
@@ -1,5 +1,6 @@
-from fastapi import UploadFile, File, Depends
+from fastapi import UploadFile, File, Depends, Query
 from starlette.requests import Request
+from starlette.responses import StreamingResponse
 
 from fastapi_template.app import service
 from fastapi_template.app.api import deps
@@ -7,8 +8,11 @@ from fastapi_template.app.api.deps import get_current_user
 from fastapi_template.app.core import Response, ResponseCode
 from fastapi_template.app.core.cvb import cbv
 from fastapi_template.app.core.inferring_router import InferringRouter
+from fastapi_template.app.schema.base_schema import ExportFormatEnum
 from fastapi_template.app.schema.file_schema import FileSearchRequest
 from fastapi_template.app.schema.user_schema import UserDetailResponse
+from fastapi_template.app.util.export import EXPORT_MEDIA_TYPES, export_headers
+from fastapi_template.config import roles
 
 router = InferringRouter()
 
@@ -35,4 +39,12 @@ class FileController:
     async def list_file(self, search: FileSearchRequest,
                         user: UserDetailResponse = Depends(get_current_user())) -> Response:
         files = await service.file.list_files(search)
-        return Response.ok(files)
+        return Response.ok(files, conditional=True)
+
+    @router.get("/export", tags=["file"])
+    async def export_file(self, export_format: ExportFormatEnum = Query(ExportFormatEnum.ndjson, alias="format"),
+                          user: UserDetailResponse = Depends(
+                              get_current_user([roles.SUPER_ADMIN_ROLE]))) -> StreamingResponse:
+        return StreamingResponse(service.file.export_files(export_format),
+                                 media_type=EXPORT_MEDIA_TYPES[export_format],
+                                 headers=export_headers("files", export_format))
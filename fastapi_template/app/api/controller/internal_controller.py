@@ -0,0 +1,33 @@
+from fastapi import Depends, Request
+from fastapi_cache import FastAPICache
+from starlette import status
+
+from fastapi_template.app.api.deps import get_current_user
+from fastapi_template.app.core import Response, ResponseCode
+from fastapi_template.app.core.cvb import cbv
+from fastapi_template.app.core.db import stats
+from fastapi_template.app.core.inferring_router import InferringRouter
+from fastapi_template.app.crud.base_crud import shared_query_cache
+from fastapi_template.app.schema.user_schema import UserDetailResponse
+from fastapi_template.config import roles
+
+router = InferringRouter()
+
+
+@cbv(router)
+class InternalController:
+
+    @router.get("/stats", tags=["internal"])
+    async def get_stats(self, user: UserDetailResponse = Depends(get_current_user([roles.SUPER_ADMIN_ROLE]))
+                        ) -> Response:
+        # the counters are per worker, the pid tells which one answered
+        return Response.ok({"database": stats.snapshot(), "cache": FastAPICache.get_backend().stats(),
+                            "query_cache": shared_query_cache.stats()})
+
+    @router.get("/ready", tags=["internal"])
+    async def get_ready(self, request: Request) -> Response:
+        # probe of the load balancer, the worker is ready once the startup warm-up is done
+        if not getattr(request.app.state, "ready", False):
+            return Response.fail(ResponseCode.SYSTEM_ERROR, message="warming up",
+                                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response.ok({"ready": True})
@@ -1,13 +1,15 @@
-from fastapi import Depends
+from fastapi import Depends, Query
+from starlette.responses import StreamingResponse
 
 from fastapi_template.app import service
 from fastapi_template.app.api.deps import get_current_user
 from fastapi_template.app.core import Response
 from fastapi_template.app.core.cvb import cbv
 from fastapi_template.app.core.inferring_router import InferringRouter
-from fastapi_template.app.schema.base_schema import IdRequest
+from fastapi_template.app.schema.base_schema import IdRequest, ExportFormatEnum
 from fastapi_template.app.schema.role_schema import RoleCreateRequest, RoleSearchRequest, RoleUpdateRequest
 from fastapi_template.app.schema.user_schema import UserDetailResponse
+from fastapi_template.app.util.export import EXPORT_MEDIA_TYPES, export_headers
 from fastapi_template.config import roles
 
 router = InferringRouter()
@@ -38,4 +40,12 @@ class RoleController:
     async def list_role(self, search_request: RoleSearchRequest,
                         user: UserDetailResponse = Depends(get_current_user([roles.SUPER_ADMIN_ROLE]))):
         data = await service.role.list_roles(search_request)
-        return Response.ok(data)
+        return Response.ok(data, conditional=True)
+
+    @router.get("/export", tags=["role"])
+    async def export_role(self, export_format: ExportFormatEnum = Query(ExportFormatEnum.ndjson, alias="format"),
+                          user: UserDetailResponse = Depends(
+                              get_current_user([roles.SUPER_ADMIN_ROLE]))) -> StreamingResponse:
+        return StreamingResponse(service.role.export_roles(export_format),
+                                 media_type=EXPORT_MEDIA_TYPES[export_format],
+                                 headers=export_headers("roles", export_format))
@@ -1,13 +1,16 @@
-from fastapi import Depends
+from fastapi import Depends, Query
+from starlette.responses import StreamingResponse
 
 from fastapi_template.app import service
 from fastapi_template.app.api.deps import get_current_user
 from fastapi_template.app.core import Response
 from fastapi_template.app.core.cvb import cbv
+from fastapi_template.app.core.etag import entity_etag
 from fastapi_template.app.core.inferring_router import InferringRouter
-from fastapi_template.app.schema.base_schema import IdRequest
+from fastapi_template.app.schema.base_schema import IdRequest, ExportFormatEnum
 from fastapi_template.app.schema.user_schema import UserDetailResponse, UserSearchRequest, UserCreateRequest, \
     UserUpdateRequest, UserRoleRequest
+from fastapi_template.app.util.export import EXPORT_MEDIA_TYPES, export_headers
 from fastapi_template.config import roles
 
 router = InferringRouter()
@@ -18,7 +21,8 @@ class UserController:
 
     @router.get("/detail", tags=["user"])
     async def get_user_detail(self, user: UserDetailResponse = Depends(get_current_user())) -> Response:
-        return Response.ok(user)
+        # the detail is the cached version of the user, tagged without rendering it
+        return Response.ok(user, etag=entity_etag(*user.dict().values()))
 
     @router.post("/add", tags=["user"])
     async def create_user(self, create_user: UserCreateRequest,
@@ -42,10 +46,18 @@ class UserController:
     async def list_user(self, user_request: UserSearchRequest,
                         user: UserDetailResponse = Depends(get_current_user([roles.SUPER_ADMIN_ROLE]))) -> Response:
         users = await service.user.get_users(user_request)
-        return Response.ok(users)
+        return Response.ok(users, conditional=True)
 
     @router.post("/role", tags=["user"])
     async def assign_role(self, user_role: UserRoleRequest,
                           user: UserDetailResponse = Depends(get_current_user([roles.SUPER_ADMIN_ROLE]))) -> Response:
         data = await service.user.assign_role(user_role, create_by=user.id)
         return Response.ok(data)
+
+    @router.get("/export", tags=["user"])
+    async def export_user(self, export_format: ExportFormatEnum = Query(ExportFormatEnum.ndjson, alias="format"),
+                          user: UserDetailResponse = Depends(
+                              get_current_user([roles.SUPER_ADMIN_ROLE]))) -> StreamingResponse:
+        return StreamingResponse(service.user.export_users(export_format),
+                                 media_type=EXPORT_MEDIA_TYPES[export_format],
+                                 headers=export_headers("users", export_format))
@@ -4,7 +4,8 @@ from fastapi_template.app.api.controller import (
     user_controller,
     file_controller,
     auth_controller,
-    role_controller
+    role_controller,
+    internal_controller,
 )
 
 api_router = APIRouter()
@@ -12,3 +13,4 @@ api_router.include_router(auth_controller.router, prefix="/auth")
 api_router.include_router(user_controller.router, prefix="/user")
 api_router.include_router(file_controller.router, prefix="/file")
 api_router.include_router(role_controller.router, prefix="/role")
+api_router.include_router(internal_controller.router, prefix="/internal")
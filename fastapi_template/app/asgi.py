@@ -1,17 +1,41 @@
 import os
+import socket
 import sys
+import time
 from pathlib import Path
 
 import uvicorn
 from fastapi import FastAPI
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends import Backend
 from loguru import logger
 from pydantic import BaseConfig
 
+from fastapi_template.app import crud
 from fastapi_template.app.core import Response
+from fastapi_template.app.core.cache import InvalidationBus, MemoryBackend, default_directory, hashed_key_builder
+from fastapi_template.app.core.db.warmup import warm_up
 from fastapi_template.app.middleware.middleware import GlobalMiddlewares
-from fastapi_template.config import settings
+from fastapi_template.config import redis, settings
+
+
+def create_cache_backend() -> Backend:
+    """The shared redis cache with a near cache in front with `USE_REDIS`, else the cache of the worker."""
+    if settings.USE_REDIS:
+        from fastapi_template.app.core.cache.redis_backend import RedisNearCacheBackend, create_redis_client
+
+        client = create_redis_client(redis.REDIS_HOST, redis.REDIS_PORT, username=redis.REDIS_USERNAME,
+                                     password=redis.REDIS_PASSWORD, db=redis.REDIS_DB,
+                                     socket_timeout=redis.REDIS_SOCKET_TIMEOUT)
+        near = MemoryBackend(max_entries=settings.CACHE_NEAR_MAX_ENTRIES, max_bytes=settings.CACHE_NEAR_MAX_BYTES,
+                             cleanup_seconds=settings.CACHE_CLEANUP_SECONDS)
+        return RedisNearCacheBackend(client, near, near_ttl=settings.CACHE_NEAR_TTL_SECONDS,
+                                     retry_seconds=settings.CACHE_REDIS_RETRY_SECONDS)
+    bus = None
+    if settings.CACHE_BUS_ENABLED and hasattr(socket, "AF_UNIX"):
+        bus = InvalidationBus(settings.CACHE_BUS_DIR or default_directory())
+    return MemoryBackend(max_entries=settings.CACHE_MAX_ENTRIES, max_bytes=settings.CACHE_MAX_BYTES,
+                         cleanup_seconds=settings.CACHE_CLEANUP_SECONDS, bus=bus)
 
 
 async def on_startup():
@@ -22,7 +46,15 @@ async def on_startup():
 
     """
     logger.debug("Execute FastAPI startup event handler.")
-    FastAPICache.init(InMemoryBackend(), prefix=settings.CACHE_PREFIX, expire=settings.CACHE_EXPIRED_SECONDS)
+    FastAPICache.init(create_cache_backend(), prefix=settings.CACHE_PREFIX, expire=settings.CACHE_EXPIRED_SECONDS,
+                      key_builder=hashed_key_builder)
+    # the worker only serves, and reports ready, once warmed up
+    start = time.perf_counter()
+    statements = [statement for crud_object in (crud.user, crud.role, crud.user_role, crud.file)
+                  for statement in crud_object.warm_up_statements()]
+    await warm_up(settings.DATABASE_WARM_UP_CONNECTIONS, statements)
+    app.state.ready = True
+    logger.info(f"Worker ready, warmed up in {(time.perf_counter() - start) * 1000:.1f} ms.")
 
 
 async def on_shutdown():
@@ -34,6 +66,7 @@ async def on_shutdown():
     """
     logger.debug("Execute FastAPI shutdown event handler.")
     # Gracefully close utilities.
+    await FastAPICache.get_backend().close()
 
 
 """
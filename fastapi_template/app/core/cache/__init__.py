@@ -0,0 +1,8 @@
+from fastapi_template.app.core.cache.bus import MASTER_PID_ENV, InvalidationBus, default_directory
+from fastapi_template.app.core.cache.decorator import cached
+from fastapi_template.app.core.cache.keys import hashed_key_builder, key_builder
+from fastapi_template.app.core.cache.memory import MemoryBackend
+from fastapi_template.app.core.cache.tags import invalidate_tags
+
+__all__ = ("MASTER_PID_ENV", "InvalidationBus", "MemoryBackend", "cached", "default_directory", "hashed_key_builder",
+           "invalidate_tags", "key_builder")
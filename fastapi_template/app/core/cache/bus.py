@@ -0,0 +1,117 @@
+# Invalidation of the in-process caches across the workers of one gunicorn master.
+# Every worker binds a unix datagram socket in a directory shared by the workers, a delete is sent to all of them.
+import asyncio
+import os
+import socket
+import tempfile
+from typing import Callable, Dict, Optional
+
+import orjson
+from loguru import logger
+
+__all__ = ('InvalidationBus', 'default_directory', 'MASTER_PID_ENV')
+
+_MAX_MESSAGE_SIZE = 64 * 1024
+
+# the pid of the gunicorn master, set by its `on_starting` hook and inherited by the workers it forks
+MASTER_PID_ENV = "FASTAPI_TEMPLATE_MASTER_PID"
+
+
+def default_directory(master_pid: Optional[int] = None) -> str:
+    """
+    The directory of the sockets of the workers forked by the master. The master is the one named
+    in the environment, without one this process is alone on its bus, the parent of a process started
+    by another manager may be a shell or an init shared with unrelated processes
+    :param master_pid:
+    :return:
+    """
+    master_pid = master_pid or os.environ.get(MASTER_PID_ENV) or os.getpid()
+    return os.path.join(tempfile.gettempdir(), f"fastapi_template_cache_bus_{master_pid}")
+
+
+class InvalidationBus:
+    """
+    Broadcast of the cache deletes between the worker processes of one host, no external service involved.
+    A message is one datagram, it is either delivered whole or not at all, and a worker receives it
+    as soon as its event loop is free, which is well within milliseconds.
+    The sockets of the dead workers are removed by the first sender who finds them refusing.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._socket: Optional[socket.socket] = None
+        self._on_invalidate: Optional[Callable[[Optional[str], Optional[str]], object]] = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    def start(self, on_invalidate: Callable[[Optional[str], Optional[str]], object]):
+        """
+        Bind the socket of this worker and apply the deletes of the others with `on_invalidate(namespace, key)`
+        :param on_invalidate:
+        :return:
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            # left by a dead worker with the same pid
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._socket = sock
+        self._on_invalidate = on_invalidate
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._receive)
+
+    def publish(self, namespace: Optional[str] = None, key: Optional[str] = None):
+        """Send a delete to the other workers, it is not applied to this one."""
+        if self._socket is None:
+            return
+        message = orjson.dumps({"namespace": namespace, "key": key})
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self._socket.sendto(message, path)
+                self.published += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # nobody listens any more
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # the receiver is too far behind, its entry lives until it expires
+                self.dropped += 1
+                logger.warning(f"cache invalidation dropped, the worker socket {path} is full")
+
+    def _receive(self):
+        while True:
+            try:
+                data = self._socket.recv(_MAX_MESSAGE_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                message = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                continue
+            self.received += 1
+            self._on_invalidate(message.get("namespace"), message.get("key"))
+
+    def close(self):
+        if self._socket is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        except RuntimeError:
+            pass
+        self._socket.close()
+        self._socket = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"published": self.published, "received": self.received, "dropped": self.dropped}
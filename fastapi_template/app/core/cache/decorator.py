@@ -0,0 +1,136 @@
+# Cache decorator of the service functions, on the fastapi-cache backend, coder and key builder.
+import asyncio
+import time
+from contextlib import nullcontext
+from functools import wraps
+from typing import Any, AsyncContextManager, Callable, Dict, Optional, Sequence, Set, Tuple
+
+from fastapi_cache import FastAPICache
+from loguru import logger
+
+from fastapi_template.app.core.cache.keys import bind_arguments
+from fastapi_template.app.core.cache.tags import tag_versions
+
+__all__ = ('cached',)
+
+
+def _pack(encoded: str, fresh_until: float) -> str:
+    # the entry outlives its freshness by the stale window, the deadline travels with it for the other workers
+    return f"{fresh_until:.3f}\n{encoded}"
+
+
+def _unpack(data) -> Optional[Tuple[float, str]]:
+    if isinstance(data, bytes):
+        data = data.decode()
+    head, _, encoded = data.partition("\n")
+    try:
+        return float(head), encoded
+    except ValueError:
+        # written by another format, a miss
+        return None
+
+
+def cached(namespace: str = "",
+           expire: Optional[int] = None,
+           key_builder: Optional[Callable] = None,
+           stale_seconds: int = 0,
+           refresh_scope: Optional[Callable[[], AsyncContextManager]] = None,
+           tags: Sequence[str] = ()):
+    """
+    Cache the result of an async function, like `fastapi_cache.decorator.cache` for the functions outside the
+    endpoints, with the concurrent misses of a key coalesced: one call computes it in the worker, the others
+    await its result instead of computing it again.
+    With `stale_seconds` an expired result is still returned for that long, while one background task
+    recomputes it, in the `refresh_scope` e.g. `db` as the request session is gone by then.
+    The results carry the `tags`, formatted with the arguments e.g. `user:{user_id}`, `invalidate_tags`
+    drops all the results carrying one of them, of every cached function
+    :param namespace:
+    :param expire: seconds the result is fresh, the `FastAPICache` expire by default
+    :param key_builder: the fastapi-cache key builder, the `FastAPICache` one by default
+    :param stale_seconds:
+    :param refresh_scope:
+    :param tags:
+    :return:
+    """
+
+    def wrapper(func):
+        # the computations in flight in this worker, by key, resolving to the encoded result
+        inflight: Dict[str, asyncio.Future] = {}
+        refreshes: Set[asyncio.Task] = set()
+
+        async def compute(key: str, args, kwargs) -> Tuple[Any, str]:
+            coder = FastAPICache.get_coder()
+            fresh = expire or FastAPICache.get_expire()
+            ret = await func(*args, **kwargs)
+            encoded = coder.encode(ret)
+            await FastAPICache.get_backend().set(key, _pack(encoded, time.time() + fresh), fresh + stale_seconds)
+            return ret, encoded
+
+        async def refresh(key: str, future: asyncio.Future, args, kwargs):
+            try:
+                async with (refresh_scope() if refresh_scope else nullcontext()):
+                    _, encoded = await compute(key, args, kwargs)
+                future.set_result(encoded)
+            except Exception as e:
+                logger.warning(f"refresh of the cache key {key} failed: {e!r}")
+                future.set_exception(e)
+                # retrieved, nobody may be waiting for it
+                future.exception()
+            finally:
+                if inflight.get(key) is future:
+                    del inflight[key]
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            if not FastAPICache.get_enable():
+                return await func(*args, **kwargs)
+            coder = FastAPICache.get_coder()
+            builder = key_builder or FastAPICache.get_key_builder()
+            key = builder(func, namespace, request=None, response=None, args=args, kwargs=kwargs)
+            if tags:
+                arguments = bind_arguments(func, args, kwargs)
+                versions = await tag_versions([tag.format(**arguments) for tag in tags])
+                # a tag invalidated since, another key
+                key = f"{key}:{'.'.join(versions)}"
+            loop = asyncio.get_running_loop()
+            while True:
+                data = await FastAPICache.get_backend().get(key)
+                entry = _unpack(data) if data is not None else None
+                if entry is not None:
+                    fresh_until, encoded = entry
+                    if fresh_until <= time.time() and key not in inflight:
+                        future = inflight[key] = loop.create_future()
+                        task = loop.create_task(refresh(key, future, args, kwargs))
+                        refreshes.add(task)
+                        task.add_done_callback(refreshes.discard)
+                    return coder.decode(encoded)
+                future = inflight.get(key)
+                if future is None:
+                    break
+                try:
+                    return coder.decode(await asyncio.shield(future))
+                except asyncio.CancelledError:
+                    if not future.cancelled():
+                        raise
+                    # the caller computing it was cancelled, one of the waiting ones takes over
+
+            future = inflight[key] = loop.create_future()
+            try:
+                ret, encoded = await compute(key, args, kwargs)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                future.exception()
+                raise
+            else:
+                future.set_result(encoded)
+                return ret
+            finally:
+                if inflight.get(key) is future:
+                    del inflight[key]
+
+        return inner
+
+    return wrapper
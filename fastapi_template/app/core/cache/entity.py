@@ -0,0 +1,143 @@
+# Read-through cache of the rows of a model by primary key, on the FastAPICache backend.
+import asyncio
+from typing import Any, Dict, Generic, Iterable, List, Optional, Set, Type, TypeVar
+
+import orjson
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends import Backend
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+from fastapi_template.app.core.db.session import in_unit_of_work
+
+ModelType = TypeVar("ModelType")
+
+__all__ = ('EntityCache',)
+
+# session.info key: the entity caches written by the uncommitted unit of work -> the written ids, None for all
+_WRITTEN_KEY = "entity_cache_written"
+_evictions: Set[asyncio.Task] = set()
+
+
+def _backend() -> Optional[Backend]:
+    # no caching before the application startup initialises the cache
+    return FastAPICache._backend
+
+
+class EntityCache(Generic[ModelType]):
+    """
+    The column values of the rows of one model, by id, shared by the workers through the cache backend.
+    The hits are merged into the session without a query, the rows already in the session are used as they are,
+    the cache misses the rows written through the cruds, those are fetched again.
+    A session writing inside a unit of work does not fill the cache until it commits, and the ids it wrote
+    are dropped again after the commit, a concurrent reader may have cached the previous row meanwhile.
+    """
+
+    def __init__(self, model: Type[ModelType], expire: int):
+        self.model = model
+        self.expire = expire
+        self.namespace = f"entity:{model.__tablename__}:"
+        self._columns = [attr.key for attr in inspect(model).column_attrs]
+        try:
+            self._id_type = model.id.type.python_type
+        except NotImplementedError:
+            self._id_type = None
+
+    def _coerce(self, item_id: Any) -> Any:
+        # the ids of the requests are often strings
+        if self._id_type is None or isinstance(item_id, self._id_type):
+            return item_id
+        try:
+            return self._id_type(item_id)
+        except (TypeError, ValueError):
+            return item_id
+
+    def _key(self, item_id: Any) -> str:
+        return f"{self.namespace}{self._coerce(item_id)}"
+
+    async def get_many(self, session: AsyncSession, item_ids: List[Any]) -> List[Optional[ModelType]]:
+        """
+        Get the cached rows of the ids, None for the misses
+        :param session:
+        :param item_ids:
+        :return:
+        """
+        backend = _backend()
+        if backend is None:
+            return [None] * len(item_ids)
+        values = await backend.get_many([self._key(item_id) for item_id in item_ids])
+        items: List[Optional[ModelType]] = []
+        for item_id, value in zip(item_ids, values):
+            if value is None:
+                items.append(None)
+                continue
+            item = session.sync_session.identity_map.get(identity_key(self.model, self._coerce(item_id)))
+            if item is None or inspect(item).expired_attributes:
+                # not in the session, or rolled back
+                item = self.model(**orjson.loads(value))
+                make_transient_to_detached(item)
+                item = await session.merge(item, load=False)
+            items.append(item)
+        return items
+
+    async def set_many(self, session: AsyncSession, items: Iterable[ModelType]):
+        """Cache the rows loaded by the session, unless it holds uncommitted writes."""
+        backend = _backend()
+        if backend is None or session.info.get(_WRITTEN_KEY):
+            return
+        for item in items:
+            values = inspect(item).dict
+            if any(column not in values for column in self._columns):
+                # expired attributes, the row is not fully known
+                continue
+            row = {column: values[column] for column in self._columns}
+            await backend.set(self._key(item.id), orjson.dumps(row, default=str).decode(), self.expire)
+
+    async def evict(self, session: AsyncSession, item_ids: Optional[Iterable[Any]] = None):
+        """
+        Drop the rows of the ids, or all the rows of the model when the ids are unknown
+        :param session: the session of the write
+        :param item_ids:
+        :return:
+        """
+        item_ids = None if item_ids is None else list(item_ids)
+        if in_unit_of_work(session):
+            written: Dict[EntityCache, Optional[Set[Any]]] = session.info.setdefault(_WRITTEN_KEY, {})
+            if item_ids is None or (self in written and written[self] is None):
+                written[self] = None
+            else:
+                written.setdefault(self, set()).update(item_ids)
+        await self._evict(item_ids)
+
+    async def _evict(self, item_ids: Optional[List[Any]]):
+        backend = _backend()
+        if backend is None:
+            return
+        if item_ids is None:
+            await backend.clear(namespace=self.namespace)
+            return
+        for item_id in item_ids:
+            await backend.clear(key=self._key(item_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_committed(session: Session):
+    written = session.info.pop(_WRITTEN_KEY, None)
+    if not written:
+        return
+
+    async def evict():
+        for entity_cache, item_ids in written.items():
+            await entity_cache._evict(None if item_ids is None else list(item_ids))
+
+    task = asyncio.get_running_loop().create_task(evict())
+    _evictions.add(task)
+    task.add_done_callback(_evictions.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_written(session: Session):
+    # nothing was cached by the session meanwhile
+    session.info.pop(_WRITTEN_KEY, None)
@@ -0,0 +1,80 @@
+# Cache keys of the function results: the function identity and a hash of its normalized arguments.
+import hashlib
+import inspect
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+import orjson
+from fastapi_cache import FastAPICache
+from pydantic import BaseModel
+
+__all__ = ('key_builder', 'hashed_key_builder', 'bind_arguments')
+
+# the receivers of the methods are not part of the keys
+_RECEIVERS = ("self", "cls")
+
+
+def bind_arguments(func: Callable, args: Tuple = (), kwargs: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    The arguments of the call by parameter name, with the defaults,
+    so the positional and the keyword calls get the same key
+    :param func:
+    :param args:
+    :param kwargs:
+    :return:
+    """
+    bound = inspect.signature(func).bind_partial(*args, **(kwargs or {}))
+    bound.apply_defaults()
+    return {name: value for name, value in bound.arguments.items() if name not in _RECEIVERS}
+
+
+def _normalize(value: Any) -> Any:
+    # the ids of the requests are often strings, 1 and "1" are the same key
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, Enum):
+        return _normalize(value.value)
+    if isinstance(value, (str, int, float, Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return _normalize(value.dict())
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted((_normalize(item) for item in value), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    raise TypeError(f"{type(value).__name__} arguments can not be part of a cache key, leave them out of it")
+
+
+def key_builder(*params: str) -> Callable:
+    """
+    A fastapi-cache key builder keyed on the named parameters of the function only, all of them by default.
+    The keys are `{prefix}:{namespace}:{module}.{function}:{hash}` whatever the arguments, the hash is
+    stable across the workers and the restarts
+    :param params: the parameters telling the results apart, the others only help computing them
+    :return:
+    """
+
+    def build(func: Callable,
+              namespace: str = "",
+              request: Any = None,
+              response: Any = None,
+              args: Tuple = (),
+              kwargs: Optional[Dict] = None) -> str:
+        arguments = bind_arguments(func, args, kwargs)
+        if params:
+            arguments = {name: arguments.get(name) for name in params}
+        digest = hashlib.blake2b(orjson.dumps(_normalize(arguments), option=orjson.OPT_SORT_KEYS),
+                                 digest_size=12).hexdigest()
+        return f"{FastAPICache.get_prefix()}:{namespace}:{func.__module__}.{func.__qualname__}:{digest}"
+
+    return build
+
+
+hashed_key_builder = key_builder()
@@ -0,0 +1,154 @@
+# Bounded in-process backend of fastapi-cache, the state is per worker.
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from fastapi_cache.backends import Backend
+
+from fastapi_template.app.core.cache.bus import InvalidationBus
+
+__all__ = ('MemoryBackend',)
+
+
+@dataclass
+class _Entry:
+    data: Union[str, bytes]
+    # monotonic deadline, None never expires
+    expire_at: Optional[float]
+    size: int
+
+
+class MemoryBackend(Backend):
+    """
+    LRU cache bounded by a number of entries and by the bytes of the keys and values,
+    the least recently used entries are evicted first when a bound is reached.
+    The expired entries are dropped when read, and swept every `cleanup_seconds` so the unread ones go too.
+    With a `bus` the clears are applied to the caches of the other workers as well.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, cleanup_seconds: float = 60,
+                 bus: Optional[InvalidationBus] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cleanup_seconds = cleanup_seconds
+        self._store: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bus = bus
+        if bus is not None:
+            bus.start(self.clear_local)
+
+    def _get(self, key: str) -> Optional[_Entry]:
+        entry = self._store.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expire_at is not None and entry.expire_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._store.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[str]]:
+        entry = self._get(key)
+        if entry is None:
+            return 0, None
+        ttl = -1 if entry.expire_at is None else int(entry.expire_at - time.monotonic())
+        return ttl, entry.data
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._get(key)
+        return entry.data if entry else None
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: Union[str, bytes], expire: int = None):
+        size = len(key) + (len(value.encode()) if isinstance(value, str) else len(value))
+        self._remove(key)
+        if size > self.max_bytes:
+            # would evict everything else and still not fit
+            return
+        expire_at = time.monotonic() + expire if expire else None
+        self._store[key] = _Entry(value, expire_at, size)
+        self._bytes += size
+        while len(self._store) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._store)))
+            self.evictions += 1
+        self._start_sweeper()
+
+    async def clear(self, namespace: str = None, key: str = None) -> int:
+        """
+        Remove the keys starting with the namespace, or the key, or every key when neither is given,
+        in this worker and in the other workers on the bus
+        :param namespace:
+        :param key:
+        :return: the number of keys removed in this worker
+        """
+        if self.bus is not None:
+            self.bus.publish(namespace, key)
+        return self.clear_local(namespace, key)
+
+    def clear_local(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            keys = [k for k in self._store if k.startswith(namespace)]
+        elif key:
+            keys = [key] if key in self._store else []
+        else:
+            keys = list(self._store)
+        for k in keys:
+            self._remove(k)
+        return len(keys)
+
+    def _remove(self, key: str):
+        entry = self._store.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def sweep(self) -> int:
+        """Remove the expired entries, return how many."""
+        now = time.monotonic()
+        expired = [k for k, entry in self._store.items() if entry.expire_at is not None and entry.expire_at <= now]
+        for k in expired:
+            self._remove(k)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def _start_sweeper(self):
+        if self._sweeper is None and self.cleanup_seconds > 0:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_periodically())
+
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(self.cleanup_seconds)
+            self.sweep()
+
+    async def close(self):
+        """Stop the periodic sweep and leave the bus."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self.bus is not None:
+            self.bus.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._store),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
@@ -0,0 +1,146 @@
+# Cache of the query results of the worker, tagged with the tables the queries read.
+import pickle
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import FrozenResult, Result
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, loading
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import ClauseElement, TextClause
+from sqlalchemy.sql.util import find_tables
+
+from fastapi_template.app.core.cache.tags import has_uncommitted_tags, invalidate_tags, tag_versions
+from fastapi_template.app.core.db.routing import is_write
+
+__all__ = ('QueryCache', 'table_tag', 'invalidate_tables', 'statement_key')
+
+# the tables of a raw sql statement
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+# session.info key: the transaction flushed changes of the instances, e.g. the autoflush of a query
+_FLUSHED_KEY = "query_cache_flushed"
+
+
+def table_tag(table_name: str) -> str:
+    # the raw sql may spell the table in any case
+    return f"table:{table_name.lower()}"
+
+
+async def invalidate_tables(table_names: List[str], session: Optional[AsyncSession] = None):
+    """Drop the cached results of the queries reading the tables, in every worker."""
+    await invalidate_tags([table_tag(name) for name in table_names], session)
+
+
+def _hashable(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def statement_key(statement: ClauseElement, params: Optional[Dict] = None) -> Optional[Hashable]:
+    """
+    A hashable key of the statement and the values of its parameters, the expanding IN lists included
+    :param statement:
+    :param params: the parameters given to the execution
+    :return: None for a construct SQLAlchemy can not cache
+    """
+    cache_key = statement._generate_cache_key()
+    if cache_key is None:
+        return None
+    bound = tuple(_hashable(bind.effective_value) for bind in cache_key.bindparams)
+    return cache_key.key, bound, _hashable(params or {})
+
+
+def _has_changes(session: AsyncSession) -> bool:
+    # the hits are merged without autoflush, they would overwrite the pending changes, and miss the flushed ones
+    return bool(session.new or session.dirty or session.deleted or session.info.get(_FLUSHED_KEY))
+
+
+@event.listens_for(Session, "after_flush")
+def _flushed(session: Session, flush_context):
+    session.info[_FLUSHED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_flushed(session: Session):
+    session.info.pop(_FLUSHED_KEY, None)
+
+
+class QueryCache:
+    """
+    LRU of the results of the statements, keyed by the SQLAlchemy cache key of the statement, the values of its
+    bound parameters and the versions of the tables it reads. A write through BaseCrud drops the version of its
+    table, the results reading it are not reached anymore and age out of the LRU.
+    The results are kept as detached snapshots, the hits of ORM statements are merged into the session.
+    The writes not going through BaseCrud are only seen after `expire` seconds.
+    A session with pending or flushed uncommitted changes always executes.
+    """
+
+    def __init__(self, max_entries: int = 512, expire: float = 60):
+        self.max_entries = max_entries
+        self.expire = expire
+        self._results: "OrderedDict[Hashable, Tuple[float, FrozenResult]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def tables(statement: ClauseElement) -> List[str]:
+        """The names of the tables read by the statement."""
+        if isinstance(statement, TextClause):
+            names = _TABLE_PATTERN.findall(statement.text)
+        else:
+            names = [table.name for table in find_tables(statement, include_crud=True)]
+        return sorted(set(names))
+
+    async def execute(self,
+                      session: AsyncSession,
+                      statement: ClauseElement,
+                      params: Optional[Dict] = None) -> Result:
+        """
+        Execute the statement, or replay its cached result
+        :param session:
+        :param statement:
+        :param params:
+        :return:
+        """
+        tables = [] if is_write(statement) else self.tables(statement)
+        key = statement_key(statement, params) if tables else None
+        versions = await tag_versions([table_tag(name) for name in tables]) if key is not None else None
+        if versions is None or has_uncommitted_tags(session) or _has_changes(session):
+            # a write, not cacheable, no cache yet, or the session reads its own uncommitted changes
+            return await session.execute(statement, params)
+        key = (key, tuple(versions))
+        cached = self._results.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._results.move_to_end(key)
+            self.hits += 1
+            return await self._replay(session, statement, cached[1])
+        self.misses += 1
+        frozen = (await session.execute(statement, params)).freeze()
+        # a snapshot, the instances of the result stay in the session and may change
+        self._results[key] = (time.monotonic() + self.expire, pickle.loads(pickle.dumps(frozen)))
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+        return frozen()
+
+    @staticmethod
+    async def _replay(session: AsyncSession, statement: ClauseElement, frozen: FrozenResult) -> Result:
+        if isinstance(statement, Select) and statement._propagate_attrs.get("compile_state_plugin") == "orm":
+            merged = await session.run_sync(
+                lambda sync_session: loading.merge_frozen_result(sync_session, statement, frozen, load=False))
+            return merged()
+        return frozen()
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._results), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,163 @@
+# Redis shared cache with a near cache in every worker, the redis dependency is only needed with `USE_REDIS`.
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from fastapi_cache.backends import Backend
+from loguru import logger
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from fastapi_template.app.core.cache.memory import MemoryBackend
+
+__all__ = ('RedisNearCacheBackend', 'create_redis_client')
+
+_INVALIDATE_CHANNEL = "cache:invalidate"
+
+
+def create_redis_client(host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                        db: int = 0, socket_timeout: float = 0.5) -> aioredis.Redis:
+    # a short timeout, an unreachable redis degrades to the near cache instead of stalling the requests
+    return aioredis.Redis(host=host, port=port, username=username, password=password, db=db,
+                          socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout,
+                          decode_responses=True)
+
+
+class RedisNearCacheBackend(Backend):
+    """
+    Two tier cache: redis shared by all the workers of all the nodes, and a small in-process near cache
+    in front of it holding the entries for at most `near_ttl` seconds.
+    The clears are published on a redis channel, every worker drops them from its near cache.
+    When redis fails the backend serves from the near cache alone and retries redis after `retry_seconds`.
+    """
+
+    def __init__(self, client: aioredis.Redis, near: MemoryBackend, near_ttl: float = 5, retry_seconds: float = 30,
+                 channel: str = _INVALIDATE_CHANNEL):
+        self.client = client
+        self.near = near
+        self.near_ttl = near_ttl
+        self.retry_seconds = retry_seconds
+        self.channel = channel
+        self._down_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _failed(self, e: Exception):
+        self.errors += 1
+        if self.available:
+            logger.warning(f"redis cache unavailable for {self.retry_seconds}s, serving the near cache only: {e!r}")
+        self._down_until = time.monotonic() + self.retry_seconds
+
+    def _near_expire(self, ttl: Optional[int]) -> float:
+        # redis ttl: -1 without expiry, -2 for a missing key
+        return self.near_ttl if ttl is None or ttl < 0 else min(self.near_ttl, ttl)
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[str]]:
+        (ttl, value), = await self._get_many_with_ttl([key])
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[str]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """
+        Get the values of the keys, None for the missing ones, the near cache misses are fetched in one round trip
+        :param keys:
+        :return:
+        """
+        return [value for _, value in await self._get_many_with_ttl(keys)]
+
+    async def _get_many_with_ttl(self, keys: List[str]) -> List[Tuple[int, Optional[str]]]:
+        found = [await self.near.get_with_ttl(key) for key in keys]
+        missing = [i for i, (_, value) in enumerate(found) if value is None]
+        if not missing or not self.available:
+            return found
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for i in missing:
+                    pipe.get(keys[i])
+                    pipe.ttl(keys[i])
+                results = await pipe.execute()
+        except (RedisError, OSError) as e:
+            self._failed(e)
+            return found
+        for n, i in enumerate(missing):
+            value, ttl = results[2 * n], results[2 * n + 1]
+            if value is None:
+                self.misses += 1
+                continue
+            self.hits += 1
+            await self.near.set(keys[i], value, self._near_expire(ttl))
+            found[i] = (ttl, value)
+        return found
+
+    async def set(self, key: str, value: Union[str, bytes], expire: int = None):
+        await self.near.set(key, value, self._near_expire(expire))
+        if not self.available:
+            return
+        try:
+            await self.client.set(key, value, ex=expire or None)
+        except (RedisError, OSError) as e:
+            self._failed(e)
+
+    async def clear(self, namespace: str = None, key: str = None) -> int:
+        """
+        Remove the keys starting with the namespace, or the key, from redis and from the near caches of every worker,
+        everything when neither is given: the cache owns its redis db, see `REDIS_DB`
+        :param namespace:
+        :param key:
+        :return: the number of keys removed from redis
+        """
+        count = self.near.clear_local(namespace, key)
+        if not self.available:
+            return count
+        try:
+            if namespace:
+                count = 0
+                async for found in self.client.scan_iter(match=f"{namespace}*", count=500):
+                    count += await self.client.unlink(found)
+            elif key:
+                count = await self.client.unlink(key)
+            else:
+                count = await self.client.flushdb()
+            await self.client.publish(self.channel, f"{namespace or ''}\n{key or ''}")
+        except (RedisError, OSError) as e:
+            self._failed(e)
+        return count
+
+    async def _listen(self):
+        while True:
+            if not self.available:
+                await asyncio.sleep(self._down_until - time.monotonic())
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is None:
+                            continue
+                        namespace, _, key = message["data"].partition("\n")
+                        self.near.clear_local(namespace or None, key or None)
+            except (RedisError, OSError) as e:
+                # the near entries may have missed clears, they expire within `near_ttl`
+                self._failed(e)
+
+    async def close(self):
+        self._listener.cancel()
+        await self.near.close()
+        await self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "redis_available": self.available,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "near": self.near.stats(),
+        }
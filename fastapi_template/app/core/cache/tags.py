@@ -0,0 +1,79 @@
+# Versions of the cache tags: the entries are keyed with the versions of their tags,
+# dropping the version of a tag makes all its entries unreachable, in every worker.
+import asyncio
+from typing import Iterable, List, Optional, Set
+from uuid import uuid4
+
+from fastapi_cache import FastAPICache
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from fastapi_template.app.core.db.session import in_unit_of_work
+
+__all__ = ('tag_versions', 'invalidate_tags', 'has_uncommitted_tags')
+
+_TAG_NAMESPACE = "tag:"
+# session.info key: the tags invalidated by the uncommitted unit of work
+_WRITTEN_TAGS_KEY = "cache_tags_written"
+_invalidations: Set[asyncio.Task] = set()
+
+
+async def tag_versions(tags: List[str]) -> Optional[List[str]]:
+    """
+    The current versions of the tags, a new version for the tags without one
+    :param tags:
+    :return: None before the application startup initialises the cache
+    """
+    backend = FastAPICache._backend
+    if backend is None:
+        return None
+    keys = [f"{_TAG_NAMESPACE}{tag}" for tag in tags]
+    versions = await backend.get_many(keys)
+    for i, version in enumerate(versions):
+        if version is None:
+            versions[i] = uuid4().hex[:12]
+            await backend.set(keys[i], versions[i])
+    return versions
+
+
+async def invalidate_tags(tags: Iterable[str], session: Optional[AsyncSession] = None):
+    """
+    Drop the entries of the tags, again after the commit when the session is in a unit of work:
+    the readers may have cached the rows written meanwhile
+    :param tags:
+    :param session: the session of the write
+    :return:
+    """
+    tags = list(tags)
+    if session is not None and in_unit_of_work(session):
+        session.info.setdefault(_WRITTEN_TAGS_KEY, set()).update(tags)
+    await _clear(tags)
+
+
+def has_uncommitted_tags(session: AsyncSession) -> bool:
+    """Whether the session invalidated tags it has not committed yet, its reads must not be cached."""
+    return bool(session.info.get(_WRITTEN_TAGS_KEY))
+
+
+async def _clear(tags: Iterable[str]):
+    backend = FastAPICache._backend
+    if backend is None:
+        return
+    for tag in tags:
+        await backend.clear(key=f"{_TAG_NAMESPACE}{tag}")
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session):
+    tags = session.info.pop(_WRITTEN_TAGS_KEY, None)
+    if not tags:
+        return
+    task = asyncio.get_running_loop().create_task(_clear(tags))
+    _invalidations.add(task)
+    task.add_done_callback(_invalidations.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_written(session: Session):
+    session.info.pop(_WRITTEN_TAGS_KEY, None)
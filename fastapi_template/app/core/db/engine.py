@@ -0,0 +1,62 @@
+# Create the engines of the application from the settings: the primary and the read engines, instrumented.
+from typing import List, Optional, Tuple, Type
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+from fastapi_template.app.core.db.sqlite import create_sqlite_engines, is_sqlite_file
+from fastapi_template.app.core.db.stats import instrument_engine, timed_pool_class
+from fastapi_template.config import settings
+
+__all__ = ('create_engines',)
+
+
+def _pool_class(name: str, url: str, pool_class: Optional[Type[Pool]] = None) -> Optional[Type[Pool]]:
+    # the pools time their checkouts for the stats
+    if not settings.DATABASE_STATS_ENABLED:
+        return pool_class
+    return timed_pool_class(name, url, pool_class)
+
+
+def create_engines() -> Tuple[AsyncEngine, List[AsyncEngine]]:
+    """
+    Create the primary engine of SQLALCHEMY_DATABASE_URI and the engines the reads are routed to:
+    the read pool of the sqlite profile and the SQLALCHEMY_REPLICA_URIS
+    :return: the primary engine and the read engines
+    """
+    engine_args = {
+        "echo": False,
+        "pool_pre_ping": True,
+    }
+    if make_url(settings.SQLALCHEMY_DATABASE_URI).get_backend_name() != "sqlite":
+        # sqlite files use a NullPool by default, or the pools of the sqlite profile
+        engine_args.update(pool_size=settings.DATABASE_ENGINE_POOL_SIZE,
+                           max_overflow=settings.DATABASE_ENGINE_MAX_OVERFLOW)
+    url = settings.SQLALCHEMY_DATABASE_URI
+    readers = []
+    if settings.DATABASE_SQLITE_PROFILE and is_sqlite_file(url):
+        primary, reader = create_sqlite_engines(url,
+                                                read_pool_size=settings.DATABASE_SQLITE_READ_POOL_SIZE,
+                                                pragmas={
+                                                    "journal_mode": "WAL",
+                                                    "synchronous": settings.DATABASE_SQLITE_SYNCHRONOUS,
+                                                    "cache_size": settings.DATABASE_SQLITE_CACHE_SIZE,
+                                                    "mmap_size": settings.DATABASE_SQLITE_MMAP_SIZE,
+                                                    "busy_timeout": settings.DATABASE_SQLITE_BUSY_TIMEOUT,
+                                                },
+                                                writer_pool_class=_pool_class("primary", url, AsyncAdaptedQueuePool),
+                                                reader_pool_class=_pool_class("reader_0", url, AsyncAdaptedQueuePool),
+                                                **engine_args)
+        readers.append(reader)
+    else:
+        primary = create_async_engine(url, poolclass=_pool_class("primary", url), **engine_args)
+    for replica_url in settings.SQLALCHEMY_REPLICA_URIS:
+        readers.append(create_async_engine(replica_url, poolclass=_pool_class(f"reader_{len(readers)}", replica_url),
+                                           **engine_args))
+
+    if settings.DATABASE_STATS_ENABLED:
+        instrument_engine(primary, "primary", slow_query_seconds=settings.DATABASE_SLOW_QUERY_SECONDS)
+        for index, reader in enumerate(readers):
+            instrument_engine(reader, f"reader_{index}", slow_query_seconds=settings.DATABASE_SLOW_QUERY_SECONDS)
+    return primary, readers
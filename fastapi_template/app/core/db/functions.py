@@ -0,0 +1,40 @@
+from sqlalchemy import String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+
+class group_concat(FunctionElement):
+    """
+    The values of a group joined into one string, NULL for an empty group
+
+    select(User.id, group_concat(Role.name, ",")).group_by(User.id)
+    """
+    type = String()
+    name = "group_concat"
+    inherit_cache = True
+    # the separator is rendered inline, it is a part of the statement cache key
+    _traverse_internals = FunctionElement._traverse_internals + [("separator", InternalTraversal.dp_string)]
+
+    def __init__(self, column, separator: str = ","):
+        self.separator = separator
+        super().__init__(column)
+
+
+@compiles(group_concat)
+def _compile_group_concat(element, compiler, **kw):
+    # sqlite
+    return "group_concat(%s, %s)" % (compiler.process(element.clauses, **kw),
+                                     compiler.render_literal_value(element.separator, String()))
+
+
+@compiles(group_concat, "mysql")
+def _compile_group_concat_mysql(element, compiler, **kw):
+    return "GROUP_CONCAT(%s SEPARATOR %s)" % (compiler.process(element.clauses, **kw),
+                                              compiler.render_literal_value(element.separator, String()))
+
+
+@compiles(group_concat, "postgresql")
+def _compile_group_concat_postgresql(element, compiler, **kw):
+    return "string_agg(%s, %s)" % (compiler.process(element.clauses, **kw),
+                                   compiler.render_literal_value(element.separator, String()))
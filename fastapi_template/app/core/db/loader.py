@@ -0,0 +1,113 @@
+# Request scoped batching of the primary key loads, the state lives in the `info` of the request session.
+import asyncio
+from typing import Any, Dict, Generic, Hashable, Iterable, List, Optional, Type, TypeVar
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+ModelType = TypeVar("ModelType")
+
+__all__ = ('BatchLoader',)
+
+_LOADERS_KEY = "batch_loaders"
+
+
+class BatchLoader(Generic[ModelType]):
+    """
+    DataLoader of one model on one session.
+    The ids asked in the same event loop tick are fetched by a single `IN (...)` query,
+    and every loaded row, found or not, is memoized until the session writes it or rolls back.
+    """
+
+    def __init__(self, session: AsyncSession, model: Type[ModelType]):
+        self.session = session
+        self.model = model
+        self._loaded: Dict[Hashable, Optional[ModelType]] = {}
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._batch: Optional[asyncio.Task] = None
+        try:
+            self._id_type = model.id.type.python_type
+        except NotImplementedError:
+            self._id_type = None
+
+    @classmethod
+    def of(cls, session: AsyncSession, model: Type[ModelType]) -> "BatchLoader[ModelType]":
+        """Get the loader of the model on the session, created on first use."""
+        loaders = session.info.setdefault(_LOADERS_KEY, {})
+        loader = loaders.get(model)
+        if loader is None:
+            loader = loaders[model] = cls(session, model)
+        return loader
+
+    @classmethod
+    def invalidate(cls, session: AsyncSession, model: Type[ModelType], item_ids: Optional[Iterable[Any]] = None):
+        """Forget the loaded rows of the ids, or all the rows of the model when the ids are unknown."""
+        loader = session.info.get(_LOADERS_KEY, {}).get(model)
+        if loader is None:
+            return
+        if item_ids is None:
+            loader._loaded.clear()
+            return
+        for item_id in item_ids:
+            loader._loaded.pop(loader._key(item_id), None)
+
+    def prime(self, item: ModelType):
+        """Memoize a row loaded by another query, the next loads of its id do not fetch it again."""
+        self._loaded[self._key(item.id)] = item
+
+    async def load(self, item_id: Any) -> Optional[ModelType]:
+        return (await self.load_many([item_id]))[0]
+
+    async def load_many(self, item_ids: Iterable[Any]) -> List[Optional[ModelType]]:
+        """
+        Get the rows of the ids in order, None for the ids not found
+        :param item_ids:
+        :return:
+        """
+        keys = [self._key(item_id) for item_id in item_ids]
+        futures = {}
+        for key in keys:
+            if key in self._loaded or key in futures:
+                continue
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = asyncio.get_running_loop().create_future()
+                if self._batch is None:
+                    # starts once the coroutines of the current tick have queued their ids
+                    self._batch = asyncio.create_task(self._fetch())
+            futures[key] = future
+        if futures:
+            await asyncio.gather(*futures.values())
+        return [futures[key].result() if key in futures else self._loaded[key] for key in keys]
+
+    async def _fetch(self):
+        batch, self._pending, self._batch = self._pending, {}, None
+        try:
+            # the rows written since they were loaded are refreshed in the identity map
+            query = select(self.model).where(self.model.id.in_(list(batch))).execution_options(populate_existing=True)
+            response = await self.session.execute(query)
+            found = {item.id: item for item in response.scalars().all()}
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            self._loaded[key] = found.get(key)
+            if not future.done():
+                future.set_result(self._loaded[key])
+
+    def _key(self, item_id: Any) -> Hashable:
+        if self._id_type is None or isinstance(item_id, self._id_type):
+            return item_id
+        try:
+            return self._id_type(item_id)
+        except (TypeError, ValueError):
+            return item_id
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_loaded(session: Session):
+    # the rolled back rows are expired, they can not be handed out anymore
+    session.info.pop(_LOADERS_KEY, None)
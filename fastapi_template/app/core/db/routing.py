@@ -0,0 +1,104 @@
+# Route the statements of a session between the primary engine and the read replicas.
+import itertools
+import re
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+__all__ = ('ReplicaRouter', 'RoutingSession', 'is_write', 'pin_primary', 'ROUND_ROBIN', 'LEAST_BUSY')
+
+ROUND_ROBIN = "round_robin"
+LEAST_BUSY = "least_busy"
+
+_PIN_KEY = "pin_primary"
+# the pin of a write when the replicas do not lag, released at the end of the transaction
+_TRANSACTION_PIN_KEY = "pin_primary_transaction"
+# the raw sql sent to the replicas, anything else may write
+_READ_SQL = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+def is_write(clause: Any) -> bool:
+    """Whether the statement may write, the raw sql unless it starts with SELECT or WITH."""
+    if isinstance(clause, TextClause):
+        return not _READ_SQL.match(clause.text)
+    return getattr(clause, "is_dml", False)
+
+
+class ReplicaRouter:
+    """Pick the replica engine of the next read, round-robin or the one with the fewest connections in use."""
+
+    def __init__(self,
+                 replicas: List[AsyncEngine],
+                 strategy: str = ROUND_ROBIN,
+                 read_your_writes: bool = True,
+                 replica_lag: bool = True):
+        if strategy not in (ROUND_ROBIN, LEAST_BUSY):
+            raise ValueError(f"unknown replica strategy: {strategy}")
+        self.engines = replicas
+        self.replicas: List[Engine] = [replica.sync_engine for replica in replicas]
+        self.strategy = strategy
+        self.read_your_writes = read_your_writes
+        self.replica_lag = replica_lag
+        self._turn = itertools.count()
+        self.in_use: Dict[Engine, int] = {replica: 0 for replica in self.replicas}
+        if strategy == LEAST_BUSY:
+            for replica in self.replicas:
+                self._track(replica)
+
+    def read_engine(self) -> Engine:
+        start = next(self._turn) % len(self.replicas)
+        if self.strategy == ROUND_ROBIN:
+            return self.replicas[start]
+        # the ties go round-robin too
+        rotated = self.replicas[start:] + self.replicas[:start]
+        return min(rotated, key=self.in_use.__getitem__)
+
+    def _track(self, replica: Engine):
+        def checkout(*args):
+            self.in_use[replica] += 1
+
+        def checkin(*args):
+            self.in_use[replica] -= 1
+
+        event.listen(replica, "checkout", checkout)
+        event.listen(replica, "checkin", checkin)
+
+
+class RoutingSession(Session):
+    """
+    Session sending the reads to the replicas of the router and the writes to its own bind, the primary.
+    With `read_your_writes` the first write pins the session on the primary, see `pin_primary`,
+    only until the end of its transaction when the replicas do not lag, e.g. the sqlite reader of the same file:
+    the primary connection goes back to the pool with the commit
+    """
+
+    def __init__(self, *args, router: Optional[ReplicaRouter] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        pinned = self.info.get(_PIN_KEY) or self.info.get(_TRANSACTION_PIN_KEY)
+        if self.router is None or not self.router.replicas or pinned:
+            return primary
+        writes = self._flushing or is_write(clause)
+        if writes or getattr(clause, "_for_update_arg", None) is not None:
+            if writes and self.router.read_your_writes:
+                self.info[_PIN_KEY if self.router.replica_lag else _TRANSACTION_PIN_KEY] = True
+            return primary
+        return self.router.read_engine()
+
+
+@event.listens_for(RoutingSession, "after_commit")
+@event.listens_for(RoutingSession, "after_rollback")
+def _unpin_transaction(session: RoutingSession):
+    session.info.pop(_TRANSACTION_PIN_KEY, None)
+
+
+def pin_primary(session: AsyncSession):
+    """Send all the next statements of the session to the primary, e.g. to read what was just written elsewhere."""
+    session.info[_PIN_KEY] = True
@@ -1,16 +1,20 @@
-from asyncio import current_task
+from contextlib import asynccontextmanager
 from contextvars import ContextVar
-from typing import Optional, Union, Dict
+from typing import AsyncIterator, Optional, Union, Dict, List
 
 from sqlalchemy.engine import URL, Engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_scoped_session
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.requests import Request
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from fastapi_template.app.core.db.routing import ReplicaRouter, RoutingSession, ROUND_ROBIN
 
 _Session: Optional[sessionmaker] = None
-_session: ContextVar[Optional[AsyncSession]] = ContextVar("_session", default=None)
+# the session of the current context, or the lazy `DBSession` scope opening it on first use
+_session: ContextVar[Optional[Union[AsyncSession, "DBSession"]]] = ContextVar("_session", default=None)
+# session.info keys: the depth of the units of work the session is in, and whether the unit must roll back
+_UNIT_OF_WORK_KEY = "unit_of_work"
+_ROLLBACK_ONLY_KEY = "rollback_only"
 
 
 class MissingSessionError(Exception):
@@ -41,7 +45,51 @@ class SessionNotInitialisedError(Exception):
         super().__init__(msg)
 
 
-class SQLAlchemyMiddleware(BaseHTTPMiddleware):
+def create_session_factory(engine: AsyncEngine,
+                           replica_engines: Optional[List[AsyncEngine]] = None,
+                           replica_strategy: str = ROUND_ROBIN,
+                           read_your_writes: bool = True,
+                           replica_lag: bool = True,
+                           **session_args) -> sessionmaker:
+    """
+    Create the factory of the sessions on the engine, the reads go to the replica engines when there are any
+    :param engine: the primary engine
+    :param replica_engines: the read replicas
+    :param replica_strategy: round_robin or least_busy
+    :param read_your_writes: the reads of a session go to the primary after it writes
+    :param replica_lag: the replicas may miss the last commits, the reads stay on the primary until the session
+        closes instead of until the commit
+    :param session_args:
+    :return:
+    """
+    if replica_engines:
+        router = ReplicaRouter(replica_engines, strategy=replica_strategy, read_your_writes=read_your_writes,
+                               replica_lag=replica_lag)
+        session_args.update(sync_session_class=RoutingSession, router=router)
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, **session_args)
+
+
+def get_engines() -> List[AsyncEngine]:
+    """The engines of the session factory: the primary and the replicas."""
+    if _Session is None:
+        raise SessionNotInitialisedError
+    router: Optional[ReplicaRouter] = _Session.kw.get("router")
+    return [_Session.kw["bind"]] + (router.engines if router else [])
+
+
+def in_unit_of_work(session: AsyncSession) -> bool:
+    """Whether the writes of the session are only flushed, to be committed at the end of the unit of work."""
+    return session.info.get(_UNIT_OF_WORK_KEY, 0) > 0
+
+
+class SQLAlchemyMiddleware:
+    """
+    Pure ASGI middleware scoping a db session to every http and websocket request.
+    The session is only opened when `db.session` is first used, the static files and the docs never open one.
+    With `unit_of_work` the request is one unit of work: its writes are committed once, right before the
+    response starts, or rolled back when the response is an error, see `db.set_rollback_only`
+    """
+
     def __init__(
             self,
             app: ASGIApp,
@@ -50,9 +98,16 @@ class SQLAlchemyMiddleware(BaseHTTPMiddleware):
             engine_args: Dict = None,
             session_args: Dict = None,
             commit_on_exit: bool = False,
+            replica_urls: Optional[List[Union[str, URL]]] = None,
+            replica_engines: Optional[List[AsyncEngine]] = None,
+            replica_strategy: str = ROUND_ROBIN,
+            read_your_writes: bool = True,
+            replica_lag: bool = True,
+            unit_of_work: bool = False,
     ):
-        super().__init__(app)
+        self.app = app
         self.commit_on_exit = commit_on_exit
+        self.unit_of_work = unit_of_work
         engine_args = engine_args or {}
         session_args = session_args or {}
 
@@ -63,13 +118,31 @@ class SQLAlchemyMiddleware(BaseHTTPMiddleware):
         else:
             engine = custom_engine
 
+        replica_engines = (replica_engines or []) + [create_async_engine(url, **engine_args)
+                                                     for url in replica_urls or []]
+
         global _Session
-        async_session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, **session_args)
-        _Session = async_scoped_session(async_session_factory, scopefunc=current_task)
+        _Session = create_session_factory(engine, replica_engines, replica_strategy=replica_strategy,
+                                          read_your_writes=read_your_writes, replica_lag=replica_lag,
+                                          **session_args)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        request_db = db(commit_on_exit=self.commit_on_exit, lazy=True, unit_of_work=self.unit_of_work)
+        async with request_db:
+            if not self.unit_of_work or scope["type"] != "http":
+                await self.app(scope, receive, send)
+                return
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
-        async with db(commit_on_exit=self.commit_on_exit):
-            return await call_next(request)
+            async def send_after_commit(message: Message):
+                if message["type"] == "http.response.start":
+                    # the client is only told about the success once it is committed
+                    await request_db.end_unit_of_work(commit=message["status"] < 400)
+                await send(message)
+
+            await self.app(scope, receive, send_after_commit)
 
 
 class DBSessionMeta(type):
@@ -84,36 +157,100 @@ class DBSessionMeta(type):
         session = _session.get()
         if session is None:
             raise MissingSessionError
+        if isinstance(session, DBSession):
+            # a lazy scope, the session is opened on first use
+            return session.get_session()
 
         return session
 
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncSession]:
+        """
+        Unit of work on the current session, the BaseCrud writes inside only flush and
+        one commit happens at the exit, or a rollback on error. The nested scopes join the outer one
+
+        async with db.transaction():
+            await crud.user_role.add_user_role(...)
+        """
+        session = self.session
+        depth = session.info.get(_UNIT_OF_WORK_KEY, 0)
+        session.info[_UNIT_OF_WORK_KEY] = depth + 1
+        try:
+            yield session
+        except BaseException:
+            if depth == 0:
+                await session.rollback()
+            raise
+        else:
+            if depth == 0:
+                await session.commit()
+        finally:
+            session.info[_UNIT_OF_WORK_KEY] = depth
+
+    def set_rollback_only(self):
+        """Roll back the request unit of work at its end, e.g. when the request fails with an error response."""
+        session = _session.get()
+        if isinstance(session, DBSession):
+            session = session._session
+        if session is not None:
+            session.info[_ROLLBACK_ONLY_KEY] = True
+
 
 class DBSession(metaclass=DBSessionMeta):
-    def __init__(self, session_args: Dict = None, commit_on_exit: bool = False):
+    def __init__(self,
+                 session_args: Dict = None,
+                 commit_on_exit: bool = False,
+                 lazy: bool = False,
+                 unit_of_work: bool = False):
         self.token = None
         self.session_args = session_args or {}
         self.commit_on_exit = commit_on_exit
+        self.lazy = lazy
+        self.unit_of_work = unit_of_work
+        self._session: Optional[AsyncSession] = None
 
-    async def _init_session(self):
-        self.token = _session.set(_Session(**self.session_args))  # type: ignore
+    def get_session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = _Session(**self.session_args)  # type: ignore
+            if self.unit_of_work:
+                self._session.info[_UNIT_OF_WORK_KEY] = 1
+        return self._session
+
+    async def end_unit_of_work(self, commit: bool = True):
+        """Commit the unit of work of the scope, or roll it back, the next writes commit at once."""
+        session = self._session
+        if session is None or not in_unit_of_work(session):
+            return
+        session.info[_UNIT_OF_WORK_KEY] = 0
+        if commit and not session.info.pop(_ROLLBACK_ONLY_KEY, False):
+            await session.commit()
+        else:
+            session.info.pop(_ROLLBACK_ONLY_KEY, None)
+            await session.rollback()
 
     async def __aenter__(self):
-        if not isinstance(_Session, async_scoped_session):
+        if _Session is None:
             raise SessionNotInitialisedError
 
-        await self._init_session()
+        self.token = _session.set(self if self.lazy else self.get_session())
         return type(self)
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        session = _session.get()
-        if exc_type is not None:
-            await session.rollback()
+        session = self._session
+        try:
+            if session is None:
+                return
+            if exc_type is not None:
+                await session.rollback()
+            elif self.unit_of_work:
+                await self.end_unit_of_work()
 
-        if self.commit_on_exit:
-            await session.commit()
+            if self.commit_on_exit:
+                await session.commit()
 
-        await session.close()
-        _session.reset(self.token)
+            await session.close()
+        finally:
+            _session.reset(self.token)
 
 
 db: DBSessionMeta = DBSession
@@ -0,0 +1,52 @@
+# SQLite production profile: WAL and pragmas on connect, one serialized writer connection and a read pool per worker.
+from typing import Dict, Optional, Tuple, Type, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+__all__ = ('create_sqlite_engines', 'is_sqlite_file')
+
+
+def is_sqlite_file(url: Union[str, URL]) -> bool:
+    """Whether the url is a sqlite database on disk, the in-memory databases can not be shared by engines."""
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def create_sqlite_engines(url: Union[str, URL],
+                          read_pool_size: int = 5,
+                          pragmas: Optional[Dict[str, Union[str, int]]] = None,
+                          writer_pool_class: Type[Pool] = AsyncAdaptedQueuePool,
+                          reader_pool_class: Type[Pool] = AsyncAdaptedQueuePool,
+                          **engine_args) -> Tuple[AsyncEngine, AsyncEngine]:
+    """
+    Create the writer and the reader engines of a sqlite file.
+    The writer pool holds a single connection, the writes of the worker queue for it instead of
+    failing with "database is locked", the readers work aside on the WAL snapshot and never write
+    :param url: the sqlite database url
+    :param read_pool_size: connections of the reader engine
+    :param pragmas: applied to every new connection, e.g. {"journal_mode": "WAL", "busy_timeout": 5000}
+    :param writer_pool_class: a queue pool class, e.g. a `timed_pool_class`
+    :param reader_pool_class: a queue pool class
+    :param engine_args:
+    :return: the writer and the reader engines
+    """
+    engine_args = {key: value for key, value in engine_args.items() if key not in ("pool_size", "max_overflow")}
+    writer = create_async_engine(url, poolclass=writer_pool_class, pool_size=1, max_overflow=0, **engine_args)
+    reader = create_async_engine(url, poolclass=reader_pool_class, pool_size=read_pool_size, max_overflow=0,
+                                 **engine_args)
+    pragmas = pragmas or {}
+    _apply_pragmas(writer, pragmas)
+    _apply_pragmas(reader, {**pragmas, "query_only": "ON"})
+    return writer, reader
+
+
+def _apply_pragmas(engine: AsyncEngine, pragmas: Dict[str, Union[str, int]]):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
@@ -0,0 +1,130 @@
+# Pool and statement instrumentation of the engines, with a slow query log.
+import os
+import time
+from typing import Any, Dict, Optional, Type, Union
+
+from asgi_correlation_id import correlation_id
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import Pool
+
+__all__ = ('EngineStats', 'instrument_engine', 'snapshot', 'timed_pool_class')
+
+_engine_stats: Dict[str, "EngineStats"] = {}
+
+
+class EngineStats:
+    """Counters of one engine in this worker, see `snapshot` for what is reported."""
+
+    def __init__(self, name: str, engine: AsyncEngine, slow_query_seconds: Optional[float] = None):
+        self.name = name
+        self.engine = engine
+        self.slow_query_seconds = slow_query_seconds
+        self.checkouts = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+        self.statements = 0
+        self.statement_seconds = 0.0
+        self.max_statement_seconds = 0.0
+        self.slow_statements = 0
+
+    def record_checkout_wait(self, seconds: float):
+        self.checkout_wait_seconds += seconds
+        self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, seconds)
+
+    def record_statement(self, statement: str, seconds: float):
+        self.statements += 1
+        self.statement_seconds += seconds
+        self.max_statement_seconds = max(self.max_statement_seconds, seconds)
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            self.slow_statements += 1
+            logger.warning(f"slow query {seconds * 1000:.1f} ms on {self.name}, "
+                           f"request_id={correlation_id.get()}: {' '.join(statement.split())[:1000]}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = self.engine.sync_engine.pool
+        return {
+            "pool": pool.status(),
+            # QueuePool only, None for the pools without a size
+            "pool_size": pool.size() if hasattr(pool, "size") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "checkouts": self.checkouts,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "avg_checkout_wait_ms": self.checkout_wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+            "max_checkout_wait_ms": self.max_checkout_wait_seconds * 1000,
+            "statements": self.statements,
+            "avg_statement_ms": self.statement_seconds / self.statements * 1000 if self.statements else 0.0,
+            "max_statement_ms": self.max_statement_seconds * 1000,
+            "slow_statements": self.slow_statements,
+        }
+
+
+def instrument_engine(engine: AsyncEngine, name: str, slow_query_seconds: Optional[float] = None) -> EngineStats:
+    """
+    Record the pool checkouts and the statement latencies of the engine under the name
+    :param engine:
+    :param name: e.g. primary, replica_0
+    :param slow_query_seconds: the statements taking longer are logged with the request id, None to log none
+    :return:
+    """
+    stats = _engine_stats[name] = EngineStats(name, engine, slow_query_seconds)
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "checkout")
+    def checkout(*args):
+        stats.checkouts += 1
+        stats.in_use += 1
+        stats.max_in_use = max(stats.max_in_use, stats.in_use)
+
+    @event.listens_for(sync_engine, "checkin")
+    def checkin(*args):
+        stats.in_use -= 1
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # the statements of a connection run one at a time
+        conn.info["statement_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats.record_statement(statement, time.perf_counter() - conn.info["statement_start"])
+
+    return stats
+
+
+def timed_pool_class(name: str, url: Union[str, URL], pool_class: Optional[Type[Pool]] = None) -> Type[Pool]:
+    """
+    The pool class of an engine timing its checkouts for the stats of the name, the `poolclass` of `create_engine`:
+    the pools have no event before a checkout. The pools recreated by `engine.dispose()` keep the class
+    :param name: the name the engine is instrumented under, see `instrument_engine`
+    :param url: the database url
+    :param pool_class: the pool class of the engine, the default one of its dialect by default
+    :return:
+    """
+    if pool_class is None:
+        url = make_url(url)
+        pool_class = url.get_dialect().get_pool_class(url)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return pool_class.connect(self)
+        finally:
+            stats = _engine_stats.get(name)
+            if stats is not None:
+                stats.record_checkout_wait(time.perf_counter() - start)
+
+    return type(f"Timed{pool_class.__name__}", (pool_class,), {"connect": connect})
+
+
+def snapshot() -> Dict[str, Any]:
+    """The counters of all the instrumented engines of this worker."""
+    return {
+        "pid": os.getpid(),
+        "engines": {name: stats.snapshot() for name, stats in _engine_stats.items()},
+    }
@@ -0,0 +1,44 @@
+# Warm a worker up before its first request: mappers, pool connections and the compiled statement cache.
+import asyncio
+from typing import Sequence
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql import Executable
+
+from fastapi_template.app.core.db.session import get_engines
+
+__all__ = ('warm_up',)
+
+
+async def warm_up(connections: int, statements: Sequence[Executable]):
+    """
+    Configure the mappers, then open the connections of every engine and run the statements on them,
+    the compiled forms stay in the compiled cache of the engine. The opened connections go back to the pool
+    :param connections: pool connections opened per engine, capped by the pool size
+    :param statements: the hot statements, their parameter values do not matter
+    :return:
+    """
+    configure_mappers()
+    for engine in get_engines():
+        await _warm_up_engine(engine, connections, statements)
+
+
+async def _warm_up_engine(engine: AsyncEngine, connections: int, statements: Sequence[Executable]):
+    pool = engine.sync_engine.pool
+    if isinstance(pool, NullPool):
+        # nothing is kept, one connection still runs the dialect initialization
+        connections = 1
+    elif hasattr(pool, "size"):
+        connections = min(connections, pool.size())
+    if connections <= 0:
+        return
+    opened = await asyncio.gather(*(engine.connect() for _ in range(connections)))
+    try:
+        async with AsyncSession(bind=opened[0]) as session:
+            for statement in statements:
+                await session.execute(statement)
+    finally:
+        for connection in opened:
+            await connection.close()
@@ -0,0 +1,57 @@
+# Entity tags of the responses, and the If-None-Match of the current request.
+import hashlib
+from contextvars import ContextVar
+from typing import Any, FrozenSet, Optional
+
+__all__ = ('body_etag', 'conditional_etags', 'entity_etag', 'etag_matches', 'parse_if_none_match', 'request_etags',
+           'search_etags')
+
+# the entity tags of the If-None-Match of the request, empty without the header,
+# None when the request can not be answered with a 304, see `ConditionalRequestMiddleware`
+request_etags: ContextVar[Optional[FrozenSet[str]]] = ContextVar("request_etags", default=None)
+# the same for the other methods, e.g. the POST searches: a 304 would not undo the side effects of the others,
+# only the read-only routes opting in answer them, see `Response(conditional=True)`
+search_etags: ContextVar[Optional[FrozenSet[str]]] = ContextVar("search_etags", default=None)
+
+
+def _weak(digest: str) -> str:
+    # weak: the GZipMiddleware may compress the representation
+    return f'W/"{digest}"'
+
+
+def body_etag(body: bytes) -> str:
+    """The entity tag of a rendered body."""
+    return _weak(hashlib.blake2b(body, digest_size=12).hexdigest())
+
+
+def entity_etag(*versions: Any) -> str:
+    """
+    The entity tag of a resource from its version data, e.g. the id and `update_time` of a row,
+    known before the response is rendered
+    :param versions:
+    :return:
+    """
+    return _weak(hashlib.blake2b(repr(versions).encode(), digest_size=12).hexdigest())
+
+
+def parse_if_none_match(header: str) -> FrozenSet[str]:
+    # the weak comparison of If-None-Match ignores the W/ prefix
+    return frozenset(tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip())
+
+
+def conditional_etags(search: bool = False) -> Optional[FrozenSet[str]]:
+    """
+    The entity tags a response of the current request may match
+    :param search: the route is read-only, the tags of the other methods are answered too
+    :return: None when the response can not be a 304
+    """
+    tags = request_etags.get()
+    if tags is None and search:
+        return search_etags.get()
+    return tags
+
+
+def etag_matches(etag: Optional[str], tags: Optional[FrozenSet[str]]) -> bool:
+    if etag is None or not tags:
+        return False
+    return "*" in tags or etag.removeprefix("W/") in tags
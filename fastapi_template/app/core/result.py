@@ -10,6 +10,7 @@ from pydantic import BaseModel
 from starlette import status
 from starlette.background import BackgroundTask
 
+from fastapi_template.app.core.etag import body_etag, conditional_etags, etag_matches
 from fastapi_template.app.exception.status import ResponseCode
 
 
@@ -21,13 +22,46 @@ class Response(ORJSONResponse):
                  headers: typing.Optional[dict] = None,
                  media_type: typing.Optional[str] = None,
                  background: typing.Optional[BackgroundTask] = None,
+                 etag: typing.Optional[str] = None,
+                 conditional: bool = False,
                  ):
+        """
+        :param etag: the entity tag of the content when it is known before rendering, see `entity_etag`,
+            the content is not even rendered when the client has it already.
+            Without it the successful responses of the conditional requests are tagged with the hash of their body
+        :param conditional: the route is read-only, e.g. a POST search, its If-None-Match is answered whatever
+            the method. The routes with side effects leave it, they are performed anyway and a 304 would hide it
+        """
+        self.etag = etag
+        self.etags = conditional_etags(conditional)
+        if status_code == status.HTTP_200_OK and etag_matches(etag, self.etags):
+            status_code, content = status.HTTP_304_NOT_MODIFIED, None
         super(Response, self).__init__(content, status_code, headers, media_type, background)
+        if self.status_code == status.HTTP_200_OK and etag is None and etag_matches(self.etag, self.etags):
+            # tagged with the hash of the rendered body
+            self.status_code, self.body = status.HTTP_304_NOT_MODIFIED, b""
+        if self.status_code == status.HTTP_304_NOT_MODIFIED:
+            self.raw_headers = [(k, v) for k, v in self.raw_headers if k not in (b"content-type", b"content-length")]
+        if self.etag is not None:
+            self.headers["etag"] = self.etag
 
     def render(self, content: typing.Any) -> bytes:
         assert orjson is not None, "orjson must be installed to use ORJSONResponse"
+        if self.status_code == status.HTTP_304_NOT_MODIFIED:
+            return b""
+        conditional = self.etags is not None and self.status_code == status.HTTP_200_OK
+        envelope = isinstance(content, dict) and content.get("success") is True and "timestamp" in content
+        if conditional and envelope and self.etag is None:
+            # the timestamp changes every time, the tag is the hash of the rest.
+            # Sorted keys: the attributes of the same row may come in another order, e.g. from the query cache,
+            # the body itself keeps the order of the schemas
+            self.etag = body_etag(self._dumps({key: value for key, value in content.items() if key != "timestamp"},
+                                              orjson.OPT_SORT_KEYS))
+        return self._dumps(content)
+
+    def _dumps(self, content: typing.Any, option: int = 0) -> bytes:
         return orjson.dumps(content,
-                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | OPT_UTC_Z,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | OPT_UTC_Z | option,
                             default=self.default_encode)
 
     @staticmethod
@@ -40,9 +74,16 @@ class Response(ORJSONResponse):
     def ok(data: typing.Any = None,
            message: str = "success",
            status_code: int = status.HTTP_200_OK,
-           headers: typing.Optional[dict] = None) -> "Response":
+           headers: typing.Optional[dict] = None,
+           etag: typing.Optional[str] = None,
+           conditional: bool = False) -> "Response":
+        if status_code == status.HTTP_200_OK and etag_matches(etag, conditional_etags(conditional)):
+            # not modified, the content is not built either
+            return Response(content=None, status_code=status_code, headers=headers, etag=etag,
+                            conditional=conditional)
         resp_data = Response._build_response(data=data, message=message)
-        resp = Response(content=resp_data, status_code=status_code, headers=headers)
+        resp = Response(content=resp_data, status_code=status_code, headers=headers, etag=etag,
+                        conditional=conditional)
         return resp
 
     @staticmethod
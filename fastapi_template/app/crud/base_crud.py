@@ -1,21 +1,43 @@
-import copy
+import time
+from functools import lru_cache
 from datetime import datetime
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, AsyncIterator, Dict, Generic, Hashable, List, Optional, Tuple, Type, TypeVar, Union
 from uuid import UUID
 
 from fastapi.encoders import jsonable_encoder
 from fastapi_pagination import Params, Page
-from fastapi_pagination.ext.async_sqlalchemy import paginate
+from fastapi_pagination.api import create_page
+from fastapi_pagination.ext.sqlalchemy import count_query, paginate_query
+from fastapi_pagination.ext.utils import unwrap_scalars
 from pydantic import BaseModel
-from sqlalchemy import func, select, text, delete
-from sqlalchemy.engine import RowMapping
+from sqlalchemy import func, select, text, delete, insert, update, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Result, RowMapping
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql import Select
-from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.sql import Select, Insert
+from sqlalchemy.sql.elements import ClauseElement, TextClause, ColumnElement
+from starlette import status
 
+from fastapi_template.app.core import ResponseCode
+from fastapi_template.app.core.cache.entity import EntityCache
+from fastapi_template.app.core.cache.query import QueryCache, invalidate_tables, statement_key, table_tag
+from fastapi_template.app.core.cache.tags import has_uncommitted_tags, tag_versions
 from fastapi_template.app.core.db import db
-from fastapi_template.app.model.base_model import BaseSQLModel
-from fastapi_template.app.schema.base_schema import OrderEnum, BasePageResponseModel
+from fastapi_template.app.core.db.loader import BatchLoader
+from fastapi_template.app.core.db.session import in_unit_of_work
+from fastapi_template.app.exception.handler import HttpException
+from fastapi_template.app.model.base_model import BaseSQLModel, next_id
+from fastapi_template.app.schema.base_schema import (OrderEnum, BasePageResponseModel, BaseCursorPageResponseModel,
+                                                     ExportFormatEnum, RowFormatEnum, TotalStrategyEnum)
+from fastapi_template.app.util.cursor import decode_cursor, encode_cursor
+from fastapi_template.app.util.export import export_rows
+from fastapi_template.app.util.row_mapper import row_mapper
+from fastapi_template.config import settings
 
 ModelType = TypeVar("ModelType", bound=BaseSQLModel)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -23,16 +45,68 @@ UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 SchemaType = TypeVar("SchemaType", bound=BaseModel)
 T = TypeVar("T", bound=BaseSQLModel)
 
+# columns an upsert keeps from the original insert
+_INSERT_ONLY_COLUMNS = ("id", "create_time", "create_by")
+# the window count column added to the paginated raw sql
+_TOTAL_COLUMN = "__total"
+# bound parameters of the paginated raw sql
+_LIMIT_PARAM, _OFFSET_PARAM = "__limit", "__offset"
+
+
+@lru_cache(maxsize=settings.DATABASE_STATEMENT_CACHE_SIZE)
+def _raw_statement(sql: str, form: str = "") -> TextClause:
+    """
+    Parse the raw sql once, the same statement object keeps the compiled cache of SQLAlchemy warm
+    :param sql: raw native sql statement
+    :param form: "" for the sql itself, "count" for its total, "page" and "window" for a page of it
+    :return:
+    """
+    if form == "count":
+        sql = f"SELECT COUNT(*) FROM ({sql})"
+    elif form == "page":
+        sql = f"{sql} LIMIT :{_LIMIT_PARAM} OFFSET :{_OFFSET_PARAM}"
+    elif form == "window":
+        sql = f"SELECT *, COUNT(*) OVER() AS {_TOTAL_COLUMN} FROM ({sql}) LIMIT :{_LIMIT_PARAM} OFFSET :{_OFFSET_PARAM}"
+    return text(sql)
+
+
+def _seek_scalar(value: Any, column: ColumnElement) -> bool:
+    # a value of a cursor can be compared with the column: null, or a scalar of the column type
+    if value is None:
+        return True
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return isinstance(value, (str, int, float))
+    if python_type is float:
+        return isinstance(value, (int, float))
+    if python_type in (int, str, bool):
+        return isinstance(value, python_type)
+    # e.g. the datetimes, `encode_cursor` writes them as strings
+    return isinstance(value, str)
+
+
+# the query results of the cruds with a query cache, one LRU shared by the cruds of the worker
+shared_query_cache = QueryCache(settings.DATABASE_QUERY_CACHE_SIZE, settings.DATABASE_QUERY_CACHE_SECONDS)
+
 
 class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+    def __init__(self, model: Type[ModelType], entity_cache: bool = False, query_cache: bool = False):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
         **Parameters**
         * `model`: A SQLModel model class
         * `schema`: A Pydantic model (schema) class
+        * `entity_cache`: serve `get_by_id` / `get_by_ids` from the cache, for the tables rarely written
+        * `query_cache`: serve the `list*` and `execute` results from the query cache until the tables they read
+          are written, for the lists read much more often than written
         """
         self.model = model
+        self.entity_cache: Optional[EntityCache[ModelType]] = (
+            EntityCache(model, settings.DATABASE_ENTITY_CACHE_SECONDS) if entity_cache else None)
+        self.query_cache: Optional[QueryCache] = shared_query_cache if query_cache else None
+        # cached page totals of the `cached` total strategy: key -> (expire timestamp, total)
+        self._totals: Dict[Hashable, Tuple[float, int]] = {}
 
     async def get(self, query: Select,
                   db_session: Optional[AsyncSession] = None) -> Optional[ModelType]:
@@ -51,8 +125,24 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param db_session:
         :return:
         """
-        query = select(self.model).where(self.model.id == item_id)
-        return await self.get(query=query, db_session=db_session)
+        if self.entity_cache is not None:
+            return (await self._get_cached(db_session or db.session, [item_id]))[0]
+        if settings.DATABASE_BATCH_LOADER:
+            return await BatchLoader.of(db_session or db.session, self.model).load(item_id)
+        return await self.get(query=self._by_id_query(item_id), db_session=db_session)
+
+    def _by_id_query(self, item_id: Union[UUID, str, int]) -> Select:
+        return select(self.model).where(self.model.id == item_id)
+
+    def _by_ids_query(self, item_ids: List[UUID | str | int]) -> Select:
+        return select(self.model).where(self.model.id.in_(item_ids))
+
+    def warm_up_statements(self) -> List[Select]:
+        """
+        The hot statements of the crud, the startup warm-up compiles them before the first request
+        :return:
+        """
+        return [self._by_id_query(0), self._by_ids_query([0])]
 
     async def get_by_ids(self,
                          *,
@@ -66,10 +156,36 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :return:
         """
         db_session = db_session or db.session
-        query = select(self.model).where(self.model.id.in_(list_ids))
-        response = await db_session.execute(query)
+        if self.entity_cache is not None:
+            return [item for item in await self._get_cached(db_session, list_ids) if item is not None]
+        if settings.DATABASE_BATCH_LOADER:
+            items = await BatchLoader.of(db_session, self.model).load_many(list_ids)
+            return [item for item in items if item is not None]
+        response = await db_session.execute(self._by_ids_query(list_ids))
         return response.scalars().all()
 
+    async def _get_cached(self,
+                          db_session: AsyncSession,
+                          item_ids: List[UUID | str | int],
+                          ) -> List[Optional[ModelType]]:
+        """
+        Get the items of the ids from the entity cache, the missing ones in one query
+        :param db_session:
+        :param item_ids:
+        :return: the items in the order of the ids, None for the ids not found
+        """
+        items = await self.entity_cache.get_many(db_session, item_ids)
+        missing = [item_id for item_id, item in zip(item_ids, items) if item is None]
+        if not missing:
+            return items
+        if settings.DATABASE_BATCH_LOADER:
+            loaded = await BatchLoader.of(db_session, self.model).load_many(missing)
+        else:
+            loaded = (await db_session.execute(self._by_ids_query(missing))).scalars().all()
+        found = {str(item.id): item for item in loaded if item is not None}
+        await self.entity_cache.set_many(db_session, found.values())
+        return [item if item is not None else found.get(str(item_id)) for item_id, item in zip(item_ids, items)]
+
     async def count(self,
                     db_session: Optional[AsyncSession] = None,
                     ) -> Optional[ModelType]:
@@ -99,7 +215,7 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_session = db_session or db.session
         if query is None:
             query = select(self.model).order_by(self.model.id)
-        response = await db_session.execute(query)
+        response = await self._execute(query, db_session=db_session)
         return response.scalars().all()
 
     async def list_ordered(self,
@@ -136,26 +252,28 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         else:
             query = query.order_by(order_by)
 
-        response = await db_session.execute(query)
+        response = await self._execute(query, db_session=db_session)
         return response.scalars().all()
 
     async def list_paginated(self,
                              *,
                              query: Optional[Select] = None,
                              params: Optional[Params] = Params(),
+                             total_strategy: Optional[TotalStrategyEnum] = None,
                              db_session: Optional[AsyncSession] = None,
-                             ) -> Page[ModelType]:
+                             ) -> Union[Page[ModelType], BasePageResponseModel]:
         """
         Get all the item data with pagination
         :param params:
         :param query:
+        :param total_strategy: how the total is computed, see `_paginate`
         :param db_session:
         :return:
         """
         db_session = db_session or db.session
         if query is None:
             query = select(self.model)
-        return await paginate(db_session, query, params)  # type: ignore
+        return await self._paginate(query=query, params=params, total_strategy=total_strategy, db_session=db_session)
 
     async def list_paginated_ordered(self,
                                      *,
@@ -163,14 +281,16 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                                      params: Optional[Params] = Params(),
                                      order_by: Optional[str] = None,
                                      order: Optional[OrderEnum] = OrderEnum.descendent,
+                                     total_strategy: Optional[TotalStrategyEnum] = None,
                                      db_session: Optional[AsyncSession] = None,
-                                     ) -> Page[ModelType]:
+                                     ) -> Union[Page[ModelType], BasePageResponseModel]:
         """
         Get all the item data with pagination and order
         :param params:
         :param order_by:
         :param order:
         :param query:
+        :param total_strategy: how the total is computed, see `_paginate`
         :param db_session:
         :return:
         """
@@ -186,7 +306,258 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             else:
                 query = select(self.model).order_by(order_by.desc())
 
-        return await paginate(db_session, query, params)  # type: ignore
+        return await self._paginate(query=query, params=params, total_strategy=total_strategy, db_session=db_session)
+
+    async def _paginate(self,
+                        *,
+                        query: Select,
+                        params: Params,
+                        total_strategy: Optional[TotalStrategyEnum],
+                        db_session: AsyncSession,
+                        ) -> Union[Page[ModelType], BasePageResponseModel]:
+        """
+        Paginate the query with the total strategy, `DATABASE_PAGE_TOTAL_STRATEGY` by default
+        * `count`: a COUNT(*) round trip before the page, the `Page` of fastapi_pagination
+        * `window`: the total comes with the page rows from COUNT(*) OVER(), one round trip
+        * `cached`: the count is cached for `DATABASE_COUNT_CACHE_SECONDS`, dropped on writes to the tables it reads
+        * `none`: no total at all, `size + 1` rows are fetched for `has_next`
+        :param query:
+        :param params:
+        :param total_strategy:
+        :param db_session:
+        :return:
+        """
+        total_strategy = total_strategy or TotalStrategyEnum(settings.DATABASE_PAGE_TOTAL_STRATEGY)
+        if total_strategy == TotalStrategyEnum.count:
+            # the `paginate` of fastapi_pagination, through the query cache
+            total = (await self._execute(count_query(query), db_session=db_session)).scalar()
+            response = await self._execute(paginate_query(query, params), db_session=db_session)
+            return create_page(unwrap_scalars(response.unique().all()), total, params)  # type: ignore
+        limit, offset = params.size, params.size * (params.page - 1)
+        total = None
+        if total_strategy == TotalStrategyEnum.window:
+            query = query.add_columns(func.count().over().label(_TOTAL_COLUMN))
+            response = await self._execute(query.limit(limit).offset(offset), db_session=db_session)
+            rows = response.all()
+            items = [row[0] for row in rows]
+            if rows:
+                total = rows[0][-1]
+            else:
+                # past the last page the window has no row to carry the total
+                total = (await self._execute(self._count_query(query), db_session=db_session)).scalar() \
+                    if offset else 0
+        elif total_strategy == TotalStrategyEnum.cached:
+            total = await self._cached_total(self._count_query(query), db_session=db_session)
+            response = await self._execute(query.limit(limit).offset(offset), db_session=db_session)
+            items = response.scalars().all()
+        else:
+            response = await self._execute(query.limit(limit + 1).offset(offset), db_session=db_session)
+            items = response.scalars().all()
+        has_next = len(items) > limit if total is None else offset + len(items) < total
+        return BasePageResponseModel(total=total, page=params.page, size=params.size, items=items[:limit],
+                                     has_next=has_next)
+
+    @staticmethod
+    def _count_query(query: Select) -> Select:
+        return select(func.count()).select_from(query.order_by(None).subquery())
+
+    async def _execute(self,
+                       statement: ClauseElement,
+                       params: Optional[dict] = None,
+                       *,
+                       db_session: AsyncSession,
+                       ) -> Result:
+        """
+        Execute the read statement, through the query cache when the crud has one
+        :param statement:
+        :param params:
+        :param db_session:
+        :return:
+        """
+        if self.query_cache is None:
+            return await db_session.execute(statement, params)
+        return await self.query_cache.execute(db_session, statement, params)
+
+    async def _cached_total(self,
+                            count_query: Union[Select, TextClause],
+                            params: Optional[dict] = None,
+                            *,
+                            db_session: AsyncSession,
+                            ) -> int:
+        """
+        Get the total of the count query from the per crud cache, or count and cache it.
+        The totals are keyed with the versions of the tables the query reads, like the `QueryCache`,
+        a write through any crud of any worker drops them
+        :param count_query:
+        :param params:
+        :param db_session:
+        :return:
+        """
+        key = statement_key(count_query, params)
+        tables = QueryCache.tables(count_query) if key is not None else []
+        versions = await tag_versions([table_tag(name) for name in tables]) if tables else None
+        if versions is None or has_uncommitted_tags(db_session):
+            # not cacheable, no cache yet, or the session counts its own uncommitted writes
+            return (await self._execute(count_query, params, db_session=db_session)).scalar()
+        key = (key, tuple(versions))
+        now = time.monotonic()
+        cached = self._totals.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        total = (await self._execute(count_query, params, db_session=db_session)).scalar()
+        if len(self._totals) >= settings.DATABASE_COUNT_CACHE_SIZE:
+            self._totals.pop(next(iter(self._totals)))
+        self._totals[key] = (now + settings.DATABASE_COUNT_CACHE_SECONDS, total)
+        return total
+
+    @staticmethod
+    async def _commit(db_session: AsyncSession) -> None:
+        """
+        Commit the write, or only flush it inside a unit of work, see `db.transaction`
+        :param db_session:
+        :return:
+        """
+        if in_unit_of_work(db_session):
+            await db_session.flush()
+        else:
+            await db_session.commit()
+
+    async def _after_write(self,
+                           item_ids: Optional[List[UUID | str | int]] = None,
+                           *,
+                           db_session: AsyncSession,
+                           ) -> None:
+        """
+        Hook called after every write through this crud, drop what was derived from the table data
+        :param item_ids: the written ids, None when they are unknown
+        :param db_session: the session of the write
+        :return:
+        """
+        BatchLoader.invalidate(db_session, self.model, item_ids)
+        if settings.DATABASE_QUERY_CACHE_SIZE or settings.DATABASE_COUNT_CACHE_SIZE:
+            # any crud may join the table, the writes of every crud drop the cached queries and totals reading it
+            await invalidate_tables([self.model.__tablename__], db_session)
+        if self.entity_cache is not None:
+            await self.entity_cache.evict(db_session, item_ids)
+
+    async def list_keyset(self,
+                          *,
+                          query: Optional[Select] = None,
+                          cursor: Optional[str] = None,
+                          size: int = 50,
+                          order_by: Optional[str] = None,
+                          order: Optional[OrderEnum] = OrderEnum.descendent,
+                          db_session: Optional[AsyncSession] = None,
+                          ) -> BaseCursorPageResponseModel:
+        """
+        Get the item data with keyset (cursor) pagination, seek on `(order_by, id)` instead of OFFSET,
+        so every page costs the same no matter how deep it is
+        :param query: the filtered query, its own order by is replaced
+        :param cursor: the `next_cursor` of the previous page, empty for the first page
+        :param size:
+        :param order_by:
+        :param order:
+        :param db_session:
+        :return:
+        """
+        db_session = db_session or db.session
+        columns = self.model.__table__.columns
+        if order_by is None or order_by not in columns:
+            order_by = "id"
+        order_column = columns[order_by]
+        id_column = columns["id"]
+        # the snowflake id is unique and time-ordered, so it is a stable tiebreaker for any order column
+        seek_columns = [id_column] if order_by == "id" else [order_column, id_column]
+        if query is None:
+            query = select(self.model)
+
+        if cursor:
+            seek_values = self._seek_values(cursor, seek_columns)
+            if order == OrderEnum.ascendent:
+                query = query.where(tuple_(*seek_columns) > tuple_(*seek_values))
+            else:
+                query = query.where(tuple_(*seek_columns) < tuple_(*seek_values))
+
+        if order == OrderEnum.ascendent:
+            query = query.order_by(None).order_by(*[c.asc() for c in seek_columns])
+        else:
+            query = query.order_by(None).order_by(*[c.desc() for c in seek_columns])
+        # fetch one more row to know whether there is a next page, no count needed
+        response = await self._execute(query.limit(size + 1), db_session=db_session)
+        items = response.scalars().all()
+        has_next = len(items) > size
+        items = items[:size]
+        next_cursor = None
+        if has_next:
+            next_cursor = encode_cursor([getattr(items[-1], c.key) for c in seek_columns])
+        return BaseCursorPageResponseModel(items=items, size=size, next_cursor=next_cursor, has_next=has_next)
+
+    @staticmethod
+    def _seek_values(cursor: str, seek_columns: List[ColumnElement]) -> List[Any]:
+        """
+        The seek values of the cursor, one scalar of the column type per seek column
+        :param cursor:
+        :param seek_columns:
+        :return:
+        """
+        try:
+            seek_values = decode_cursor(cursor)
+        except ValueError:
+            seek_values = None
+        if seek_values is None or len(seek_values) != len(seek_columns) or not all(
+                _seek_scalar(value, column) for value, column in zip(seek_values, seek_columns)):
+            # a tampered cursor would fail in the database
+            raise HttpException(code=ResponseCode.BAD_REQUEST, detail="invalid page cursor",
+                                status_code=status.HTTP_400_BAD_REQUEST)
+        return seek_values
+
+    async def stream(self,
+                     *,
+                     query: Optional[Select] = None,
+                     batch_size: Optional[int] = None,
+                     mappings: bool = False,
+                     db_session: Optional[AsyncSession] = None,
+                     ) -> AsyncIterator[Union[ModelType, RowMapping]]:
+        """
+        Stream the item data with a server side cursor, only `batch_size` rows are buffered at a time,
+        so the memory stays flat however large the result is
+        :param query:
+        :param batch_size: rows fetched per round, `DATABASE_STREAM_BATCH_SIZE` by default
+        :param mappings: yield the rows as mappings instead of the single selected entity,
+            use it with column queries to skip the ORM objects
+        :param db_session:
+        :return:
+        """
+        db_session = db_session or db.session
+        batch_size = batch_size or settings.DATABASE_STREAM_BATCH_SIZE
+        if query is None:
+            query = select(self.model).order_by(self.model.id)
+        response = await db_session.stream(query.execution_options(yield_per=batch_size))
+        response = response.mappings() if mappings else response.scalars()
+        async for partition in response.partitions(batch_size):
+            for item in partition:
+                yield item
+
+    async def export(self,
+                     *,
+                     query: Select,
+                     export_format: ExportFormatEnum,
+                     batch_size: Optional[int] = None,
+                     ) -> AsyncIterator[bytes]:
+        """
+        Export the rows of the column query as NDJSON or CSV chunks, its selected columns are the exported ones.
+        The rows are streamed from a session of their own, apart from the request session
+        :param query:
+        :param export_format:
+        :param batch_size: rows fetched and encoded per chunk, `DATABASE_STREAM_BATCH_SIZE` by default
+        :return:
+        """
+        batch_size = batch_size or settings.DATABASE_STREAM_BATCH_SIZE
+        columns = list(query.selected_columns.keys())
+        async with db():
+            async for chunk in export_rows(self.stream(query=query, batch_size=batch_size, mappings=True), columns,
+                                           export_format, batch_size=batch_size):
+                yield chunk
 
     async def add(self,
                   *,
@@ -215,8 +586,11 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             db_obj.create_by = created_by
 
         db_session.add(db_obj)
-        await db_session.commit()
+        # refreshed in the transaction of the write, the commit releases the primary connection
+        await db_session.flush()
         await db_session.refresh(db_obj)
+        await self._commit(db_session)
+        await self._after_write([db_obj.id], db_session=db_session)
         return db_obj
 
     async def add_all(self,
@@ -249,9 +623,173 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             db_objs.append(db_model)
 
         db_session.add_all(db_objs)
-        await db_session.commit()
+        await self._commit(db_session)
+        await self._after_write([db_obj.id for db_obj in db_objs], db_session=db_session)
         return db_objs
 
+    async def add_bulk(self,
+                       *,
+                       create_schemas: List[CreateSchemaType | Dict[str, Any]],
+                       created_by: Optional[UUID | str | int] = None,
+                       chunk_size: Optional[int] = None,
+                       return_ids: bool = False,
+                       db_session: Optional[AsyncSession] = None,
+                       ) -> Union[int, List[int]]:
+        """
+        Batch to create the item data with a set-based INSERT executemany, skips the ORM unit of work,
+        every item must carry the same fields
+        :param create_schemas:
+        :param created_by:
+        :param chunk_size: rows per executemany, `DATABASE_BULK_CHUNK_SIZE` by default
+        :param return_ids: return the generated ids instead of the inserted row count
+        :param db_session:
+        :return:
+        """
+        db_session = db_session or db.session
+        chunk_size = chunk_size or settings.DATABASE_BULK_CHUNK_SIZE
+        rows = self._build_rows(create_schemas, created_by=created_by)
+        statement = insert(self.model.__table__)
+        for start in range(0, len(rows), chunk_size):
+            await db_session.execute(statement, rows[start:start + chunk_size])
+        await self._commit(db_session)
+        await self._after_write([row["id"] for row in rows], db_session=db_session)
+        if return_ids:
+            return [row["id"] for row in rows]
+        return len(rows)
+
+    async def upsert_many(self,
+                          *,
+                          create_schemas: List[CreateSchemaType | Dict[str, Any]],
+                          conflict_keys: List[str],
+                          update_keys: Optional[List[str]] = None,
+                          created_by: Optional[UUID | str | int] = None,
+                          chunk_size: Optional[int] = None,
+                          db_session: Optional[AsyncSession] = None,
+                          ) -> int:
+        """
+        Batch to create or update the item data with one INSERT ... ON CONFLICT DO UPDATE per chunk,
+        the conflict keys must be covered by a unique index.
+        Objects already loaded in the session are not synchronized
+        :param create_schemas:
+        :param conflict_keys: the unique columns deciding whether a row is inserted or updated
+        :param update_keys: the columns overwritten on conflict, all the given fields by default
+        :param created_by:
+        :param chunk_size: rows per executemany, `DATABASE_BULK_CHUNK_SIZE` by default
+        :param db_session:
+        :return: the inserted and updated row count
+        """
+        db_session = db_session or db.session
+        chunk_size = chunk_size or settings.DATABASE_BULK_CHUNK_SIZE
+        rows = self._build_rows(create_schemas, created_by=created_by, updated_by=created_by)
+        if not rows:
+            return 0
+        if update_keys is None:
+            update_keys = [key for key in rows[0] if key not in conflict_keys and key not in _INSERT_ONLY_COLUMNS]
+        statement = self._upsert_statement(dialect=db_session.sync_session.get_bind().dialect.name,
+                                           conflict_keys=conflict_keys,
+                                           update_keys=list(dict.fromkeys([*update_keys, "update_time"])))
+        affected = 0
+        for start in range(0, len(rows), chunk_size):
+            response = await db_session.execute(statement, rows[start:start + chunk_size])
+            affected += response.rowcount
+        await self._commit(db_session)
+        await self._after_write(db_session=db_session)
+        return affected
+
+    async def update_many(self,
+                          *,
+                          update_schema: Union[UpdateSchemaType, Dict[str, Any]],
+                          where: Optional[ColumnElement] = None,
+                          item_ids: Optional[List[UUID | str | int]] = None,
+                          chunk_size: Optional[int] = None,
+                          db_session: Optional[AsyncSession] = None,
+                          ) -> int:
+        """
+        Update all the items matching the filter with the same values in one UPDATE ... WHERE statement,
+        when `item_ids` are given they are chunked into one statement per `chunk_size` ids.
+        Objects already loaded in the session are not synchronized
+        :param update_schema:
+        :param where: the filter of the items
+        :param item_ids: the ids of the items, combined with `where` when both are given
+        :param chunk_size: ids per statement, `DATABASE_BULK_CHUNK_SIZE` by default
+        :param db_session:
+        :return: the affected row count
+        """
+        if where is None and item_ids is None:
+            raise ValueError("update_many needs a where clause or item ids, refuse to update the whole table")
+        db_session = db_session or db.session
+        chunk_size = chunk_size or settings.DATABASE_BULK_CHUNK_SIZE
+        columns = self.model.__table__.columns
+        if isinstance(update_schema, BaseModel):
+            update_schema = update_schema.dict(exclude_none=True)
+        update_data = {key: value for key, value in update_schema.items() if key in columns and key != "id"}
+        update_data.setdefault("update_time", datetime.utcnow())
+        statement = update(self.model.__table__).values(**update_data)
+        if where is not None:
+            statement = statement.where(where)
+
+        affected = 0
+        if item_ids is None:
+            response = await db_session.execute(statement)
+            affected += response.rowcount
+        else:
+            for start in range(0, len(item_ids), chunk_size):
+                chunk = item_ids[start:start + chunk_size]
+                response = await db_session.execute(statement.where(columns["id"].in_(chunk)))
+                affected += response.rowcount
+        await self._commit(db_session)
+        await self._after_write(item_ids if where is None else None, db_session=db_session)
+        return affected
+
+    def _upsert_statement(self, dialect: str, conflict_keys: List[str], update_keys: List[str]) -> Insert:
+        table = self.model.__table__
+        if dialect == "sqlite":
+            statement = sqlite_insert(table)
+            return statement.on_conflict_do_update(index_elements=conflict_keys,
+                                                   set_={key: statement.excluded[key] for key in update_keys})
+        if dialect == "postgresql":
+            statement = postgresql_insert(table)
+            return statement.on_conflict_do_update(index_elements=conflict_keys,
+                                                   set_={key: statement.excluded[key] for key in update_keys})
+        if dialect == "mysql":
+            # mysql resolves the conflict on any unique key, the conflict keys only document the intent
+            statement = mysql_insert(table)
+            return statement.on_duplicate_key_update({key: statement.inserted[key] for key in update_keys})
+        raise NotImplementedError(f"upsert is not supported by the {dialect} dialect")
+
+    def _build_rows(self,
+                    create_schemas: List[CreateSchemaType | Dict[str, Any]],
+                    created_by: Optional[UUID | str | int] = None,
+                    updated_by: Optional[UUID | str | int] = None,
+                    ) -> List[Dict[str, Any]]:
+        """
+        Build the column dicts of a bulk write, the ids and audit columns are filled here once for all rows
+        :param create_schemas:
+        :param created_by:
+        :param updated_by:
+        :return:
+        """
+        if not create_schemas:
+            return []
+        columns = self.model.__table__.columns
+        first = create_schemas[0]
+        first = first.dict() if isinstance(first, BaseModel) else first
+        keys = [key for key in first if key in columns and key != "id"]
+        now = datetime.utcnow()
+        audit = {"create_time": now, "update_time": now}
+        if created_by:
+            audit["create_by"] = created_by
+        if updated_by:
+            audit["update_by"] = updated_by
+        rows = []
+        for create_schema in create_schemas:
+            values = create_schema.dict() if isinstance(create_schema, BaseModel) else create_schema
+            row = {key: values[key] for key in keys}
+            row.update(audit)
+            row["id"] = next_id()
+            rows.append(row)
+        return rows
+
     async def update(self,
                      *,
                      current_model: ModelType,
@@ -281,24 +819,33 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 setattr(current_model, field, datetime.utcnow())
 
         db_session.add(current_model)
-        await db_session.commit()
+        await db_session.flush()
         await db_session.refresh(current_model)
+        await self._commit(db_session)
+        await self._after_write([current_model.id], db_session=db_session)
         return current_model
 
     async def update_by_id(self,
                            *,
                            item_id: Union[UUID, str, int],
                            update_schema: Union[UpdateSchemaType, Dict[str, Any], ModelType],
+                           direct: bool = False,
                            db_session: Optional[AsyncSession] = None,
                            ) -> Optional[ModelType]:
         """
         Update the item data by id
         :param item_id:
         :param update_schema:
+        :param direct: write with a single UPDATE statement without loading the item first,
+            see `_update_by_id_direct` for the returned item
         :param db_session:
         :return:
         """
         db_session = db_session or db.session
+        if direct:
+            if isinstance(update_schema, BaseModel):
+                update_schema = update_schema.dict(exclude_none=True)
+            return await self._update_by_id_direct(item_id=item_id, update_data=update_schema, db_session=db_session)
         current_model: Optional[ModelType] = await self.get_by_id(item_id=item_id, db_session=db_session)
         if current_model is None:
             return None
@@ -321,6 +868,7 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_session = db_session or db.session
         query = delete(self.model).where(self.model.id == item_id)
         response = await db_session.execute(query)
+        await self._after_write([item_id], db_session=db_session)
         return response
 
     async def delete_all(self,
@@ -337,68 +885,156 @@ class BaseCrud(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_session = db_session or db.session
         query = delete(self.model).where(self.model.id.in_(item_ids))
         obj = await db_session.execute(query)
+        await self._after_write(item_ids, db_session=db_session)
         return obj
 
     async def inactive(self,
                        *,
                        item_id: Union[UUID, str, int],
                        update_by: Optional[Union[UUID, str, int]] = None,
+                       direct: bool = False,
                        db_session: Optional[AsyncSession] = None
                        ) -> Optional[ModelType]:
         """
         Remove the item data by item id
         :param update_by:
         :param item_id:
+        :param direct: soft delete with a single UPDATE statement, see `update_by_id`
         :param db_session:
         :return:
         """
         db_session = db_session or db.session
+        update_data = {"is_active": 0}
+        if update_by:
+            update_data["update_by"] = update_by
+        if direct:
+            return await self._update_by_id_direct(item_id=item_id, update_data=update_data, db_session=db_session)
         current_model: Optional[ModelType] = await self.get_by_id(item_id=item_id, db_session=db_session)
         if current_model is None:
             return None
-        update_schema = copy.deepcopy(current_model)
-        update_schema.is_active = 0
-        if update_by:
-            update_schema.update_by = update_by
-        return await self.update(current_model=current_model, update_schema=update_schema)
+        return await self.update(current_model=current_model, update_schema=update_data, db_session=db_session)
+
+    async def _update_by_id_direct(self,
+                                   *,
+                                   item_id: Union[UUID, str, int],
+                                   update_data: Dict[str, Any],
+                                   db_session: AsyncSession,
+                                   ) -> Optional[ModelType]:
+        """
+        Update the item data by id with one UPDATE ... RETURNING round trip, no select and no refresh.
+        The returned item is detached: it is the full returned row on dialects supporting RETURNING,
+        otherwise it only carries the id and the written columns. The copy of the item already loaded
+        in the session, if any, is synchronized
+        :param item_id:
+        :param update_data:
+        :param db_session:
+        :return: None when no item has the id
+        """
+        columns = self.model.__table__.columns
+        id_column = columns["id"]
+        values = {key: value for key, value in update_data.items() if key in columns and key != "id"}
+        values["update_time"] = datetime.utcnow()
+        statement = update(self.model.__table__).where(id_column == item_id).values(**values)
+        if db_session.sync_session.get_bind().dialect.full_returning:
+            response = await db_session.execute(statement.returning(*columns))
+            row = response.mappings().first()
+            await self._commit(db_session)
+            if row is None:
+                return None
+            values = dict(row)
+        else:
+            response = await db_session.execute(statement)
+            await self._commit(db_session)
+            if response.rowcount == 0:
+                return None
+            values["id"] = id_column.type.python_type(item_id)
+        await self._after_write([values["id"]], db_session=db_session)
+
+        loaded = db_session.identity_map.get(identity_key(self.model, values["id"]))
+        if loaded is not None:
+            for key, value in values.items():
+                set_committed_value(loaded, key, value)
+        item = self.model(**values)
+        make_transient_to_detached(item)
+        return item
 
     async def execute(self,
                       sql: str,
                       params: dict = None,
                       schema: SchemaType = None,
+                      total_strategy: Optional[TotalStrategyEnum] = None,
+                      row_format: RowFormatEnum = RowFormatEnum.validated,
                       db_session: Optional[AsyncSession] = None
-                      ) -> Union[List[SchemaType | RowMapping], BasePageResponseModel]:
+                      ) -> Union[List[SchemaType | RowMapping | dict | tuple], BasePageResponseModel, int]:
         """
-        Execute the raw sql
+        Execute the raw sql, a statement returning no rows returns its affected row count
         :param sql: raw native sql statement
         :param schema: pydantic schema object
-        :param params: the sql parameters
+        :param params: the sql parameters, paginated when `page` and `size` are given
+        :param total_strategy: how the total of a page is computed, see `_paginate`
+        :param row_format: `validated` parses every row with the schema, `trusted` builds the schemas
+            without validation, `dict` and `tuple` skip the schema objects, see `row_mapper`
         :param db_session:
         :return:
         """
-        params = params if params else {}
+        params = dict(params) if params else {}
         db_session = db_session or db.session
-        raw_statement: TextClause = text(sql)
+        raw_statement: TextClause = _raw_statement(sql)
         total, page_num, page_size = 0, 0, 0
         is_pagination = False
         if "page" in params and "size" in params:
             is_pagination = True
+            total_strategy = total_strategy or TotalStrategyEnum(settings.DATABASE_PAGE_TOTAL_STRATEGY)
             page_num = params["page"]
             page_size = params["size"]
             offset = page_size * (page_num - 1)
             params.pop("page", None)
             params.pop("size", None)
-            count_query = text(f"SELECT COUNT(*) FROM ({raw_statement.text})")
-            total = await db_session.scalar(count_query, params=params)
-            raw_statement = text(f"{raw_statement.text} LIMIT {page_size} OFFSET {offset}")
-
-        response = await db_session.execute(raw_statement, params=params)
-        results: List[RowMapping] = response.mappings().unique().all()
-        if schema is None:
-            return results
-        # convert to pydantic object
-        schemas = list(map(lambda model: schema.parse_obj(model), results))
+            count_query = _raw_statement(sql, "count")
+            if total_strategy == TotalStrategyEnum.window:
+                raw_statement = _raw_statement(sql, "window")
+            else:
+                if total_strategy == TotalStrategyEnum.none:
+                    total = None
+                elif total_strategy == TotalStrategyEnum.cached:
+                    total = await self._cached_total(count_query, params=params, db_session=db_session)
+                else:
+                    total = (await self._execute(count_query, params, db_session=db_session)).scalar()
+                raw_statement = _raw_statement(sql, "page")
+            # one more row tells has_next without a total
+            limit = page_size + 1 if total is None else page_size
+            response = await self._execute(raw_statement, {**params, _LIMIT_PARAM: limit, _OFFSET_PARAM: offset},
+                                           db_session=db_session)
+        else:
+            response = await self._execute(raw_statement, params, db_session=db_session)
+            # the replayed results of the query cache always have rows
+            if not getattr(response, "returns_rows", True):
+                # a raw write, the tables it wrote besides this one are seen after their cache expiry
+                await self._after_write(db_session=db_session)
+                return response.rowcount
+        columns: List[str] = list(response.keys())
+        rows = response.unique().all()
+        is_window = is_pagination and total_strategy == TotalStrategyEnum.window
+        if is_window:
+            # the window total is the last column
+            columns.pop()
+            if rows:
+                total = rows[0][-1]
+            else:
+                # past the last page the window has no row to carry the total
+                total = (await self._execute(count_query, params, db_session=db_session)).scalar() if offset else 0
+        has_next = None
+        if is_pagination:
+            has_next = len(rows) > page_size if total is None else offset + len(rows) < total
+            rows = rows[:page_size]
+        if schema is None and row_format in (RowFormatEnum.validated, RowFormatEnum.trusted) and not is_window:
+            results = [row._mapping for row in rows]
+        else:
+            # convert to pydantic object, dict or tuple
+            mapper = row_mapper(columns, schema, row_format)
+            results = [mapper(row) for row in rows]
         if not is_pagination:
-            return schemas
-        page_schemas = BasePageResponseModel(total=total, page=page_num, size=page_size, items=schemas)
+            return results
+        page_schemas = BasePageResponseModel(total=total, page=page_num, size=page_size, items=results,
+                                             has_next=has_next)
         return page_schemas
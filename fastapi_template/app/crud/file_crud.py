@@ -7,4 +7,4 @@ class FileCrud(BaseCrud[FileInfo, FileCreateRequest, FileUpdateRequest]):
     pass
 
 
-file = FileCrud(FileInfo)
+file = FileCrud(FileInfo, query_cache=True)
@@ -7,4 +7,5 @@ class RoleCrud(BaseCrud[Role, RoleCreateRequest, RoleUpdateRequest]):
     pass
 
 
-role = RoleCrud(Role)
+# the roles are near static, read on every role check
+role = RoleCrud(Role, entity_cache=True, query_cache=True)
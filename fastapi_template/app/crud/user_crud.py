@@ -1,13 +1,22 @@
-from typing import Optional
+from typing import List, Optional, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import select, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 from fastapi_template.app.core.db import db
+from fastapi_template.app.core.db.functions import group_concat
+from fastapi_template.app.core.db.loader import BatchLoader
 from fastapi_template.app.crud.base_crud import BaseCrud
+from fastapi_template.app.model.role_model import Role
 from fastapi_template.app.model.user_model import User
-from fastapi_template.app.schema.base_schema import BasePageResponseModel
+from fastapi_template.app.model.user_role_model import UserRole
+from fastapi_template.app.schema.base_schema import BasePageResponseModel, BaseCursorPageResponseModel, RowFormatEnum
 from fastapi_template.app.schema.user_schema import UserCreateRequest, UserUpdateRequest, UserDetailResponse
+from fastapi_template.config import settings
+
+# the role names are upper case identifiers, see `roles`
+_ROLE_NAME_SEPARATOR = ","
 
 
 class UserCrud(BaseCrud[User, UserCreateRequest, UserUpdateRequest]):
@@ -17,10 +26,53 @@ class UserCrud(BaseCrud[User, UserCreateRequest, UserUpdateRequest]):
                                 username: str,
                                 db_session: Optional[AsyncSession] = None) -> Optional[User]:
         db_session = db_session or db.session
-        select_sql = select(User).where(User.user_name == username)
-        users = await db_session.execute(select_sql)
+        users = await db_session.execute(self._username_query(username))
         return users.scalar_one_or_none()
 
+    @staticmethod
+    def _username_query(username: str) -> Select:
+        return select(User).where(User.user_name == username)
+
+    async def query_with_role_names(self,
+                                    *,
+                                    user_id: Optional[int] = None,
+                                    username: Optional[str] = None,
+                                    db_session: Optional[AsyncSession] = None
+                                    ) -> Optional[Tuple[User, List[str]]]:
+        """
+        Get the user and the names of its active roles in one query, by id or by username
+        :param user_id:
+        :param username:
+        :param db_session:
+        :return: the user and its role names, None when there is no such user
+        """
+        db_session = db_session or db.session
+        if user_id is not None:
+            condition = User.id == user_id
+        else:
+            condition = User.user_name == username
+        response = await db_session.execute(self._role_names_query(condition))
+        row = response.one_or_none()
+        if row is None:
+            return None
+        user_data, role_names = row
+        if settings.DATABASE_BATCH_LOADER:
+            BatchLoader.of(db_session, User).prime(user_data)
+        return user_data, role_names.split(_ROLE_NAME_SEPARATOR) if role_names else []
+
+    @staticmethod
+    def _role_names_query(condition) -> Select:
+        return (select(User, group_concat(Role.name, _ROLE_NAME_SEPARATOR))
+                .outerjoin(UserRole, and_(UserRole.user_id == User.id, UserRole.is_active == 1))
+                .outerjoin(Role, and_(Role.id == UserRole.role_id, Role.is_active == 1))
+                .where(condition)
+                .group_by(User.id))
+
+    def warm_up_statements(self) -> List[Select]:
+        return super().warm_up_statements() + [self._username_query(""),
+                                               self._role_names_query(User.id == 0),
+                                               self._role_names_query(User.user_name == "")]
+
     async def get_user_list(self,
                             name: str,
                             page: int = 0,
@@ -30,9 +82,21 @@ class UserCrud(BaseCrud[User, UserCreateRequest, UserUpdateRequest]):
         users = await self.execute(sql=query,
                                    params={"name": f"%{name}%", "page": page, "size": page_size},
                                    schema=UserDetailResponse,
+                                   row_format=RowFormatEnum.trusted,
                                    db_session=db_session
                                    )
         return users
 
+    async def get_user_list_keyset(self,
+                                   name: str,
+                                   cursor: str = "",
+                                   page_size: int = 50,
+                                   db_session: Optional[AsyncSession] = None) -> BaseCursorPageResponseModel:
+        query = select(User).where(and_(or_(User.user_name.like(f"%{name}%"), User.nick_name.like(f"%{name}%")),
+                                        User.is_active == 1))
+        users = await self.list_keyset(query=query, cursor=cursor, size=page_size, db_session=db_session)
+        users.items = list(map(lambda u: UserDetailResponse.from_orm(u), users.items))
+        return users
+
 
 user = UserCrud(User)
@@ -1,7 +1,8 @@
-from typing import Optional
+from typing import List, Optional
 
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 from fastapi_template.app.core.db import db
 from fastapi_template.app.crud.base_crud import BaseCrud
@@ -16,10 +17,16 @@ class UserRoleCrud(BaseCrud[UserRole, UserRoleCreateRequest, UserRoleUpdateReque
                                user_id: int,
                                db_session: Optional[AsyncSession] = None):
         db_session = db_session or db.session
-        select_sql = select(UserRole).where(and_(UserRole.user_id == user_id, UserRole.is_active == 1))
-        users = await db_session.execute(select_sql)
+        users = await db_session.execute(self._user_id_query(user_id))
         return users.scalars().all()
 
+    @staticmethod
+    def _user_id_query(user_id: int) -> Select:
+        return select(UserRole).where(and_(UserRole.user_id == user_id, UserRole.is_active == 1))
+
+    def warm_up_statements(self) -> List[Select]:
+        return super().warm_up_statements() + [self._user_id_query(0)]
+
     async def add_user_role(self,
                             user_id: int,
                             roles: list,
@@ -6,6 +6,7 @@ from loguru import logger
 from starlette import status
 
 from fastapi_template.app.core import ResponseCode, Response
+from fastapi_template.app.core.db import db
 
 
 class HttpException(Exception):
@@ -78,6 +79,8 @@ async def http_exception_handler(request: Request, exception: HttpException):
 
     """
     logger.exception("Unhandled exception")
+    # the writes of the failed request are not committed
+    db.set_rollback_only()
     headers = getattr(exception, "headers", None)
     return Response.fail(code=exception.code,
                          status_code=exception.status_code,
@@ -0,0 +1,89 @@
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from fastapi_template.app.core.etag import body_etag, etag_matches, parse_if_none_match, request_etags, search_etags
+
+# the headers a 304 keeps from the response it replaces
+_NOT_MODIFIED_HEADERS = {"cache-control", "content-location", "date", "etag", "expires", "vary", "x-request-id"}
+_SAFE_METHODS = ("GET", "HEAD")
+
+
+class ConditionalRequestMiddleware:
+    """
+    Pure ASGI middleware answering the GET requests with a matching If-None-Match with a 304 and no body.
+    The `Response` tags its successful content, the other complete bodies are tagged with their hash here.
+    The If-None-Match of the other methods is only handed to the routes, those declaring themselves read-only
+    with `Response(conditional=True)` answer it, the others run their side effects and ignore it.
+    It sits inside the GZipMiddleware, the 304 are never compressed
+    """
+
+    def __init__(self, app: ASGIApp, methods: Optional[List[str]] = None):
+        self.app = app
+        self.methods = {method.upper() for method in methods or ["GET", "HEAD"]}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            await self.app(scope, receive, send)
+            return
+        tags = parse_if_none_match(Headers(scope=scope).get("if-none-match", ""))
+        if scope["method"] not in _SAFE_METHODS:
+            token = search_etags.set(tags)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                search_etags.reset(token)
+            return
+        token = request_etags.set(tags)
+        start: Optional[Message] = None
+        not_modified = False
+
+        async def send_conditional(message: Message):
+            nonlocal start, not_modified
+            if message["type"] == "http.response.start":
+                if message["status"] != 200:
+                    await send(message)
+                    return
+                etag = MutableHeaders(raw=message["headers"]).get("etag")
+                if etag is None:
+                    # wait for the body to tag it
+                    start = message
+                    return
+                if etag_matches(etag, tags):
+                    not_modified = True
+                    message = self._not_modified(message)
+                await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if not_modified:
+                if not message.get("more_body", False):
+                    await send({"type": "http.response.body", "body": b""})
+                return
+            if start is not None:
+                held, start = start, None
+                if message.get("more_body", False):
+                    # streamed, not tagged
+                    await send(held)
+                    await send(message)
+                    return
+                etag = body_etag(message.get("body", b""))
+                MutableHeaders(raw=held["headers"])["etag"] = etag
+                if etag_matches(etag, tags):
+                    await send(self._not_modified(held))
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                await send(held)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_conditional)
+        finally:
+            request_etags.reset(token)
+
+    @staticmethod
+    def _not_modified(message: Message) -> Message:
+        headers = [(key, value) for key, value in message["headers"] if key.decode("latin-1") in _NOT_MODIFIED_HEADERS]
+        return {"type": "http.response.start", "status": 304, "headers": headers}
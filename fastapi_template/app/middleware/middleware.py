@@ -7,9 +7,11 @@ from starlette.middleware.gzip import GZipMiddleware
 
 from fastapi_template.app.api.router import api_router
 from fastapi_template.app.core.db.session import SQLAlchemyMiddleware
+from fastapi_template.app.core.db.engine import create_engines
 from fastapi_template.app.core.log.logging import CustomizeLogger
 from fastapi_template.app.core.static import mount_static
 from fastapi_template.app.exception.handler import HttpException, http_exception_handler
+from fastapi_template.app.middleware.etag_middleware import ConditionalRequestMiddleware
 from fastapi_template.config import settings
 
 
@@ -26,6 +28,9 @@ class GlobalMiddlewares:
                                 generator=lambda: uuid4().hex,
                                 transformer=lambda a: a,
                                 )
+        # 304 for the conditional requests, inside the gzip compression
+        if settings.ETAG_ENABLED:
+            self.app.add_middleware(ConditionalRequestMiddleware, methods=settings.ETAG_METHODS)
         # gzip compress
         self.app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
         # Set all CORS enabled origins
@@ -41,13 +46,16 @@ class GlobalMiddlewares:
         self.app.include_router(api_router, prefix=settings.API_PREFIX)
         self.app.add_exception_handler(HttpException, http_exception_handler)
         # for db
+        primary, readers = create_engines()
         self.app.add_middleware(
             SQLAlchemyMiddleware,
-            db_url=settings.SQLALCHEMY_DATABASE_URI,
-            engine_args={
-                "echo": False,
-                "pool_pre_ping": True,
-            },
+            custom_engine=primary,
+            replica_engines=readers,
+            replica_strategy=settings.DATABASE_REPLICA_STRATEGY,
+            read_your_writes=settings.DATABASE_READ_YOUR_WRITES,
+            # without replica urls the only reader is the one of the sqlite profile, on the same file
+            replica_lag=bool(settings.SQLALCHEMY_REPLICA_URIS),
+            unit_of_work=settings.DATABASE_REQUEST_UNIT_OF_WORK,
         )
         # TODO: for jwt token verification, swagger security not works...???
         # self.app.add_middleware(AuthenticationMiddleware, backend=JWTAuthenticationBackend())
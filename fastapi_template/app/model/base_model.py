@@ -1,6 +1,6 @@
 import datetime
 
-from sqlalchemy import Column, Text, Integer, text
+from sqlalchemy import Column, Text, Integer, Index, text
 from sqlalchemy.orm import declared_attr, declarative_base
 
 from fastapi_template.app.util.snowflake import SnowflakeGenerator
@@ -10,6 +10,20 @@ Base = declarative_base()
 gen = SnowflakeGenerator(settings.SNOWFLAKE_INSTANCE)
 
 
+def next_id() -> int:
+    # the generator yields None once the sequence of the current millisecond is used up, wait for the next one
+    item_id = next(gen)
+    while item_id is None:
+        item_id = next(gen)
+    return item_id
+
+
+def active_index(name: str, *columns: str) -> Index:
+    # partial index on the active rows where the dialect supports it (sqlite, postgresql), a full index elsewhere
+    where = text("is_active = 1")
+    return Index(name, *columns, sqlite_where=where, postgresql_where=where)
+
+
 class BaseSQLModel(Base):
     __abstract__ = True
 
@@ -17,7 +31,7 @@ class BaseSQLModel(Base):
     def __tablename__(cls) -> str:
         return cls.__name__
 
-    id = Column(Integer, primary_key=True, default=gen.__next__)
+    id = Column(Integer, primary_key=True, default=next_id)
     create_time = Column(Text, nullable=False, default="")
     update_time = Column(Text, nullable=False, default=datetime.datetime.utcnow())
     create_by = Column(Text, nullable=False, default="system")
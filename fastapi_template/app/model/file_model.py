@@ -1,9 +1,15 @@
 from sqlalchemy import Column, Text, text
 
-from fastapi_template.app.model.base_model import BaseSQLModel
+from fastapi_template.app.model.base_model import BaseSQLModel, active_index
 
 
 class FileInfo(BaseSQLModel):
+    __table_args__ = (
+        # the listings of the active files, in id order and newest first
+        active_index("ix_file_info_active_id", "id"),
+        active_index("ix_file_info_active_create_time", "create_time", "id"),
+    )
+
     file_key = Column(Text, nullable=False)
     file_url = Column(Text, nullable=False)
     file_name = Column(Text, server_default=text("''"))
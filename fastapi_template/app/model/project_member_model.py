@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Index, Integer
 
 from fastapi_template.app.model.base_model import BaseSQLModel
 
 
 class ProjectMember(BaseSQLModel):
+    __table_args__ = (
+        Index("ix_project_member_project_id_user_id", "project_id", "user_id"),
+    )
+
     project_id = Column(Integer, nullable=False)
     user_id = Column(Integer, nullable=False)
@@ -1,8 +1,13 @@
 from sqlalchemy import Column, Text, text
 
-from fastapi_template.app.model.base_model import BaseSQLModel
+from fastapi_template.app.model.base_model import BaseSQLModel, active_index
 
 
 class Role(BaseSQLModel):
+    __table_args__ = (
+        # the listings of the active roles, in id order
+        active_index("ix_role_active_id", "id"),
+    )
+
     name = Column(Text, nullable=False, unique=True)
     description = Column(Text, nullable=False, server_default=text("''"))
@@ -1,9 +1,16 @@
-from sqlalchemy import Column, Text, text
+from sqlalchemy import Column, Index, Text, text
 
-from fastapi_template.app.model.base_model import BaseSQLModel
+from fastapi_template.app.model.base_model import BaseSQLModel, active_index
 
 
 class User(BaseSQLModel):
+    __table_args__ = (
+        # the login and the duplicate checks
+        Index("ix_user_user_name", "user_name"),
+        # the listings of the active users, in id order
+        active_index("ix_user_active_id", "id"),
+    )
+
     user_name = Column(Text, nullable=False, server_default=text("''"))
     password = Column(Text, nullable=False, server_default=text("''"))
 
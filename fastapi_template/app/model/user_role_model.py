@@ -1,8 +1,15 @@
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Index, Integer
 
-from fastapi_template.app.model.base_model import BaseSQLModel
+from fastapi_template.app.model.base_model import BaseSQLModel, active_index
 
 
 class UserRole(BaseSQLModel):
+    __table_args__ = (
+        Index("ix_user_role_user_id", "user_id"),
+        Index("ix_user_role_role_id", "role_id"),
+        # the active roles of a user, without reading the table
+        active_index("ix_user_role_active_user_id_role_id", "user_id", "role_id"),
+    )
+
     user_id = Column(Integer, nullable=False)
     role_id = Column(Integer, nullable=False)
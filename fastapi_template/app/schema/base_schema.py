@@ -1,6 +1,6 @@
 import uuid
 from enum import Enum
-from typing import TypeVar
+from typing import Optional, TypeVar
 
 from pydantic import BaseModel, conint, create_model
 
@@ -12,6 +12,32 @@ class OrderEnum(str, Enum):
     descendent = "descendent"
 
 
+class ExportFormatEnum(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class TotalStrategyEnum(str, Enum):
+    # COUNT(*) before every page
+    count = "count"
+    # COUNT(*) OVER() on the page rows
+    window = "window"
+    # COUNT(*) cached until expired or written
+    cached = "cached"
+    # no total, only has_next
+    none = "none"
+
+
+class RowFormatEnum(str, Enum):
+    # schema.parse_obj on every row
+    validated = "validated"
+    # schemas built without validation from our own database rows
+    trusted = "trusted"
+    # plain dicts and tuples, serialized as they are
+    dict = "dict"
+    tuple = "tuple"
+
+
 class TokenType(str, Enum):
     ACCESS = "access_token"
     REFRESH = "refresh_token"
@@ -20,13 +46,24 @@ class TokenType(str, Enum):
 class BasePageParamModel(BaseModel):
     page: int = 1
     size: int = 50
+    # keyset pagination, send "" for the first page and then the `next_cursor` of the previous page
+    cursor: Optional[str] = None
 
 
 class BasePageResponseModel(BaseModel):
-    total: int = 0
+    # None with the `none` total strategy
+    total: Optional[int] = 0
     items: list = []
     page: conint(ge=1)  # type: ignore
     size: conint(ge=1)  # type: ignore
+    has_next: Optional[bool] = None
+
+
+class BaseCursorPageResponseModel(BaseModel):
+    items: list = []
+    size: conint(ge=1)  # type: ignore
+    next_cursor: Optional[str] = None
+    has_next: bool = False
 
 
 class BaseSchemaModel(BaseModel):
@@ -1,11 +1,9 @@
 import datetime
-from typing import Optional
 
 from fastapi_template.app import model, crud, service
 from fastapi_template.app.core import ResponseCode
 from fastapi_template.app.core.auth.security import create_access_token, verify_password
 from fastapi_template.app.exception.handler import HttpException
-from fastapi_template.app.model.user_model import User
 from fastapi_template.app.schema.auth_schema import TokenPayload, TokenResponse, AuthLoginRequest
 
 
@@ -16,9 +14,11 @@ class AuthService:
         password = form_data.password
         if not (username and password):
             raise HttpException(ResponseCode.USER_PASSWORD_EMPTY)
-        user_data: Optional[User] = await crud.user.query_by_username(username=username)
-        if not user_data:
+        # the user and its roles in one query
+        user_with_roles = await crud.user.query_with_role_names(username=username)
+        if not user_with_roles:
             raise HttpException(ResponseCode.USER_NOT_FOUND)
+        user_data, role_names = user_with_roles
         store_password = user_data.password
         valid_password = verify_password(password, store_password)
         if not valid_password:
@@ -26,7 +26,8 @@ class AuthService:
         if not user_data.is_active:
             raise HttpException(ResponseCode.USER_DISABLED)
         # get user roles
-        user_detail = await service.user.get_user_detail(user_id=user_data.id, user_data=user_data)
+        user_detail = await service.user.get_user_detail(user_id=user_data.id, user_data=user_data,
+                                                         role_names=role_names)
         # create the oauth jwt token
         token_payload = TokenPayload()
         token_payload.upn = user_detail['id']
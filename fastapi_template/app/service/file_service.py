@@ -1,6 +1,7 @@
 import os
 import uuid
 from pathlib import Path
+from typing import Union, AsyncIterator
 
 import aiofiles
 from fastapi import UploadFile
@@ -13,6 +14,7 @@ from fastapi_template.app import crud
 from fastapi_template.app.core import ResponseCode
 from fastapi_template.app.exception.handler import HttpException
 from fastapi_template.app.model.file_model import FileInfo
+from fastapi_template.app.schema.base_schema import BaseCursorPageResponseModel, ExportFormatEnum
 from fastapi_template.app.schema.file_schema import FileCreateRequest, FileResponse, FileSearchRequest
 from fastapi_template.config import settings
 
@@ -49,9 +51,14 @@ class FileService:
         resp = FileResponse(file_key=file_key, file_url=access_url, upload_time=created_file.update_time)
         return resp
 
-    async def list_files(self, search: FileSearchRequest) -> Page[FileInfo]:
+    async def list_files(self, search: FileSearchRequest) -> Union[Page[FileInfo], BaseCursorPageResponseModel]:
         page_num = search.page
         page_size = search.size
+        if search.cursor is not None:
+            return await crud.file.list_keyset(query=select(FileInfo).where(FileInfo.is_active == 1),
+                                               cursor=search.cursor,
+                                               size=page_size,
+                                               order_by="create_time")
         params = Params(page=page_num, size=page_size)
         results: Page[FileInfo] = await crud.file.list_paginated_ordered(
             query=select(FileInfo).where(FileInfo.is_active == 1).order_by(FileInfo.create_time.desc()),
@@ -59,5 +66,12 @@ class FileService:
         )
         return results
 
+    async def export_files(self, export_format: ExportFormatEnum) -> AsyncIterator[bytes]:
+        query = select(FileInfo.id, FileInfo.file_key, FileInfo.file_url, FileInfo.file_name, FileInfo.file_size,
+                       FileInfo.content_type, FileInfo.create_by,
+                       FileInfo.create_time).where(FileInfo.is_active == 1).order_by(FileInfo.id)
+        async for chunk in crud.file.export(query=query, export_format=export_format):
+            yield chunk
+
 
 file = FileService()
@@ -1,13 +1,15 @@
-from typing import Any
+from typing import Any, AsyncIterator
 
 from fastapi_pagination import Params
 from sqlalchemy import select, and_, text
 
 from fastapi_template.app import crud
 from fastapi_template.app.core import ResponseCode
+from fastapi_template.app.core.cache import invalidate_tags
+from fastapi_template.app.core.db import db
 from fastapi_template.app.exception.handler import HttpException
 from fastapi_template.app.model.role_model import Role
-from fastapi_template.app.schema.base_schema import IdResponse
+from fastapi_template.app.schema.base_schema import IdResponse, ExportFormatEnum
 from fastapi_template.app.schema.role_schema import RoleCreateRequest, RoleSearchRequest, RoleUpdateRequest
 
 
@@ -24,13 +26,16 @@ class RoleService:
         updated_role = await crud.role.update_by_id(item_id=item_id, update_schema=new_role)
         if updated_role is None:
             raise HttpException(code=ResponseCode.ROLE_NOT_FOUND)
+        # the cached users carry the role names, dropped again after the commit of a unit of work
+        await invalidate_tags([f"role:{item_id}", "role:*"], db.session)
         resp = IdResponse(id=updated_role.id)
         return resp
 
     async def inactive_role(self, user_id: int, update_by=None):
-        user = await crud.role.inactive(item_id=user_id, update_by=update_by)
+        user = await crud.role.inactive(item_id=user_id, update_by=update_by, direct=True)
         if user is None:
             raise HttpException(code=ResponseCode.ROLE_NOT_FOUND)
+        await invalidate_tags([f"role:{user_id}", "role:*"], db.session)
         resp = IdResponse(id=user.id)
         return resp
 
@@ -39,9 +44,17 @@ class RoleService:
         query = select(Role).where(and_(
             Role.name.like(f"%{name}%") if name else text("1=1")),
             Role.is_active == 1).order_by(Role.id.desc())
+        if role_search.cursor is not None:
+            return await crud.role.list_keyset(query=query, cursor=role_search.cursor, size=role_search.size)
         params = Params(page=role_search.page, size=role_search.size)
         results = await crud.role.list_paginated_ordered(query=query, params=params)
         return results
 
+    async def export_roles(self, export_format: ExportFormatEnum) -> AsyncIterator[bytes]:
+        query = select(Role.id, Role.name, Role.description, Role.create_time,
+                       Role.update_time).where(Role.is_active == 1).order_by(Role.id)
+        async for chunk in crud.role.export(query=query, export_format=export_format):
+            yield chunk
+
 
 role = RoleService()
@@ -1,39 +1,21 @@
 import copy
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union, AsyncIterator, List
 
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
-from fastapi_cache.decorator import cache
 from fastapi_pagination import Page
 from sqlalchemy import select, and_
-from starlette.requests import Request
-from starlette.responses import Response
 
 from fastapi_template.app import crud
 from fastapi_template.app.core import ResponseCode
 from fastapi_template.app.core.auth.security import create_hash_password
+from fastapi_template.app.core.cache import cached, invalidate_tags, key_builder
+from fastapi_template.app.core.db import db
 from fastapi_template.app.exception.handler import HttpException
 from fastapi_template.app.model.role_model import Role
 from fastapi_template.app.model.user_model import User
-from fastapi_template.app.schema.base_schema import IdResponse
+from fastapi_template.app.schema.base_schema import IdResponse, BaseCursorPageResponseModel, ExportFormatEnum
 from fastapi_template.app.schema.user_schema import (UserDetailResponse, UserSearchRequest, UserCreateRequest,
                                                      UserUpdateRequest, UserRoleRequest)
-from fastapi_template.config import constants
-
-
-def cache_key_builder(
-        func,
-        namespace: Optional[str] = "",
-        request: Request = None,
-        response: Response = None,
-        *args,
-        **kwargs,
-):
-    prefix = FastAPICache.get_prefix()
-    user_id = kwargs['kwargs'].get("user_id") if kwargs['kwargs'].get("user_id", None) else (
-        f"{func.__module__}:{func.__name__}:{args}:{kwargs}")
-    cache_key = f"{namespace}:{prefix}:{user_id}"
-    return cache_key
+from fastapi_template.config import constants, settings
 
 
 class UserService:
@@ -52,45 +34,56 @@ class UserService:
     async def update_user(self, update_user: UserUpdateRequest, update_by: Any = None):
         item_id = update_user.id
         new_user = UserUpdateRequest.create_model(update_by=update_by)(**update_user.dict())
-        updated_user = await crud.user.update_by_id(item_id=item_id, update_schema=new_user)
+        updated_user = await crud.user.update_by_id(item_id=item_id, update_schema=new_user, direct=True)
         if updated_user is None:
             raise HttpException(code=ResponseCode.USER_NOT_FOUND)
+        # again after the commit of a unit of work, a concurrent read may cache the row before it
+        await invalidate_tags([f"user:{item_id}"], db.session)
         resp = IdResponse(id=updated_user.id)
         return resp
 
     async def inactive_user(self, user_id: int, update_by: None):
-        user = await crud.user.inactive(item_id=user_id, update_by=update_by)
+        user = await crud.user.inactive(item_id=user_id, update_by=update_by, direct=True)
         if user is None:
             raise HttpException(code=ResponseCode.USER_NOT_FOUND)
+        await invalidate_tags([f"user:{user_id}"], db.session)
         resp = IdResponse(id=user.id)
         return resp
 
-    @cache(key_builder=cache_key_builder, namespace=constants.CACHE_USER_NAMESPACE)
-    async def get_user_detail(self, user_id: int, user_data: User = None) -> Optional[Dict]:
-        # get user roles
-        if user_data is None:
-            user_data = await crud.user.get_by_id(item_id=user_id)
-        if not user_data:
-            return None
+    # the user and the role names are only given to fill the cache, the key is the user id
+    @cached(key_builder=key_builder("user_id"), namespace=constants.CACHE_USER_NAMESPACE,
+            stale_seconds=settings.CACHE_STALE_SECONDS, refresh_scope=db, tags=["user:{user_id}", "role:*"])
+    async def get_user_detail(self, user_id: int, user_data: User = None,
+                              role_names: List[str] = None) -> Optional[Dict]:
+        # get the user and its roles in one query, unless the caller has them already
+        if user_data is None or role_names is None:
+            user_with_roles = await crud.user.query_with_role_names(user_id=user_id)
+            if user_with_roles is None:
+                return None
+            user_data, role_names = user_with_roles
         if not user_data.is_active:
             return None
-        user_role_data = await crud.user_role.query_by_user_id(user_id=user_id)
-        if not user_role_data:
-            role_names = []
-        else:
-            role_ids = list(map(lambda d: d.role_id, user_role_data))
-            role_datas = await crud.role.get_by_ids(list_ids=role_ids)
-            role_names = list(map(lambda d: d.name, role_datas))
         user_detail = UserDetailResponse.from_orm(user_data)
         user_detail.role = role_names
         return user_detail.dict()
 
-    async def get_users(self, user_request: UserSearchRequest) -> Page[UserDetailResponse]:
+    async def get_users(self, user_request: UserSearchRequest
+                        ) -> Union[Page[UserDetailResponse], BaseCursorPageResponseModel]:
+        if user_request.cursor is not None:
+            return await crud.user.get_user_list_keyset(name=user_request.name,
+                                                        cursor=user_request.cursor,
+                                                        page_size=user_request.size)
         schemas = await crud.user.get_user_list(name=user_request.name,
                                                 page=user_request.page,
                                                 page_size=user_request.size)
         return schemas
 
+    async def export_users(self, export_format: ExportFormatEnum) -> AsyncIterator[bytes]:
+        query = select(User.id, User.user_name, User.nick_name, User.email, User.avatar, User.last_login_time,
+                       User.create_time).where(User.is_active == 1).order_by(User.id)
+        async for chunk in crud.user.export(query=query, export_format=export_format):
+            yield chunk
+
     async def assign_role(self, user_role: UserRoleRequest, create_by: int = None):
         user_id = user_role.user_id
         roles = user_role.roles
@@ -104,12 +97,11 @@ class UserService:
             raise HttpException(code=ResponseCode.ROLE_NOT_FOUND)
         if len(role_ids) != len(roles):
             raise HttpException(code=ResponseCode.USER_ROLE_INVALID)
-        created_data = await crud.user_role.add_user_role(user_id=user_id, roles=role_ids, created_by=create_by)
+        # the old roles are deleted and the new ones added in one commit
+        async with db.transaction() as session:
+            created_data = await crud.user_role.add_user_role(user_id=user_id, roles=role_ids, created_by=create_by)
+            await invalidate_tags([f"user:{user_id}"], session)
         resp = list(map(lambda a: IdResponse(id=a.id), created_data))
-        # TODO explicit refresh the user role cache
-        backend: InMemoryBackend = FastAPICache.get_backend()
-        cache_key = f"{FastAPICache.get_prefix()}:{user_id}"
-        count = await backend.clear(namespace=constants.CACHE_USER_NAMESPACE, key=cache_key)
         return resp
 
 
@@ -0,0 +1,25 @@
+# Opaque continuation tokens for keyset (cursor) pagination.
+# The token is the url-safe base64 of the json encoded seek values, e.g. `[order_value, id]`.
+import base64
+import binascii
+from typing import Any, List
+
+import orjson
+
+__all__ = ('encode_cursor', 'decode_cursor')
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = orjson.dumps(values, default=str)
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    padding = "=" * (-len(cursor) % 4)
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return values
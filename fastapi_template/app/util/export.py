@@ -0,0 +1,49 @@
+# Encode streamed rows as NDJSON or CSV chunks for a StreamingResponse.
+import csv
+import io
+from typing import Any, AsyncIterator, Dict, List, Mapping
+
+import orjson
+
+from fastapi_template.app.schema.base_schema import ExportFormatEnum
+
+__all__ = ('export_rows', 'export_headers', 'EXPORT_MEDIA_TYPES')
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormatEnum.ndjson: "application/x-ndjson",
+    ExportFormatEnum.csv: "text/csv",
+}
+
+
+def export_headers(name: str, export_format: ExportFormatEnum) -> Dict[str, str]:
+    return {"Content-Disposition": f'attachment; filename="{name}.{export_format.value}"'}
+
+
+async def export_rows(rows: AsyncIterator[Mapping[str, Any]],
+                      columns: List[str],
+                      export_format: ExportFormatEnum,
+                      batch_size: int = 1000) -> AsyncIterator[bytes]:
+    """Encode the rows batch by batch, one chunk is yielded per `batch_size` rows."""
+    encode = _encode_csv if export_format == ExportFormatEnum.csv else _encode_ndjson
+    if export_format == ExportFormatEnum.csv:
+        # the header goes out at once, before the first batch is fetched
+        yield _encode_csv([dict(zip(columns, columns))], columns)
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield encode(batch, columns)
+            batch = []
+    if batch:
+        yield encode(batch, columns)
+
+
+def _encode_ndjson(batch: List[Mapping[str, Any]], columns: List[str]) -> bytes:
+    return b"".join(orjson.dumps({column: row[column] for column in columns}, default=str) + b"\n"
+                    for row in batch)
+
+
+def _encode_csv(batch: List[Mapping[str, Any]], columns: List[str]) -> bytes:
+    output = io.StringIO()
+    csv.writer(output).writerows([row[column] for column in columns] for row in batch)
+    return output.getvalue().encode("utf-8")
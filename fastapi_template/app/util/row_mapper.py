@@ -0,0 +1,86 @@
+# Map raw result rows to schemas, dicts or tuples, with the field maps precomputed per (schema, columns).
+from functools import lru_cache
+from typing import Any, Callable, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+from pydantic.fields import ModelField, SHAPE_SINGLETON
+
+from fastapi_template.app.schema.base_schema import RowFormatEnum
+
+__all__ = ('row_mapper',)
+
+# the scalar types the trusted path still coerces to, e.g. the integer ids of `id: str` fields
+_COERCED_TYPES = (str, int, float)
+
+
+def row_mapper(columns: Sequence[str],
+               schema: Optional[Type[BaseModel]] = None,
+               row_format: RowFormatEnum = RowFormatEnum.validated) -> Callable[[Sequence[Any]], Any]:
+    """
+    Get the function mapping a result row, a sequence of the `columns` values, to the row format.
+    Without schema the rows are mapped by their columns, else by the schema fields
+    :param columns: the result columns, extra trailing row values are ignored
+    :param schema: pydantic schema object
+    :param row_format:
+    :return:
+    """
+    return _row_mapper(tuple(columns), schema, RowFormatEnum(row_format))
+
+
+@lru_cache(maxsize=256)
+def _row_mapper(columns: Tuple[str, ...],
+                schema: Optional[Type[BaseModel]],
+                row_format: RowFormatEnum) -> Callable[[Sequence[Any]], Any]:
+    if schema is None:
+        if row_format == RowFormatEnum.tuple:
+            width = len(columns)
+            return lambda row: tuple(row[:width])
+        return lambda row: dict(zip(columns, row))
+    if row_format == RowFormatEnum.validated:
+        return lambda row: schema.parse_obj(dict(zip(columns, row)))
+
+    positions = {column: index for index, column in enumerate(columns)}
+    allow_name = schema.__config__.allow_population_by_field_name
+    # per schema field in order: (name, row index or None, converter or field of the default)
+    field_map = []
+    for name, field in schema.__fields__.items():
+        index = positions.get(field.alias)
+        if index is None and allow_name:
+            index = positions.get(name)
+        if index is None:
+            field_map.append((name, None, field))
+        else:
+            field_map.append((name, index, _converter(field)))
+    fields_set = frozenset(name for name, index, _ in field_map if index is not None)
+
+    def to_dict(row: Sequence[Any]) -> dict:
+        values = {}
+        for name, index, extra in field_map:
+            if index is None:
+                values[name] = extra.get_default()
+            else:
+                value = row[index]
+                values[name] = value if extra is None else extra(value)
+        return values
+
+    if row_format == RowFormatEnum.dict:
+        return to_dict
+    if row_format == RowFormatEnum.tuple:
+        return lambda row: tuple(to_dict(row).values())
+
+    def to_schema(row: Sequence[Any]) -> BaseModel:
+        # what BaseModel.construct does, without looking the fields up again
+        model = schema.__new__(schema)
+        object.__setattr__(model, "__dict__", to_dict(row))
+        object.__setattr__(model, "__fields_set__", set(fields_set))
+        model._init_private_attributes()
+        return model
+
+    return to_schema
+
+
+def _converter(field: ModelField) -> Optional[Callable[[Any], Any]]:
+    if field.shape != SHAPE_SINGLETON or field.type_ not in _COERCED_TYPES:
+        return None
+    field_type = field.type_
+    return lambda value: value if value is None or type(value) is field_type else field_type(value)
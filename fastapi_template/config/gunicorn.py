@@ -203,6 +203,10 @@ proc_name = None
 #
 #       A callable that takes a server instance as the sole argument.
 #
+#   on_exit - Called just before exiting Gunicorn.
+#
+#       A callable that takes a server instance as the sole argument.
+#
 
 
 def post_fork(server, worker):
@@ -220,11 +224,28 @@ def pre_exec(server):
     server.log.info("Forked child, re-executing.")
 
 
+def on_starting(server):
+    """Execute just before the master process is initialized."""
+    # the workers key the directory of their cache invalidation bus on this master, see `default_directory`
+    from fastapi_template.app.core.cache import MASTER_PID_ENV
+
+    os.environ[MASTER_PID_ENV] = str(os.getpid())
+
+
 def when_ready(server):
     """Execute just after the server is started."""
     server.log.info("Server is ready. Spawning workers")
 
 
+def on_exit(server):
+    """Execute just before exiting Gunicorn."""
+    # the sockets of the cache invalidation bus of the workers, see `CACHE_BUS_DIR`
+    import shutil
+    from fastapi_template.app.core.cache import default_directory
+
+    shutil.rmtree(default_directory(os.getpid()), ignore_errors=True)
+
+
 def worker_int(worker):
     """Execute just after a worker exited on SIGINT or SIGQUIT."""
     worker.log.info("worker received INT or QUIT signal")
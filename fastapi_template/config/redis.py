@@ -17,6 +17,8 @@ class Redis(BaseSettings):
         * FASTAPI_REDIS_USERNAME
         * FASTAPI_REDIS_PASSWORD
         * FASTAPI_REDIS_USE_SENTINEL
+        * FASTAPI_REDIS_DB
+        * FASTAPI_REDIS_SOCKET_TIMEOUT
 
     Attributes:
         REDIS_HOTS (str): Redis host.
@@ -24,6 +26,8 @@ class Redis(BaseSettings):
         REDIS_USERNAME (str): Redis username.
         REDIS_PASSWORD (str): Redis password.
         REDIS_USE_SENTINEL (bool): If provided Redis config is for Sentinel.
+        REDIS_DB (int): Redis database of the cache, flushed by a full cache clear.
+        REDIS_SOCKET_TIMEOUT (float): Seconds before a Redis call fails over to the near cache.
 
     """
 
@@ -32,6 +36,8 @@ class Redis(BaseSettings):
     REDIS_USERNAME: str = None
     REDIS_PASSWORD: str = None
     REDIS_USE_SENTINEL: bool = False
+    REDIS_DB: int = 0
+    REDIS_SOCKET_TIMEOUT: float = 0.5
 
     class Config:
         """Config sub-class needed to customize BaseSettings settings.
@@ -28,6 +28,10 @@ class Settings(BaseSettings):
     # "http://localhost:8080", "http://local.dockertoolbox.tiangolo.com"]'
     ALLOW_CORS_ORIGINS: List[str] = ["*"]
     GZIP_MINIMUM_SIZE: int = 500
+    # answer the requests with a matching If-None-Match with a 304. The list endpoints are POST searches,
+    # the If-None-Match of a POST is only answered by the routes opting in, see `Response(conditional=True)`
+    ETAG_ENABLED: bool = True
+    ETAG_METHODS: List[str] = ["GET", "HEAD", "POST"]
 
     @validator("ALLOW_CORS_ORIGINS", pre=True)
     def assemble_cors_origins(cls, v: Union[str, List[str]]) -> Union[List[str], str]:
@@ -39,13 +43,75 @@ class Settings(BaseSettings):
 
     # https://flask-sqlalchemy.palletsprojects.com/en/2.x/config/
     SQLALCHEMY_DATABASE_URI: str = None
+    # read replicas of SQLALCHEMY_DATABASE_URI as a JSON list, the reads of BaseCrud are routed to them
+    SQLALCHEMY_REPLICA_URIS: List[str] = []
+    # how a replica is picked: round_robin or least_busy
+    DATABASE_REPLICA_STRATEGY: str = "round_robin"
+    # the reads of a request go to the primary after it writes
+    DATABASE_READ_YOUR_WRITES: bool = True
+    # opt-in, a request is one unit of work: the BaseCrud writes flush, one commit before the response,
+    # rollback on error. The cache invalidations of the writes must be given the session, see `invalidate_tags`
+    DATABASE_REQUEST_UNIT_OF_WORK: bool = False
     DATABASE_ENGINE_POOL_SIZE: int = 83
     DATABASE_ENGINE_MAX_OVERFLOW: int = 0
+    # pool and statement counters of the engines, see /api/internal/stats
+    DATABASE_STATS_ENABLED: bool = True
+    # statements taking longer are logged with their request id
+    DATABASE_SLOW_QUERY_SECONDS: float = 0.5
+    # pool connections opened per engine at startup, before the worker reports ready
+    DATABASE_WARM_UP_CONNECTIONS: int = 5
+    # opt-in sqlite file profile: WAL and the pragmas below, one writer connection and a read pool per worker,
+    # a request session keeps its reader connection until it closes
+    DATABASE_SQLITE_PROFILE: bool = False
+    DATABASE_SQLITE_READ_POOL_SIZE: int = 5
+    DATABASE_SQLITE_SYNCHRONOUS: str = "NORMAL"
+    # negative values are KiB
+    DATABASE_SQLITE_CACHE_SIZE: int = -20000
+    DATABASE_SQLITE_MMAP_SIZE: int = 128 * 1024 * 1024
+    # milliseconds a connection waits for the lock of another worker
+    DATABASE_SQLITE_BUSY_TIMEOUT: int = 5000
+    # rows per executemany batch of BaseCrud.add_bulk
+    DATABASE_BULK_CHUNK_SIZE: int = 1000
+    # rows fetched per round of BaseCrud.stream
+    DATABASE_STREAM_BATCH_SIZE: int = 1000
+    # default total of the paginated lists: count, window, cached or none
+    DATABASE_PAGE_TOTAL_STRATEGY: str = "count"
+    # how long and how many totals the `cached` strategy keeps per crud
+    DATABASE_COUNT_CACHE_SECONDS: int = 60
+    DATABASE_COUNT_CACHE_SIZE: int = 1024
+    # parsed raw sql statements kept by BaseCrud.execute
+    DATABASE_STATEMENT_CACHE_SIZE: int = 256
+    # batch and memoize BaseCrud.get_by_id / get_by_ids per request session
+    DATABASE_BATCH_LOADER: bool = True
+    # seconds the rows of the cruds with an entity cache are cached by id
+    DATABASE_ENTITY_CACHE_SECONDS: int = 300
+    # results of the list and raw sql queries of the cruds with a query cache, kept per worker until a write
+    # through a crud to one of the tables read, or at most this long for the writes outside the cruds
+    DATABASE_QUERY_CACHE_SECONDS: int = 60
+    DATABASE_QUERY_CACHE_SIZE: int = 512
 
     USE_REDIS: bool = False
     # cache
     CACHE_PREFIX: str = "app"
     CACHE_EXPIRED_SECONDS: int = 600
+    # seconds an expired user detail is still served while one task refreshes it, 0 to wait for the refresh
+    CACHE_STALE_SECONDS: int = 30
+    # bounds of the in-process cache of every worker, the least recently used entries are evicted first
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # seconds between the sweeps of the expired cache entries
+    CACHE_CLEANUP_SECONDS: int = 60
+    # apply the cache clears to all the workers of the gunicorn master, over unix datagram sockets
+    CACHE_BUS_ENABLED: bool = True
+    # directory of the sockets of the workers, empty for a temporary directory per gunicorn master,
+    # set it when the workers are started by another process manager, each of them is alone otherwise
+    CACHE_BUS_DIR: str = ""
+    # with USE_REDIS: the bounds and the lifetime of the near cache of every worker in front of redis,
+    # and how long redis is left alone after a failure
+    CACHE_NEAR_MAX_ENTRIES: int = 1000
+    CACHE_NEAR_MAX_BYTES: int = 8 * 1024 * 1024
+    CACHE_NEAR_TTL_SECONDS: int = 5
+    CACHE_REDIS_RETRY_SECONDS: int = 30
     # snowflake
     SNOWFLAKE_INSTANCE: int = 10
 
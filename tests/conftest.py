@@ -0,0 +1,89 @@
+import os
+import tempfile
+from contextvars import ContextVar
+
+# point the application at a throwaway sqlite database before the settings are loaded
+_db_file = os.path.join(tempfile.mkdtemp(prefix="fastapi_template_"), "test.db")
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite+aiosqlite:///{_db_file}"
+# the application runs on the opt-in sqlite profile, a writer and a reader engine
+os.environ["DATABASE_SQLITE_PROFILE"] = "true"
+
+import pytest  # noqa: E402
+import pytest_asyncio  # noqa: E402
+from fastapi_cache import FastAPICache  # noqa: E402
+from fastapi_cache.coder import JsonCoder  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession  # noqa: E402
+from sqlalchemy.orm import sessionmaker, Session  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+
+from fastapi_template.app.core.auth.security import create_hash_password  # noqa: E402
+from fastapi_template.app.core.cache import MemoryBackend, hashed_key_builder  # noqa: E402
+from fastapi_template.app.core.db import session as session_module  # noqa: E402
+from fastapi_template.app.model import (  # noqa: E402,F401
+    file_model, menu_model, project_member_model, project_model, role_model, setting_model, user_model,
+    user_role_model,
+)
+from fastapi_template.app.model.base_model import Base  # noqa: E402
+from fastapi_template.app.model.role_model import Role  # noqa: E402
+from fastapi_template.app.model.user_model import User  # noqa: E402
+from fastapi_template.app.model.user_role_model import UserRole  # noqa: E402
+from fastapi_template.config import roles, settings  # noqa: E402
+
+_sync_engine = create_engine(f"sqlite:///{_db_file}")
+Base.metadata.create_all(_sync_engine)
+
+ADMIN_USER_NAME = "test_admin"
+ADMIN_PASSWORD = "test_password"
+
+
+@pytest.fixture(scope="session")
+def client():
+    """A client of the application running on the test database, with a super admin seeded."""
+    from fastapi_template.app.asgi import app
+
+    with Session(_sync_engine) as session:
+        admin = User(user_name=ADMIN_USER_NAME, password=create_hash_password(ADMIN_PASSWORD))
+        role = Role(name=roles.SUPER_ADMIN_ROLE, description="super admin")
+        session.add_all([admin, role])
+        session.flush()
+        session.add(UserRole(user_id=admin.id, role_id=role.id))
+        session.commit()
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    response = client.post(f"{settings.API_PREFIX}/auth/login",
+                           json={"username": ADMIN_USER_NAME, "password": ADMIN_PASSWORD})
+    return {settings.JWT_TOKEN_HEADER_NAME: response.json()["access_token"]}
+
+
+@pytest.fixture
+def cache_backend(monkeypatch):
+    """A fresh in-process cache installed as the `FastAPICache` backend."""
+    backend = MemoryBackend(cleanup_seconds=0)
+    monkeypatch.setattr(FastAPICache, "_backend", backend)
+    monkeypatch.setattr(FastAPICache, "_coder", JsonCoder)
+    monkeypatch.setattr(FastAPICache, "_key_builder", hashed_key_builder)
+    monkeypatch.setattr(FastAPICache, "_expire", 60)
+    monkeypatch.setattr(FastAPICache, "_enable", True)
+    monkeypatch.setattr(FastAPICache, "_prefix", "test")
+    return backend
+
+
+@pytest_asyncio.fixture
+async def db_session(tmp_path, monkeypatch, cache_backend):
+    """A session on a fresh database, also installed as the current `db.session`, with a fresh cache."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'crud.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(session_module, "_Session", session_factory)
+    session = session_factory()
+    monkeypatch.setattr(session_module, "_session", ContextVar("_session", default=session))
+    yield session
+    await session.close()
+    await engine.dispose()
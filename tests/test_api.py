@@ -0,0 +1,237 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+
+import orjson
+from fastapi import FastAPI
+from fastapi_cache import FastAPICache
+from loguru import logger
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.testclient import TestClient
+
+from fastapi_template.app import crud
+from fastapi_template.app.core import ResponseCode
+from fastapi_template.app.core.db import session as session_module, stats
+from fastapi_template.app.core.db.session import SQLAlchemyMiddleware
+from fastapi_template.app.exception.handler import HttpException, http_exception_handler
+from fastapi_template.app.model.base_model import Base
+from fastapi_template.app.model.role_model import Role
+from fastapi_template.config import constants, roles, settings
+
+
+@contextmanager
+def count_queries():
+    """Count the statements the application sends to the database within the block."""
+    statements = []
+    # the reads and the writes may go to different engines
+    engine = Engine
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def clear_cache():
+    asyncio.run(FastAPICache.get_backend().clear())
+
+
+def create_all(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+
+def test_export_users(client, admin_headers):
+    response = client.get(f"{settings.API_PREFIX}/user/export", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    users = [orjson.loads(line) for line in response.content.splitlines()]
+    assert "test_admin" in [u["user_name"] for u in users]
+    assert all("password" not in u for u in users)
+
+    response = client.get(f"{settings.API_PREFIX}/role/export", params={"format": "csv"}, headers=admin_headers)
+    lines = response.text.splitlines()
+    assert lines[0] == "id,name,description,create_time,update_time"
+    assert any(",SUPER_ADMIN," in line for line in lines[1:])
+
+
+def test_batch_loader_queries(client, admin_headers, monkeypatch):
+    admin_id = client.get(f"{settings.API_PREFIX}/user/detail", headers=admin_headers).json()["data"]["id"]
+    endpoints = {
+        "detail": ("GET", "/user/detail", None),
+        "role": ("POST", "/user/role", {"user_id": admin_id, "roles": [roles.SUPER_ADMIN_ROLE]}),
+    }
+    counts = {}
+    for batch_loader in (False, True):
+        monkeypatch.setattr(settings, "DATABASE_BATCH_LOADER", batch_loader)
+        for name, (method, path, body) in endpoints.items():
+            # the user detail is cached, it is loaded again on every request here
+            clear_cache()
+            with count_queries() as statements:
+                response = client.request(method, f"{settings.API_PREFIX}{path}", json=body, headers=admin_headers)
+            assert response.status_code == 200, response.text
+            counts[name, batch_loader] = len(statements)
+
+    assert counts["detail", True] == counts["detail", False]
+    # the admin loaded by the authentication is not loaded again by the endpoint
+    assert counts["role", True] == counts["role", False] - 1
+
+
+def test_lazy_session(client, admin_headers, monkeypatch):
+    opened = []
+    session_factory = session_module._Session
+    monkeypatch.setattr(session_module, "_Session", lambda **kwargs: opened.append(kwargs) or session_factory(**kwargs))
+
+    assert client.get("/docs").status_code == 200
+    assert opened == []
+
+    clear_cache()
+    assert client.get(f"{settings.API_PREFIX}/user/detail", headers=admin_headers).status_code == 200
+    assert len(opened) == 1
+
+
+def test_internal_stats(client, admin_headers, monkeypatch):
+    for engine_stats in stats._engine_stats.values():
+        monkeypatch.setattr(engine_stats, "slow_query_seconds", 0)
+    logged = []
+    request_id = uuid4().hex
+    clear_cache()
+    handler = logger.add(lambda message: logged.append(message), level="WARNING")
+    try:
+        response = client.get(f"{settings.API_PREFIX}/internal/stats",
+                              headers={**admin_headers, "X-Request-ID": request_id})
+    finally:
+        logger.remove(handler)
+    assert response.status_code == 200
+    engines = response.json()["data"]["database"]["engines"]
+    assert {"primary", "reader_0"} <= set(engines)
+    assert engines["primary"]["checkouts"] > 0 and engines["primary"]["statements"] > 0
+    assert engines["reader_0"]["pool_size"] == settings.DATABASE_SQLITE_READ_POOL_SIZE
+    # timed by the pool class of the engine
+    assert stats._engine_stats["primary"].checkout_wait_seconds > 0
+    assert type(stats._engine_stats["primary"].engine.sync_engine.pool).__name__ == "TimedAsyncAdaptedQueuePool"
+    assert response.json()["data"]["cache"]["max_entries"] == settings.CACHE_MAX_ENTRIES
+    assert any("slow query" in message and f"request_id={request_id}" in message for message in logged)
+
+
+def test_request_unit_of_work(tmp_path, monkeypatch):
+    # the middleware installs its session factory, the one of the application is restored after the test
+    monkeypatch.setattr(session_module, "_Session", session_module._Session)
+    create_all(tmp_path / "unit_of_work.db")
+    app = FastAPI()
+    app.add_exception_handler(HttpException, http_exception_handler)
+
+    @app.post("/roles/{name}")
+    async def add_roles(name: str, fail: bool = False):
+        await crud.role.add(create_schema={"name": name})
+        await crud.role.add_all(create_schemas=[{"name": f"{name}_1"}, {"name": f"{name}_2"}])
+        if fail:
+            # an error response with the 200 status of the application
+            raise HttpException(code=ResponseCode.BAD_REQUEST)
+        return {"name": name}
+
+    app.add_middleware(SQLAlchemyMiddleware, db_url=f"sqlite+aiosqlite:///{tmp_path / 'unit_of_work.db'}",
+                       unit_of_work=True)
+    commits = []
+    listener = lambda session: commits.append(session)  # noqa: E731
+    event.listen(Session, "after_commit", listener)
+    try:
+        with TestClient(app) as test_client:
+            assert test_client.post("/roles/committed").status_code == 200
+            assert len(commits) == 1
+            assert test_client.post("/roles/failed", params={"fail": True}).json()["success"] is False
+            assert len(commits) == 1
+    finally:
+        event.remove(Session, "after_commit", listener)
+
+    with create_engine(f"sqlite:///{tmp_path / 'unit_of_work.db'}").connect() as conn:
+        names = conn.execute(select(Role.name).order_by(Role.name)).scalars().all()
+    assert names == ["committed", "committed_1", "committed_2"]
+
+
+def test_ready(client):
+    response = client.get(f"{settings.API_PREFIX}/internal/ready")
+    assert response.status_code == 200 and response.json()["data"]["ready"] is True
+
+
+def test_user_detail_single_query(client, admin_headers):
+    clear_cache()
+    with count_queries() as statements:
+        response = client.get(f"{settings.API_PREFIX}/user/detail", headers=admin_headers)
+    assert response.json()["data"]["role"] == [roles.SUPER_ADMIN_ROLE]
+    # the authentication loads the user and its roles, the endpoint is served from the cache it filled
+    assert len(statements) == 1
+
+
+def test_user_detail_stale_while_revalidate(client, admin_headers):
+    clear_cache()
+    assert client.get(f"{settings.API_PREFIX}/user/detail", headers=admin_headers).status_code == 200
+    backend = FastAPICache.get_backend()
+    key, entry = next((key, entry) for key, entry in backend._store.items()
+                      if key.startswith(f"{settings.CACHE_PREFIX}:{constants.CACHE_USER_NAMESPACE}:"))
+    # expired, but within the stale window
+    entry.data = "0\n" + entry.data.partition("\n")[2]
+    with count_queries() as statements:
+        response = client.get(f"{settings.API_PREFIX}/user/detail", headers=admin_headers)
+        for _ in range(100):
+            if not backend._store[key].data.startswith("0\n"):
+                break
+            time.sleep(0.01)
+    assert response.json()["data"]["user_name"] == "test_admin"
+    # refreshed in the background, on a session of its own
+    assert len(statements) == 1
+    assert float(backend._store[key].data.partition("\n")[0]) > time.time()
+
+
+def test_conditional_requests(client, admin_headers):
+    url = f"{settings.API_PREFIX}/user/detail"
+    response = client.get(url, headers=admin_headers)
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["etag"] == etag and "content-length" not in response.headers
+    assert client.get(url, headers={**admin_headers, "If-None-Match": 'W/"other"'}).status_code == 200
+
+    # the lists are tagged with the hash of their body, without the timestamp
+    url = f"{settings.API_PREFIX}/role/list"
+    response = client.post(url, json={"page": 1, "size": 10}, headers=admin_headers)
+    etag = response.headers["etag"]
+    # the tag is hashed from the sorted keys, the body keeps the order of the schemas
+    assert list(response.json()) == ["code", "message", "success", "data", "timestamp"]
+    assert list(response.json()["data"]) == ["items", "total", "page", "size"]
+    response = client.post(url, json={"page": 1, "size": 10}, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+    response = client.post(url, json={"page": 1, "size": 1}, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    # the other POST have side effects, they are performed and never answered with a 304
+    response = client.post(f"{settings.API_PREFIX}/auth/login", headers={"If-None-Match": "*"},
+                           json={"username": "test_admin", "password": "test_password"})
+    assert response.status_code == 200 and response.json()["access_token"] and "etag" not in response.headers
+    response = client.post(f"{settings.API_PREFIX}/user/add", json={"user_name": "conditional", "password": "secret"},
+                           headers={**admin_headers, "If-None-Match": "*"})
+    assert response.status_code == 200 and response.json()["success"] is True
+    assert client.post(url, json={"page": 1, "size": 10},
+                       headers={**admin_headers, "If-None-Match": "*"}).status_code == 304
+    # the errors are never tagged
+    assert "etag" not in client.get(url, headers=admin_headers).headers
+    # the other complete bodies are hashed by the middleware
+    etag = client.get("/openapi.json").headers["etag"]
+    assert client.get("/openapi.json", headers={"If-None-Match": f'"x", {etag}'}).status_code == 304
+
+
+def test_user_detail_invalidated_by_tags(client, admin_headers):
+    url = f"{settings.API_PREFIX}/user/detail"
+    detail = client.get(url, headers=admin_headers).json()["data"]
+    response = client.put(f"{settings.API_PREFIX}/user/update", json={"id": detail["id"], "nick_name": "tagged"},
+                          headers=admin_headers)
+    assert response.json()["success"] is True
+    assert client.get(url, headers=admin_headers).json()["data"]["nick_name"] == "tagged"
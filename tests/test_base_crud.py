@@ -1,9 +1,25 @@
+import asyncio
+
 import pytest
+from fastapi_pagination import Params
+from sqlalchemy import event, select
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
-from fastapi_template.app import crud
+from fastapi_template.app import crud, service
+from fastapi_template.app.core.cache import tags
+from fastapi_template.app.core.cache.query import invalidate_tables
+from fastapi_template.app.crud.base_crud import _raw_statement
+from fastapi_template.app.core.db import db
+from fastapi_template.app.exception.handler import HttpException
+from fastapi_template.app.model.file_model import FileInfo
+from fastapi_template.app.model.role_model import Role
+from fastapi_template.app.model.user_model import User
+from fastapi_template.app.model.user_role_model import UserRole
+from fastapi_template.app.schema.base_schema import OrderEnum, ExportFormatEnum, RowFormatEnum, TotalStrategyEnum
 from fastapi_template.app.schema.user_schema import UserDetailResponse
+from fastapi_template.app.util.cursor import encode_cursor
+from fastapi_template.app.util.export import export_rows
 from fastapi_template.config import settings
 
 pytestmark = pytest.mark.asyncio
@@ -23,3 +39,365 @@ async def test_execute_sql():
                                      params={"page":1, "size": 10,"name": "%admin%"},
                                      db_session=_Session)
     print(result)
+
+
+async def test_list_keyset(db_session):
+    for i in range(7):
+        await crud.role.add(create_schema={"name": f"role_{i}", "description": "keyset"}, db_session=db_session)
+
+    seen, cursor = [], ""
+    while True:
+        page = await crud.role.list_keyset(cursor=cursor, size=3, db_session=db_session)
+        seen.extend(item.id for item in page.items)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert seen == sorted(seen, reverse=True)
+    assert len(set(seen)) == 7
+
+    page = await crud.role.list_keyset(cursor="", size=3, order_by="name", order=OrderEnum.ascendent,
+                                       db_session=db_session)
+    page = await crud.role.list_keyset(cursor=page.next_cursor, size=3, order_by="name",
+                                       order=OrderEnum.ascendent, db_session=db_session)
+    assert [item.name for item in page.items] == ["role_3", "role_4", "role_5"]
+
+    # decodable but tampered cursors are bad requests too, not database errors
+    for cursor in ("not-a-cursor", encode_cursor([{"id": 1}]), encode_cursor([[1, 2]]), encode_cursor(["1"]),
+                   encode_cursor([1, 2])):
+        with pytest.raises(HttpException) as error:
+            await crud.role.list_keyset(cursor=cursor, db_session=db_session)
+        assert error.value.status_code == 400
+    with pytest.raises(HttpException):
+        await crud.role.list_keyset(cursor=encode_cursor([1, "role_1"]), order_by="name", db_session=db_session)
+
+
+async def test_add_bulk(db_session):
+    users = [{"user_name": f"bulk_{i}", "password": "secret"} for i in range(25)]
+    ids = await crud.user.add_bulk(create_schemas=users, created_by=1, chunk_size=10, return_ids=True,
+                                   db_session=db_session)
+    assert len(set(ids)) == 25
+
+    created = await crud.user.get_by_ids(list_ids=ids, db_session=db_session)
+    assert sorted(u.user_name for u in created) == sorted(u["user_name"] for u in users)
+    assert all(u.create_by == "1" and u.is_active == 1 for u in created)
+    assert await crud.user.add_bulk(create_schemas=users[:3], db_session=db_session) == 3
+
+
+async def test_upsert_and_update_many(db_session):
+    existing = await crud.role.add(create_schema={"name": "upsert_a", "description": "old"}, db_session=db_session)
+    rows = [{"name": name, "description": "new"} for name in ("upsert_a", "upsert_b", "upsert_c")]
+    assert await crud.role.upsert_many(create_schemas=rows, conflict_keys=["name"], chunk_size=2,
+                                       db_session=db_session) == 3
+
+    query = select(Role).where(Role.name.like("upsert_%")).execution_options(populate_existing=True)
+    roles = await crud.role.list(query=query, db_session=db_session)
+    assert {r.name: r.description for r in roles} == {"upsert_a": "new", "upsert_b": "new", "upsert_c": "new"}
+    assert existing.id in {r.id for r in roles}
+
+    item_ids = [r.id for r in roles]
+    assert await crud.role.update_many(update_schema={"description": "batch"}, item_ids=item_ids, chunk_size=2,
+                                       db_session=db_session) == 3
+    assert await crud.role.update_many(update_schema={"is_active": 0}, where=Role.name == "upsert_b",
+                                       db_session=db_session) == 1
+    with pytest.raises(ValueError):
+        await crud.role.update_many(update_schema={"is_active": 0}, db_session=db_session)
+
+
+async def test_update_direct(db_session):
+    created = await crud.user.add(create_schema={"user_name": "direct", "password": "secret"}, db_session=db_session)
+    loaded = await crud.user.get_by_id(item_id=created.id, db_session=db_session)
+
+    updated = await crud.user.update_by_id(item_id=str(created.id), update_schema={"nick_name": "nick"},
+                                           direct=True, db_session=db_session)
+    assert updated.id == created.id and updated.nick_name == "nick"
+    assert loaded.nick_name == "nick"
+
+    inactive = await crud.user.inactive(item_id=created.id, update_by=2, direct=True, db_session=db_session)
+    assert inactive.id == created.id and loaded.is_active == 0 and loaded.update_by == 2
+    assert await crud.user.inactive(item_id=-1, direct=True, db_session=db_session) is None
+
+
+async def test_stream(db_session):
+    await crud.file.add_bulk(create_schemas=[{"file_key": f"key_{i}", "file_url": f"/static/{i}"} for i in range(25)],
+                             db_session=db_session)
+    files = [item async for item in crud.file.stream(batch_size=10, db_session=db_session)]
+    assert [f.file_key for f in files] == [f"key_{i}" for i in range(25)]
+
+    query = select(FileInfo.id, FileInfo.file_key).order_by(FileInfo.id)
+    rows = crud.file.stream(query=query, batch_size=10, mappings=True, db_session=db_session)
+    chunks = [chunk async for chunk in export_rows(rows, ["file_key"], ExportFormatEnum.ndjson, batch_size=10)]
+    assert len(chunks) == 3
+    assert b"".join(chunks).splitlines()[0] == b'{"file_key":"key_0"}'
+
+
+async def test_total_strategies(db_session):
+    await crud.role.add_bulk(create_schemas=[{"name": f"total_{i}"} for i in range(5)], db_session=db_session)
+    crud.role._totals.clear()
+    params = Params(page=2, size=2)
+    for strategy in TotalStrategyEnum:
+        page = await crud.role.list_paginated(params=params, total_strategy=strategy, db_session=db_session)
+        assert len(page.items) == 2
+        assert page.total == (None if strategy == TotalStrategyEnum.none else 5)
+        if strategy != TotalStrategyEnum.count:
+            assert page.has_next is True
+
+    page = await crud.role.list_paginated(params=Params(page=3, size=2), total_strategy=TotalStrategyEnum.none,
+                                          db_session=db_session)
+    assert len(page.items) == 1 and page.has_next is False
+    page = await crud.role.list_paginated(params=Params(page=9, size=2), total_strategy=TotalStrategyEnum.window,
+                                          db_session=db_session)
+    assert page.items == [] and page.total == 5
+
+    # the cached total is dropped by the writes through the crud
+    await crud.role.add(create_schema={"name": "total_5"}, db_session=db_session)
+    page = await crud.role.list_paginated(params=params, total_strategy=TotalStrategyEnum.cached,
+                                          db_session=db_session)
+    assert page.total == 6
+
+    sql = "SELECT * FROM role WHERE name LIKE :name ORDER BY name"
+    for strategy in TotalStrategyEnum:
+        page = await crud.role.execute(sql=sql, params={"page": 3, "size": 2, "name": "total_%"},
+                                       total_strategy=strategy, db_session=db_session)
+        assert [row["name"] for row in page.items] == ["total_4", "total_5"]
+        assert page.has_next is False
+        assert page.total == (None if strategy == TotalStrategyEnum.none else 6)
+
+
+async def test_cached_total_in_filter(db_session):
+    ids = await crud.role.add_bulk(create_schemas=[{"name": f"in_{i}"} for i in range(4)], return_ids=True,
+                                   db_session=db_session)
+    for item_ids, total in ((ids[:3], 3), (ids[:2], 2), (ids[:3], 3)):
+        page = await crud.role.list_paginated(query=select(Role).where(Role.id.in_(item_ids)), params=Params(size=2),
+                                              total_strategy=TotalStrategyEnum.cached, db_session=db_session)
+        assert page.total == total and len(page.items) == 2
+
+
+async def test_cached_total_invalidated_by_tables(db_session):
+    users = await crud.user.add_all(create_schemas=[{"user_name": f"joined_{i}", "password": "x"} for i in range(3)],
+                                    db_session=db_session)
+    query = select(User).join(UserRole, UserRole.user_id == User.id)
+
+    async def total():
+        page = await crud.user.list_paginated(query=query, params=Params(size=1),
+                                              total_strategy=TotalStrategyEnum.cached, db_session=db_session)
+        return page.total
+
+    assert await total() == 0
+    # a write through another crud to a joined table
+    await crud.user_role.add(create_schema={"user_id": users[0].id, "role_id": 1}, db_session=db_session)
+    assert await total() == 1
+    # a write outside the cruds is not seen, until a worker drops the version of the table
+    await db_session.execute(UserRole.__table__.insert(), {"user_id": users[1].id, "role_id": 1})
+    await db_session.commit()
+    assert await total() == 1
+    await invalidate_tables(["UserRole"])
+    assert await total() == 2
+
+
+async def test_execute_statement_cache(db_session):
+    await crud.user.add_bulk(create_schemas=[{"user_name": f"cached_{i}", "password": "secret"} for i in range(3)],
+                             db_session=db_session)
+    first = await crud.user.get_user_list(name="cached", page=1, page_size=2, db_session=db_session)
+    hits = _raw_statement.cache_info().hits
+    second = await crud.user.get_user_list(name="cached", page=2, page_size=2, db_session=db_session)
+    # the statement, its count and its page are all reused, whatever the page
+    assert _raw_statement.cache_info().hits == hits + 3
+    assert len(first.items) == 2 and len(second.items) == 1
+    assert first.total == second.total == 3
+
+
+async def test_execute_row_formats(db_session):
+    await crud.user.add_bulk(create_schemas=[{"user_name": f"mapped_{i}", "password": "secret"} for i in range(3)],
+                             db_session=db_session)
+    sql = "SELECT * FROM user WHERE user_name LIKE :name ORDER BY user_name"
+    params = {"name": "mapped_%"}
+    validated = await crud.user.execute(sql=sql, params=params, schema=UserDetailResponse, db_session=db_session)
+    trusted = await crud.user.execute(sql=sql, params=params, schema=UserDetailResponse,
+                                      row_format=RowFormatEnum.trusted, db_session=db_session)
+    assert trusted == validated
+    assert [user.dict() for user in trusted] == [user.dict() for user in validated]
+    assert isinstance(trusted[0].id, str) and trusted[0].role == []
+
+    dicts = await crud.user.execute(sql=sql, params=params, schema=UserDetailResponse, row_format=RowFormatEnum.dict,
+                                    db_session=db_session)
+    assert dicts == [user.dict() for user in validated]
+    tuples = await crud.user.execute(sql=sql, params=params, schema=UserDetailResponse,
+                                     row_format=RowFormatEnum.tuple, db_session=db_session)
+    assert tuples == [tuple(user.dict().values()) for user in validated]
+
+    page = await crud.user.execute(sql="SELECT id, user_name FROM user WHERE user_name LIKE :name ORDER BY user_name",
+                                   params={**params, "page": 1, "size": 2}, row_format=RowFormatEnum.tuple,
+                                   total_strategy=TotalStrategyEnum.window, db_session=db_session)
+    assert [row[1] for row in page.items] == ["mapped_0", "mapped_1"] and len(page.items[0]) == 2
+
+
+async def test_batch_loader(db_session):
+    ids = await crud.role.add_bulk(create_schemas=[{"name": f"loaded_{i}"} for i in range(3)], return_ids=True,
+                                   db_session=db_session)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", listener)
+
+    # one IN query for the ids asked in the same tick, the missing id included
+    first, second, missing = await asyncio.gather(crud.role.get_by_id(item_id=ids[0], db_session=db_session),
+                                                  crud.role.get_by_id(item_id=str(ids[1]), db_session=db_session),
+                                                  crud.role.get_by_id(item_id=-1, db_session=db_session))
+    assert (first.name, second.name, missing) == ("loaded_0", "loaded_1", None)
+    assert len(statements) == 1
+    # memoized, only the unseen id is fetched
+    roles = await crud.role.get_by_ids(list_ids=[ids[2], ids[1], -1], db_session=db_session)
+    assert [role.name for role in roles] == ["loaded_2", "loaded_1"]
+    assert await crud.role.get_by_id(item_id=ids[0], db_session=db_session) is first
+    assert len(statements) == 2
+
+    # the writes through the crud drop the memoized rows
+    await crud.role.update_many(update_schema={"description": "updated"}, item_ids=ids, db_session=db_session)
+    statements.clear()
+    assert (await crud.role.get_by_id(item_id=ids[0], db_session=db_session)).description == "updated"
+    assert len(statements) == 1
+    event.remove(db_session.bind.sync_engine, "before_cursor_execute", listener)
+
+
+async def test_transaction(db_session):
+    commits = []
+    listener = lambda session: commits.append(session)  # noqa: E731
+    event.listen(db_session.sync_session, "after_commit", listener)
+
+    async with db.transaction():
+        role_id = (await crud.role.add(create_schema={"name": "unit_of_work"}, db_session=db_session)).id
+        await crud.role.add_all(create_schemas=[{"name": "unit_of_work_1"}], db_session=db_session)
+        async with db.transaction():
+            await crud.role.update_by_id(item_id=role_id, update_schema={"description": "nested"},
+                                         db_session=db_session)
+        assert commits == []
+    assert len(commits) == 1
+
+    with pytest.raises(RuntimeError):
+        async with db.transaction():
+            await crud.role.update_by_id(item_id=role_id, update_schema={"description": "rolled back"},
+                                         direct=True, db_session=db_session)
+            await crud.role.add(create_schema={"name": "rolled_back"}, db_session=db_session)
+            raise RuntimeError
+    assert len(commits) == 1
+    names = await db_session.scalars(select(Role.name).order_by(Role.name))
+    assert names.all() == ["unit_of_work", "unit_of_work_1"]
+    assert (await crud.role.get_by_id(item_id=role_id, db_session=db_session)).description == "nested"
+    event.remove(db_session.sync_session, "after_commit", listener)
+
+
+async def test_user_detail_invalidated_after_commit(db_session):
+    user = await crud.user.add(create_schema={"user_name": "deactivated", "password": "x"}, db_session=db_session)
+
+    async def read_detail():
+        # a concurrent request, on a session of its own
+        async with db():
+            return await service.user.get_user_detail(user.id)
+
+    assert (await asyncio.create_task(read_detail()))["user_name"] == "deactivated"
+    async with db.transaction():
+        await service.user.inactive_user(user_id=user.id, update_by=None)
+        # the row is not committed yet, the reader caches it again under the new version of the tag
+        assert await asyncio.create_task(read_detail()) is not None
+    await asyncio.gather(*tags._invalidations)
+    assert await asyncio.create_task(read_detail()) is None
+
+
+async def test_query_with_role_names(db_session):
+    user = await crud.user.add(create_schema={"user_name": "with_roles", "password": "x"}, db_session=db_session)
+    alone = await crud.user.add(create_schema={"user_name": "without_roles", "password": "x"}, db_session=db_session)
+    admin, guest = await crud.role.add_all(create_schemas=[{"name": "ADMIN"}, {"name": "GUEST"}],
+                                           db_session=db_session)
+    user_roles = await crud.user_role.add_user_role(user_id=user.id, roles=[admin.id, guest.id],
+                                                    db_session=db_session)
+    await crud.user_role.inactive(item_id=user_roles[1].id, db_session=db_session)
+
+    found, role_names = await crud.user.query_with_role_names(user_id=user.id, db_session=db_session)
+    assert found.id == user.id and role_names == ["ADMIN"]
+    assert (await crud.user.query_with_role_names(username="without_roles", db_session=db_session))[1] == []
+    assert (await crud.user.query_with_role_names(user_id=alone.id, db_session=db_session))[0].id == alone.id
+    assert await crud.user.query_with_role_names(user_id=-1, db_session=db_session) is None
+    # an inactive role is not granted, even through an active user role
+    await crud.role.inactive(item_id=admin.id, db_session=db_session)
+    assert (await crud.user.query_with_role_names(user_id=user.id, db_session=db_session))[1] == []
+
+
+async def test_entity_cache(db_session, cache_backend):
+    ids = await crud.role.add_bulk(create_schemas=[{"name": f"cached_{i}"} for i in range(3)], return_ids=True,
+                                   db_session=db_session)
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, *args: statements.append(parameters)  # noqa: E731
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", listener)
+
+    assert [role.name for role in await crud.role.get_by_ids(list_ids=ids[:2], db_session=db_session)] == [
+        "cached_0", "cached_1"]
+    db_session.expunge_all()
+    # the hits from the cache, only the missing ids from the database
+    roles = await crud.role.get_by_ids(list_ids=[ids[2], ids[0], -1, str(ids[1])], db_session=db_session)
+    assert [role.name for role in roles] == ["cached_2", "cached_0", "cached_1"]
+    assert statements == [tuple(ids[:2]), (ids[2], -1)]
+    db_session.expunge_all()
+    assert (await crud.role.get_by_id(item_id=ids[2], db_session=db_session)).name == "cached_2"
+    assert len(statements) == 2
+
+    # the writes drop the cached rows, the rows written in a unit of work are not cached before the commit
+    await crud.role.update_by_id(item_id=ids[0], update_schema={"description": "updated"}, db_session=db_session)
+    async with db.transaction():
+        await crud.role.update_by_id(item_id=ids[1], update_schema={"description": "pending"},
+                                     db_session=db_session)
+        db_session.expunge_all()
+        assert (await crud.role.get_by_id(item_id=ids[1], db_session=db_session)).description == "pending"
+        assert f"entity:Role:{ids[1]}" not in cache_backend._store
+    await crud.role.delete(item_id=ids[2], db_session=db_session)
+    db_session.expunge_all()
+    statements.clear()
+    roles = await crud.role.get_by_ids(list_ids=ids, db_session=db_session)
+    assert [role.description for role in roles] == ["updated", "pending"]
+    assert len(statements) == 1
+    event.remove(db_session.bind.sync_engine, "before_cursor_execute", listener)
+
+
+async def test_query_cache(db_session):
+    await crud.role.add_bulk(create_schemas=[{"name": f"listed_{i}"} for i in range(3)], db_session=db_session)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", listener)
+    sql = "SELECT role.name, user_role.user_id FROM role LEFT JOIN UserRole user_role ON user_role.role_id = role.id"
+
+    async def read():
+        page = await crud.role.list_paginated_ordered(params=Params(page=1, size=2), db_session=db_session)
+        rows = await crud.role.execute(sql=sql, row_format=RowFormatEnum.tuple, db_session=db_session)
+        return page.total, [role.name for role in page.items], sorted(rows)
+
+    first = await read()
+    assert first[:2] == (3, ["listed_2", "listed_1"]) and len(statements) == 3
+    db_session.expunge_all()
+    statements.clear()
+    assert await read() == first
+    assert statements == []
+    # the hits are merged into the session, not shared with the cache
+    page = await crud.role.list_paginated_ordered(params=Params(page=1, size=2), db_session=db_session)
+    assert page.items[0] in db_session
+
+    # a write to a table read by a query drops it, through any crud
+    await crud.role.add(create_schema={"name": "listed_3"}, db_session=db_session)
+    statements.clear()
+    assert (await read())[:2] == (4, ["listed_3", "listed_2"]) and len(statements) == 3
+    await crud.user_role.add(create_schema={"user_id": 1, "role_id": page.items[0].id}, db_session=db_session)
+    statements.clear()
+    assert (await read())[2] != first[2] and len(statements) == 1
+    # nor with pending changes, the hits would overwrite them
+    await read()
+    role = (await crud.role.list_paginated_ordered(params=Params(page=1, size=2), db_session=db_session)).items[0]
+    role.description = "pending"
+    statements.clear()
+    page = await crud.role.list_paginated_ordered(params=Params(page=1, size=2), db_session=db_session)
+    assert page.items[0] is role and role.description == "pending" and len(statements) == 3
+    await db_session.rollback()
+    # not while the unit of work is uncommitted, the session reads its own writes
+    async with db.transaction():
+        await crud.role.add(create_schema={"name": "listed_4"}, db_session=db_session)
+        statements.clear()
+        await read()
+        await read()
+        assert len(statements) == 6
+    event.remove(db_session.bind.sync_engine, "before_cursor_execute", listener)
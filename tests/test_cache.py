@@ -0,0 +1,233 @@
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager
+
+import pytest
+
+from fastapi_template.app.core.cache import (MASTER_PID_ENV, InvalidationBus, MemoryBackend, cached,
+                                             default_directory, hashed_key_builder, invalidate_tags, key_builder)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_memory_backend_lru():
+    backend = MemoryBackend(max_entries=2, cleanup_seconds=0)
+    await backend.set("a", "1")
+    await backend.set("b", "2")
+    assert await backend.get("a") == "1"
+    # b is the least recently used
+    await backend.set("c", "3")
+    assert await backend.get("b") is None
+    assert await backend.get("a") == "1" and await backend.get("c") == "3"
+    assert backend.stats()["evictions"] == 1
+    assert backend.stats()["hits"] == 3 and backend.stats()["misses"] == 1
+
+
+async def test_memory_backend_max_bytes():
+    backend = MemoryBackend(max_bytes=10, cleanup_seconds=0)
+    await backend.set("a", "1234")
+    await backend.set("b", "1234")
+    assert backend.stats()["bytes"] == 10
+    await backend.set("c", "1")
+    assert await backend.get("a") is None
+    assert backend.stats()["bytes"] == 7
+    # larger than the whole cache
+    await backend.set("d", "12345678901")
+    assert await backend.get("d") is None
+    await backend.set("b", "1")
+    assert backend.stats()["bytes"] == 4
+
+
+async def test_memory_backend_expiry():
+    backend = MemoryBackend(cleanup_seconds=0.01)
+    await backend.set("short", "1", expire=0.02)
+    await backend.set("long", "2", expire=60)
+    await backend.set("forever", "3")
+    ttl, value = await backend.get_with_ttl("long")
+    assert value == "2" and 0 < ttl <= 60
+    await asyncio.sleep(0.05)
+    # swept without being read
+    assert backend.stats()["entries"] == 2 and backend.stats()["expirations"] == 1
+    assert await backend.get("short") is None
+    assert await backend.get("forever") == "3"
+    await backend.close()
+
+
+async def test_memory_backend_clear():
+    backend = MemoryBackend(cleanup_seconds=0)
+    for key in ("user:app:1", "user:app:2", "role:app:1"):
+        await backend.set(key, "x")
+    assert await backend.clear(namespace="user") == 2
+    assert await backend.clear(key="role:app:1") == 1
+    assert await backend.clear(key="missing") == 0
+    assert backend.stats()["entries"] == 0 and backend.stats()["bytes"] == 0
+
+
+async def test_bus_directory(monkeypatch):
+    # the workers of one master share a directory, whatever their parent process
+    monkeypatch.setenv(MASTER_PID_ENV, "42")
+    monkeypatch.setattr(os, "getppid", lambda: 1)
+    assert default_directory() == default_directory(42)
+    # without a master, the process is alone on its bus
+    monkeypatch.delenv(MASTER_PID_ENV)
+    assert default_directory() == default_directory(os.getpid()) != default_directory(1)
+
+
+async def test_invalidation_bus(tmp_path, monkeypatch):
+    first = MemoryBackend(cleanup_seconds=0, bus=InvalidationBus(str(tmp_path)))
+    # the sockets are named after the pid, the second worker is faked in the same process
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    second = MemoryBackend(cleanup_seconds=0, bus=InvalidationBus(str(tmp_path)))
+    for backend in (first, second):
+        await backend.set("user:app:1", "x")
+        await backend.set("user:app:2", "x")
+
+    assert await first.clear(key="user:app:1") == 1
+    await asyncio.sleep(0.01)
+    assert await second.get("user:app:1") is None and await second.get("user:app:2") == "x"
+    assert first.bus.stats()["published"] == 1 and second.bus.stats()["received"] == 1
+
+    await second.close()
+    # the socket of a dead worker is removed by the next sender
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(str(tmp_path / "-2.sock"))
+    dead.close()
+    await first.clear(namespace="user")
+    assert os.listdir(tmp_path) == [os.path.basename(first.bus.path)]
+    await first.close()
+    assert os.listdir(tmp_path) == []
+
+
+async def create_redis_backends(count):
+    fakeredis = pytest.importorskip("fakeredis")
+    from fastapi_template.app.core.cache.redis_backend import RedisNearCacheBackend
+
+    server = fakeredis.FakeServer()
+    backends = [RedisNearCacheBackend(fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                                      MemoryBackend(cleanup_seconds=0), near_ttl=5, retry_seconds=60)
+                for _ in range(count)]
+    # the listeners subscribe
+    await asyncio.sleep(0.05)
+    return server, backends
+
+
+async def test_redis_near_cache():
+    server, (first, second) = await create_redis_backends(2)
+    await first.set("user:app:1", "one", expire=600)
+    await first.set("user:app:2", "two", expire=600)
+    # redis is shared, the near cache of the second worker fills from it
+    assert await second.get_many(["user:app:1", "user:app:2", "user:app:3"]) == ["one", "two", None]
+    ttl, value = await second.near.get_with_ttl("user:app:1")
+    assert value == "one" and ttl <= 5
+    assert second.stats()["hits"] == 2 and second.stats()["misses"] == 1
+
+    assert await first.clear(namespace="user:app:1") == 1
+    await asyncio.sleep(0.05)
+    assert await second.near.get("user:app:1") is None
+    assert await second.get("user:app:1") is None and await second.get("user:app:2") == "two"
+    for backend in (first, second):
+        await backend.close()
+
+
+async def test_redis_unavailable():
+    server, (backend,) = await create_redis_backends(1)
+    await backend.set("user:app:1", "one", expire=600)
+    server.connected = False
+    # served by the near cache, the misses are misses instead of errors
+    assert await backend.get("user:app:1") == "one"
+    assert await backend.get("user:app:2") is None
+    await backend.set("user:app:3", "three", expire=600)
+    assert await backend.get("user:app:3") == "three"
+    assert backend.stats()["redis_available"] is False and backend.stats()["errors"] >= 1
+    await backend.close()
+
+
+async def test_cached_single_flight(cache_backend):
+    calls = []
+
+    @cached(namespace="single_flight")
+    async def load(item_id):
+        calls.append(item_id)
+        await asyncio.sleep(0.02)
+        if item_id < 0:
+            raise ValueError(item_id)
+        return {"id": item_id}
+
+    results = await asyncio.gather(*[load(1) for _ in range(10)], load(2))
+    assert results == [{"id": 1}] * 10 + [{"id": 2}]
+    assert calls == [1, 2]
+    assert await load(1) == {"id": 1} and calls == [1, 2]
+
+    failures = await asyncio.gather(*[load(-1) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(failure, ValueError) for failure in failures)
+    assert calls == [1, 2, -1]
+
+
+async def test_cached_stale_while_revalidate(cache_backend):
+    calls = []
+    scopes = []
+
+    @asynccontextmanager
+    async def scope():
+        scopes.append(True)
+        yield
+
+    @cached(namespace="stale", expire=0.05, stale_seconds=60, refresh_scope=scope)
+    async def load():
+        calls.append(True)
+        return len(calls)
+
+    assert await load() == 1
+    await asyncio.sleep(0.06)
+    # expired: the old value at once, refreshed once in the background
+    assert await asyncio.gather(load(), load()) == [1, 1]
+    await asyncio.sleep(0.01)
+    assert await load() == 2
+    assert len(calls) == 2 and scopes == [True]
+
+
+async def test_hashed_keys(cache_backend):
+    async def load(user_id, page=1, *, filters=None):
+        pass
+
+    async def other(user_id, page=1, *, filters=None):
+        pass
+
+    def key(func, *args, builder=hashed_key_builder, **kwargs):
+        return builder(func, "ns", args=args, kwargs=kwargs)
+
+    # the same arguments however they are passed, the ids as strings or not
+    assert key(load, 1) == key(load, user_id="1", page=1) == key(load, 1, filters=None)
+    assert key(load, 1, filters={"a": 1, "b": {2, 1}}) == key(load, 1, filters={"b": [1, 2], "a": "1"})
+    assert len({key(load, 1), key(load, 2), key(load, 1, 2), key(other, 1)}) == 4
+    assert key(load, 1).startswith("test:ns:") and len(key(load, 1, filters={"a": "x" * 1000})) < 100
+    # only the named parameters tell the results apart
+    assert key(load, 1, 2, builder=key_builder("user_id")) == key(load, 1, 3, builder=key_builder("user_id"))
+    with pytest.raises(TypeError):
+        key(load, object())
+
+
+async def test_cached_tags(cache_backend):
+    calls = []
+
+    @cached(namespace="tagged", tags=["user:{user_id}", "role:*"])
+    async def detail(user_id):
+        calls.append(("detail", user_id))
+        return len(calls)
+
+    @cached(namespace="tagged", tags=["user:{user_id}"])
+    async def settings(user_id, name="theme"):
+        calls.append(("settings", user_id))
+        return len(calls)
+
+    for _ in range(2):
+        await detail(1), await detail(2), await settings(1)
+    assert len(calls) == 3
+    # one call drops the entries of the tag, of every function
+    await invalidate_tags(["user:1"])
+    await detail(1), await detail(2), await settings("1")
+    assert calls[3:] == [("detail", 1), ("settings", "1")]
+    await invalidate_tags(["role:*"])
+    await detail(1), await detail(2), await settings(1)
+    assert calls[5:] == [("detail", 1), ("detail", 2)]
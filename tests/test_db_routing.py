@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fastapi_template.app import crud
+from fastapi_template.app.core.db import session as session_module
+from fastapi_template.app.core.db.routing import LEAST_BUSY, pin_primary
+from fastapi_template.app.core.db.session import create_session_factory
+from fastapi_template.app.core.db.sqlite import create_sqlite_engines
+from fastapi_template.app.core.db.warmup import warm_up
+from fastapi_template.app.model.base_model import Base
+from fastapi_template.app.model.role_model import Role
+from fastapi_template.app.schema.base_schema import RowFormatEnum
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def databases(tmp_path):
+    """A primary and two replicas, sqlite files holding one role named after the database."""
+    engines = {}
+    for name in ("primary", "replica_0", "replica_1"):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(Role.__table__.insert(), {"id": 1, "name": name})
+        engines[name] = engine
+    yield engines
+    for engine in engines.values():
+        await engine.dispose()
+
+
+async def read_name(session) -> str:
+    role = await crud.role.get(query=select(Role).where(Role.id == 1).execution_options(populate_existing=True),
+                               db_session=session)
+    return role.name
+
+
+async def test_round_robin(databases):
+    session_factory = create_session_factory(databases["primary"], [databases["replica_0"], databases["replica_1"]])
+    async with session_factory() as session:
+        assert [await read_name(session) for _ in range(4)] == ["replica_0", "replica_1", "replica_0", "replica_1"]
+
+        # the write goes to the primary, and so do the next reads
+        role = await crud.role.add(create_schema={"name": "written"}, db_session=session)
+        assert await read_name(session) == "primary"
+        assert (await crud.role.list(query=select(Role).where(Role.id == role.id), db_session=session))[0].id == role.id
+
+    async with session_factory() as session:
+        pin_primary(session)
+        assert await read_name(session) == "primary"
+
+
+async def test_least_busy(databases):
+    session_factory = create_session_factory(databases["primary"], [databases["replica_0"], databases["replica_1"]],
+                                             replica_strategy=LEAST_BUSY)
+    async with session_factory() as busy, session_factory() as idle:
+        # the transaction of the busy session keeps its replica connection
+        assert await read_name(busy) == "replica_0"
+        async with session_factory() as other:
+            assert await read_name(other) == "replica_1"
+        # round-robin would pick replica_0 now
+        assert await read_name(idle) == "replica_1"
+
+
+async def test_without_replicas(databases):
+    session_factory = create_session_factory(databases["primary"])
+    async with session_factory() as session:
+        assert await read_name(session) == "primary"
+
+
+async def test_sqlite_profile(tmp_path):
+    writer, reader = create_sqlite_engines(f"sqlite+aiosqlite:///{tmp_path / 'profile.db'}",
+                                           pragmas={"journal_mode": "WAL", "busy_timeout": 1000})
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        assert await conn.scalar(text("PRAGMA journal_mode")) == "wal"
+        assert await conn.scalar(text("PRAGMA busy_timeout")) == 1000
+    async with reader.connect() as conn:
+        assert await conn.scalar(text("PRAGMA query_only")) == 1
+        with pytest.raises(OperationalError):
+            await conn.execute(Role.__table__.insert(), {"id": 1, "name": "read only"})
+
+    # the concurrent writers queue for the single writer connection
+    session_factory = create_session_factory(writer, [reader])
+
+    async def write(i: int):
+        async with session_factory() as session:
+            await crud.role.add(create_schema={"name": f"writer_{i}"}, db_session=session)
+
+    await asyncio.gather(*(write(i) for i in range(20)))
+    async with session_factory() as session:
+        assert len(await crud.role.list(db_session=session)) == 20
+        # the raw writes go to the writer, the raw reads to the query only reader
+        await crud.role.execute("UPDATE role SET description = :description", params={"description": "raw"},
+                                db_session=session)
+        await session.commit()
+    async with session_factory() as session:
+        rows = await crud.role.execute("  select description from role", row_format=RowFormatEnum.tuple,
+                                       db_session=session)
+        assert set(rows) == {("raw",)}
+    assert writer.pool.size() == 1
+    await writer.dispose()
+    await reader.dispose()
+
+
+async def test_sqlite_writer_released(tmp_path):
+    writer, reader = create_sqlite_engines(f"sqlite+aiosqlite:///{tmp_path / 'released.db'}",
+                                           pragmas={"journal_mode": "WAL"}, pool_timeout=1)
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = create_session_factory(writer, [reader], replica_lag=False)
+    async with session_factory() as first, session_factory() as second:
+        role = await crud.role.add(create_schema={"name": "first"}, db_session=first)
+        # the open session gave the writer connection back with the commit, its next reads see it on the reader
+        assert writer.pool.checkedout() == 0
+        assert (await crud.role.get_by_id(item_id=role.id, db_session=first)).name == "first"
+        assert writer.pool.checkedout() == 0
+        await crud.role.add(create_schema={"name": "second"}, db_session=second)
+        await crud.role.update_by_id(item_id=role.id, update_schema={"description": "updated"}, db_session=second)
+        assert writer.pool.checkedout() == 0
+    await writer.dispose()
+    await reader.dispose()
+
+
+async def test_warm_up(tmp_path, monkeypatch):
+    writer, reader = create_sqlite_engines(f"sqlite+aiosqlite:///{tmp_path / 'warm.db'}", read_pool_size=3)
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    monkeypatch.setattr(session_module, "_Session", create_session_factory(writer, [reader]))
+    statements = crud.user.warm_up_statements() + crud.user_role.warm_up_statements()
+    assert len(reader.sync_engine._compiled_cache) == 0
+
+    await warm_up(5, statements)
+    assert reader.sync_engine.pool.checkedin() == 3
+    assert writer.sync_engine.pool.checkedin() == 1
+    assert len(reader.sync_engine._compiled_cache) == len(writer.sync_engine._compiled_cache) == len(statements)
+
+    # the requests reuse the compiled statements
+    async with session_module._Session() as session:
+        await crud.user.query_by_username(username="nobody", db_session=session)
+        await crud.user_role.query_by_user_id(user_id=1, db_session=session)
+        await crud.user.get_by_ids(list_ids=[1, 2, 3], db_session=session)
+    assert len(reader.sync_engine._compiled_cache) == len(statements)
+    await writer.dispose()
+    await reader.dispose()
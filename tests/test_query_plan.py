@@ -0,0 +1,111 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+
+from fastapi_template.app import crud, service
+from fastapi_template.app.model.base_model import Base
+from fastapi_template.app.model.role_model import Role
+from fastapi_template.app.schema.file_schema import FileSearchRequest
+from fastapi_template.app.schema.role_schema import RoleSearchRequest
+from fastapi_template.app.schema.user_schema import UserSearchRequest
+from fastapi_template.config import settings
+
+# "SCAN User" on sqlite >= 3.36, "SCAN TABLE User" before, with or without the index it scans
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?")
+_WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+
+
+def _partial_indexes():
+    # the entries of a partial index are the rows its filter keeps, scanning it does not read the table
+    return {index.name for table in Base.metadata.tables.values() for index in table.indexes
+            if index.dialect_options["sqlite"]["where"] is not None}
+
+
+def _scans_table(detail, tables, partial_indexes):
+    scan = _SCAN.match(detail)
+    return scan is not None and scan.group(1) in tables and scan.group(2) not in partial_indexes
+
+
+@contextmanager
+def capture_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def table_scans(path, statements):
+    """The filtered statements whose query plan scans a table instead of searching it."""
+    tables = set(Base.metadata.tables)
+    partial_indexes = _partial_indexes()
+    scans = []
+    with sqlite3.connect(path) as conn:
+        for statement, parameters in statements:
+            if not _WHERE.search(statement) or statement.lstrip().upper().startswith("INSERT"):
+                continue
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            details = [detail for *_, detail in plan if _scans_table(detail, tables, partial_indexes)]
+            if details:
+                scans.append((statement, details))
+    return scans
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("batch_loader", [False, True])
+async def test_statements_use_indexes(db_session, tmp_path, monkeypatch, batch_loader):
+    monkeypatch.setattr(settings, "DATABASE_BATCH_LOADER", batch_loader)
+    admin = await crud.user.add(create_schema={"user_name": "admin", "password": "x"}, db_session=db_session)
+    guest = await crud.user.add(create_schema={"user_name": "guest", "password": "x"}, db_session=db_session)
+    role = await crud.role.add(create_schema={"name": "ADMIN"}, db_session=db_session)
+    await crud.file.add(create_schema={"file_key": "key", "file_url": "/file/key"}, db_session=db_session)
+
+    with capture_statements() as statements:
+        # the startup warm-up set, the hot statements of every crud
+        for crud_object in (crud.user, crud.role, crud.user_role, crud.file):
+            for statement in crud_object.warm_up_statements():
+                await db_session.execute(statement)
+        await crud.user.query_by_username(username="admin", db_session=db_session)
+        await crud.user.query_with_role_names(user_id=admin.id, db_session=db_session)
+        await crud.user.get_by_ids(list_ids=[admin.id, guest.id], db_session=db_session)
+        await crud.role.list(query=select(Role).where(Role.name.in_(["ADMIN"])), db_session=db_session)
+        await crud.user_role.add_user_role(user_id=admin.id, roles=[role.id], db_session=db_session)
+        await crud.user_role.add_user_role(user_id=admin.id, roles=[role.id], db_session=db_session)
+        await crud.user.update_by_id(item_id=guest.id, update_schema={"nick_name": "guest"},
+                                     db_session=db_session)
+        # the listings of the services, offset and keyset pages
+        for name in ("", "adm"):
+            await service.user.get_users(UserSearchRequest(name=name))
+            page = await service.user.get_users(UserSearchRequest(name=name, cursor="", size=1))
+            await service.user.get_users(UserSearchRequest(name=name, cursor=page.next_cursor or "", size=1))
+            await service.role.list_roles(RoleSearchRequest(name=name))
+            await service.role.list_roles(RoleSearchRequest(name=name, cursor="", size=1))
+        await service.file.list_files(FileSearchRequest())
+        page = await service.file.list_files(FileSearchRequest(cursor="", size=1))
+        await service.file.list_files(FileSearchRequest(cursor=page.next_cursor or "", size=1))
+        await crud.user.inactive(item_id=guest.id, db_session=db_session)
+
+    assert statements
+    assert table_scans(tmp_path / "crud.db", statements) == []
+
+
+def test_table_scan_detected(tmp_path):
+    # a filter on a column without an index reads the whole table, the check has to see it,
+    # also when the scan walks an index for the order
+    with sqlite3.connect(tmp_path / "scan.db") as conn:
+        conn.execute("CREATE TABLE Role (id INTEGER PRIMARY KEY, name TEXT, description TEXT)")
+        conn.execute("CREATE INDEX ix_role_name ON Role (name)")
+    path = tmp_path / "scan.db"
+    assert table_scans(path, [("SELECT * FROM Role WHERE description = ?", ("x",))])
+    assert table_scans(path, [("SELECT * FROM Role WHERE description = ? ORDER BY name", ("x",))])
+    assert not table_scans(path, [("SELECT * FROM Role WHERE name = ?", ("x",))])